@@ -0,0 +1,55 @@
+"""
+Benchmark URL checks: successive calls to check_url() vs. check_urls().
+
+Usage: python benchmarks/check_urls.py [number of URLs]
+"""
+
+import os
+import random
+import sys
+from timeit import timeit
+
+from courlan import check_url, check_urls
+
+INPUT = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "..", "tests", "data", "input.txt"
+)
+
+
+def synthetic_urls(rng: random.Random, num: int, hosts: int = 500) -> list[str]:
+    "Generate URLs spread over a limited number of hosts."
+    names = [
+        f"{rng.choice(['', 'www.', 'blog.'])}site{i}.{rng.choice(['org', 'com', 'co.uk', 'de'])}"
+        for i in range(hosts)
+    ]
+    return [
+        f"https://{rng.choice(names)}/{rng.choice(['news', 'blog', 'tag', 'de'])}/"
+        f"article-{rng.randint(0, 10**6)}.html{rng.choice(['', '?page=2', '#top'])}"
+        for _ in range(num)
+    ]
+
+
+def compare(name: str, urls: list[str], number: int, **options: bool) -> None:
+    "Time both approaches on the URLs and check they agree."
+    assert [check_url(u, **options) for u in urls] == list(check_urls(urls, **options))
+    loop = timeit(lambda: [check_url(u, **options) for u in urls], number=number)
+    batch = timeit(lambda: list(check_urls(urls, **options)), number=number)
+    print(
+        f"{name}, {len(urls)} URLs x{number}: check_url {loop:.3f}s, "
+        f"check_urls {batch:.3f}s, speedup {loop / batch:.2f}x"
+    )
+
+
+def main() -> None:
+    "Run the comparison on the test data and on a synthetic corpus."
+    num = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    with open(INPUT, encoding="utf-8") as inputfh:
+        testdata = [line.strip() for line in inputfh if line.strip()]
+    compare("test data", testdata, 2000)
+    urls = synthetic_urls(random.Random(42), num)
+    compare("synthetic", urls, 1)
+    compare("synthetic, strict", urls, 1, strict=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""
+Benchmark the shared store of results computed per host: uncached vs. cached
+domain_filter(), decode_punycode(), get_tldinfo() and is_external() on URLs
+whose hosts follow a Zipf distribution, as in crawl data.
+
+Usage: python benchmarks/hosts.py [number of URLs] [number of hosts]
+"""
+
+import random
+import sys
+from collections.abc import Callable
+from timeit import repeat
+
+from courlan.cache import HOST_CACHE
+from courlan.clean import _decode_punycode, decode_punycode
+from courlan.filters import _domain_filter, domain_filter
+from courlan.meta import clear_caches
+from courlan.urlutils import _get_tldinfo, get_tldinfo, is_external
+
+
+def zipf_urls(rng: random.Random, num: int, hosts: int) -> list[str]:
+    "Generate URLs whose hosts are drawn with a Zipf distribution (s=1)."
+    names = [
+        f"{rng.choice(['', 'www.', 'blog.', 'xn--80ak6aa92e.'])}site{i}."
+        f"{rng.choice(['org', 'com', 'co.uk', 'de', 'xn--p1ai'])}"
+        for i in range(hosts)
+    ]
+    weights = [1 / rank for rank in range(1, hosts + 1)]
+    return [
+        f"https://{name}/article-{rng.randint(0, 10**6)}.html"
+        for name in rng.choices(names, weights, k=num)
+    ]
+
+
+def legacy_is_external(url: str, reference: str) -> bool:
+    "Comparison of domains without the shared store."
+    return _get_tldinfo(url, True)[0] != _get_tldinfo(reference, True)[0]
+
+
+def compare(name: str, legacy: Callable[[], list], current: Callable[[], list]) -> None:
+    "Time both versions, starting with an empty store each time."
+    assert legacy() == current()
+    before = min(repeat(legacy, number=1, repeat=3))
+    after = min(repeat(lambda: (clear_caches(), current()), number=1, repeat=3))
+    print(
+        f"{name:>16}: uncached {before:.3f}s, cached {after:.3f}s, "
+        f"speedup {before / after:.2f}x"
+    )
+
+
+def main() -> None:
+    "Run the comparison and report the hit rates."
+    num = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    hosts = int(sys.argv[2]) if len(sys.argv) > 2 else num // 20
+    urls = zipf_urls(random.Random(42), num, hosts)
+    netlocs = [url.split("/")[2] for url in urls]
+    reference = urls[0]
+    compare(
+        "domain_filter",
+        lambda: [_domain_filter(h) for h in netlocs],
+        lambda: [domain_filter(h) for h in netlocs],
+    )
+    compare(
+        "decode_punycode",
+        lambda: [_decode_punycode(h) if "xn--" in h else h for h in netlocs],
+        lambda: [decode_punycode(h) for h in netlocs],
+    )
+    for fast in (False, True):
+        compare(
+            f"get_tldinfo{' fast' if fast else ''}",
+            lambda f=fast: [_get_tldinfo(u, f) for u in urls],
+            lambda f=fast: [get_tldinfo(u, fast=f) for u in urls],
+        )
+    compare(
+        "is_external",
+        lambda: [legacy_is_external(u, reference) for u in urls],
+        lambda: [is_external(u, reference) for u in urls],
+    )
+    clear_caches()
+    for url, netloc in zip(urls, netlocs, strict=True):
+        domain_filter(netloc)
+        decode_punycode(netloc)
+        is_external(url, reference)
+    print(f"{num} URLs, {hosts} hosts, hit rates:")
+    for kind, stats in HOST_CACHE.statistics().items():
+        print(f"{kind:>16}: {stats['hit_rate']:.1%}")
+
+
+if __name__ == "__main__":
+    main()
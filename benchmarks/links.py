@@ -0,0 +1,112 @@
+"""
+Benchmark link extraction: current scanner vs. former per-tag regexes,
+on decoded and raw documents.
+
+Usage: python benchmarks/links.py [HTML files...]
+Without arguments a synthetic corpus of large pages is used.
+"""
+
+import random
+import re
+import sys
+from timeit import timeit
+
+from courlan.core import _extract_candidates
+
+FIND_LINKS_REGEX = re.compile(r"<a\s+[^<>]+?>", re.I)
+HREFLANG_REGEX = re.compile(r'hreflang=["\']?([a-z-]+)', re.I)
+LINK_REGEX = re.compile(r'href=["\']?([^ ]+?)(["\' >])', re.I)
+
+
+def legacy_candidates(pagecontent: str, language: str | None) -> set[str]:
+    "Link extraction as performed up to courlan 1.3."
+    candidates = set()
+    for link in (m[0] for m in FIND_LINKS_REGEX.finditer(pagecontent)):
+        if "rel=" in link and "nofollow" in link:
+            continue
+        if language is not None and "hreflang" in link:
+            langmatch = HREFLANG_REGEX.search(link)
+            if langmatch and (
+                (lang := langmatch[1].lower()).startswith(language)
+                or lang == "x-default"
+            ):
+                linkmatch = LINK_REGEX.search(link)
+                if linkmatch:
+                    candidates.add(linkmatch[1])
+        else:
+            linkmatch = LINK_REGEX.search(link)
+            if linkmatch:
+                candidates.add(linkmatch[1])
+    return candidates
+
+
+def synthetic_page(rng: random.Random, size: int = 2 * 10**6) -> str:
+    "Build a page resembling a news portal: navigation, articles, comments."
+    parts = ["<html><head><title>Portal</title></head><body>"]
+    length = 0
+    while length < size:
+        num = rng.randint(1, 10**6)
+        choice = rng.random()
+        if choice < 0.5:
+            part = (
+                f'<a class="teaser-link" href="/news/{num}-title.html">Title {num}</a>'
+            )
+        elif choice < 0.6:
+            part = (
+                f"<a href='https://cdn{num % 5}.example.net/{num}.jpg' target=_blank>"
+            )
+        elif choice < 0.7:
+            part = f'<a rel="nofollow noopener" href="https://ads.example.com/{num}">Ad</a>'
+        elif choice < 0.75:
+            part = (
+                f'<a hreflang="{rng.choice(["en", "de", "fr"])}" href="/{num}">lang</a>'
+            )
+        elif choice < 0.8:
+            part = f'<a name="anchor{num}" id="a{num}">'
+        else:
+            part = f'<p class="text">Lorem ipsum dolor sit amet {num} <b>consectetur</b></p>'
+        parts.append(part)
+        length += len(part)
+    parts.append("</body></html>")
+    return "\n".join(parts)
+
+
+def main() -> None:
+    "Run the benchmark on the given files or on synthetic pages."
+    if len(sys.argv) > 1:
+        corpus = []
+        for filename in sys.argv[1:]:
+            with open(filename, encoding="utf-8", errors="ignore") as inputfh:
+                corpus.append(inputfh.read())
+    else:
+        rng = random.Random(42)
+        corpus = [synthetic_page(rng) for _ in range(3)]
+
+    raw_corpus = [page.encode("utf-8") for page in corpus]
+    for language in (None, "en"):
+        for page in corpus:
+            assert legacy_candidates(page, language) == _extract_candidates(
+                page, language
+            )
+        legacy = timeit(
+            lambda lang=language: [legacy_candidates(p, lang) for p in corpus], number=5
+        )
+        scanner = timeit(
+            lambda lang=language: [_extract_candidates(p, lang) for p in corpus],
+            number=5,
+        )
+        raw = timeit(
+            lambda lang=language: [
+                _extract_candidates(p, lang, "utf-8") for p in raw_corpus
+            ],
+            number=5,
+        )
+        print(
+            f"language={language}: regex path {legacy:.3f}s, "
+            f"scanner {scanner:.3f}s, speedup {legacy / scanner:.2f}x, "
+            f"on bytes {raw:.3f}s"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""
+Benchmark URL normalization: whole normalization vs. returning URLs which are
+already normalized as they are, on raw and normalized corpora.
+
+Usage: python benchmarks/normalize.py [number of URLs]
+"""
+
+import random
+import sys
+from timeit import repeat
+
+from query import synthetic_queries
+
+from courlan.clean import _normalize_url, normalize_host, normalize_url
+from courlan.urlutils import _parse
+
+
+def legacy_normalize_url(url: str) -> str:
+    "Normalization without the shortcut."
+    parsed_url = _parse(url)
+    return _normalize_url(parsed_url, normalize_host(parsed_url))
+
+
+def synthetic_urls(rng: random.Random, num: int) -> list[str]:
+    "Generate URLs with varied hosts, paths, queries and fragments."
+    queries = synthetic_queries(rng, num, 0.2)
+    urls = []
+    for query in queries:
+        host = f"{rng.choice(['', 'www.', 'WWW.'])}site{rng.randint(0, 999)}.org"
+        path = "/".join(
+            rng.choice(["news", "2024", "article-123.html", "Blog", "a%20b", ""])
+            for _ in range(rng.randint(1, 4))
+        )
+        urls.append(
+            f"https://{host}/{path}"
+            f"{'?' + query if rng.random() < 0.4 else ''}"
+            f"{'#top' if rng.random() < 0.1 else ''}"
+        )
+    return urls
+
+
+def main() -> None:
+    "Run the comparison on raw URLs and on their normalized versions."
+    num = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    raw = synthetic_urls(random.Random(42), num)
+    normalized = [normalize_url(url) for url in raw]
+    for name, urls in (("raw", raw), ("normalized", normalized)):
+        assert [normalize_url(u) for u in urls] == [
+            legacy_normalize_url(u) for u in urls
+        ]
+        legacy = min(
+            repeat(
+                lambda us=urls: [legacy_normalize_url(u) for u in us],
+                number=1,
+                repeat=3,
+            )
+        )
+        current = min(
+            repeat(lambda us=urls: [normalize_url(u) for u in us], number=1, repeat=3)
+        )
+        print(
+            f"{name}, {num} URLs: whole normalization {legacy:.3f}s, "
+            f"with shortcut {current:.3f}s, speedup {legacy / current:.2f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
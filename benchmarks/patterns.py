@@ -0,0 +1,118 @@
+"""
+Benchmark the pattern searches made on links: former separate searches for
+each filter vs. scan_url(), which combines the patterns of the categories
+asked for into one expression, on distinct links and on links which partly
+recur across the pages of a website.
+
+Usage: python benchmarks/patterns.py [number of URLs]
+"""
+
+import random
+import re
+import sys
+from timeit import repeat
+
+from check_urls import synthetic_urls
+
+from courlan.filters import (
+    ADULT_AND_VIDEOS,
+    FILE_TYPE,
+    NAVIGATION,
+    NAVIGATION_FILTER,
+    NOT_CRAWLABLE,
+    NOTCRAWLABLE,
+    scan_url,
+    type_filter,
+)
+
+LEGACY_SITE_STRUCTURE = re.compile(
+    # wordpress
+    r"/(?:wp-(?:admin|content|includes|json|themes)|"
+    r"paged?|seite|search|suche|gall?er[a-z]{1,2}|labels|"
+    r"archives|uploads|modules|attachment|oembed)/|"
+    # wordpress + short URL
+    r"[/_-](?:tags?|schlagwort|[ck]ategor[a-z]{1,2}|[ck]at|auth?or|user)/[^/]+/?$|"
+    # mixed/blogspot
+    r"[^0-9]/[0-9]+/[0-9]+/$|[^0-9]/[0-9]{4}/$",
+    re.IGNORECASE,
+)
+
+
+def legacy_type_filter(url: str, strict: bool = False, with_nav: bool = False) -> bool:
+    "Type filter as performed up to courlan 1.4."
+    if (
+        url.endswith(("/feed", "/rss", "_archive.html"))
+        or (
+            LEGACY_SITE_STRUCTURE.search(url)
+            and (not with_nav or not NAVIGATION_FILTER.search(url))
+        )
+        or (strict and (FILE_TYPE.search(url) or ADULT_AND_VIDEOS.search(url)))
+    ):
+        return False
+    return True
+
+
+def legacy_links(urls: list[str], strict: bool) -> list[tuple[bool, bool, bool]]:
+    "Filter the links and sort them, each filter searching its own patterns."
+    return [
+        (
+            legacy_type_filter(u, strict=strict, with_nav=True),
+            bool(NOTCRAWLABLE.search(u)),
+            bool(NAVIGATION_FILTER.search(u)),
+        )
+        for u in urls
+    ]
+
+
+def current_links(urls: list[str], strict: bool) -> list[tuple[bool, bool, bool]]:
+    "Filter the links and sort them with combined pattern scans."
+    results = []
+    for u in urls:
+        passed = type_filter(u, strict=strict, with_nav=True)
+        categories = scan_url(u, NAVIGATION | NOT_CRAWLABLE)
+        results.append(
+            (passed, bool(categories & NOT_CRAWLABLE), bool(categories & NAVIGATION))
+        )
+    return results
+
+
+def site_urls(rng: random.Random, num: int) -> list[str]:
+    "Generate links as found on pages of a website: menus recur on every page."
+    menu = [
+        "https://example.org/",
+        "https://example.org/page/2/",
+        "https://example.org/category/news/",
+        "https://example.org/tag/politics",
+        "https://example.org/2023/10/",
+        "https://example.org/login",
+        "https://example.org/feed",
+    ]
+    articles = synthetic_urls(rng, num // 2, hosts=10)
+    return [rng.choice(menu) if rng.random() < 0.5 else u for u in articles * 2]
+
+
+def main() -> None:
+    "Run the comparison on synthetic corpora."
+    num = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    rng = random.Random(42)
+    for name, urls in (
+        ("distinct links", synthetic_urls(rng, num, hosts=num // 10)),
+        ("website links", site_urls(rng, num)),
+    ):
+        for strict in (False, True):
+            assert legacy_links(urls, strict) == current_links(urls, strict)
+            legacy = min(
+                repeat(lambda u=urls, s=strict: legacy_links(u, s), number=1, repeat=5)
+            )
+            current = min(
+                repeat(lambda u=urls, s=strict: current_links(u, s), number=1, repeat=5)
+            )
+            print(
+                f"{name}, {len(urls)} URLs, strict={strict}: separate searches "
+                f"{legacy:.3f}s, combined scans {current:.3f}s, "
+                f"speedup {legacy / current:.2f}x"
+            )
+
+
+if __name__ == "__main__":
+    main()
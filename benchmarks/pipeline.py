@@ -0,0 +1,175 @@
+"""
+Profile check_url(): URL split once with a fast path and carried through
+validation, normalization and domain extraction vs. the former pipeline
+which parsed the host again and scanned the normalized URL once more.
+
+Usage: python benchmarks/pipeline.py [number of URLs]
+"""
+
+import cProfile
+import pstats
+import random
+import sys
+from collections.abc import Callable
+from timeit import repeat
+from urllib.parse import SplitResult, urlsplit, urlunsplit
+
+from check_urls import synthetic_urls
+
+from courlan import check_url
+from courlan.clean import (
+    PATH1,
+    PATH2,
+    clean_query,
+    decode_punycode,
+    normalize_fragment,
+    normalize_part,
+    scrub_url,
+)
+from courlan.filters import (
+    PROTOCOLS,
+    basic_filter,
+    domain_filter,
+    extension_filter,
+    lang_filter,
+    path_filter,
+    type_filter,
+)
+from courlan.settings import BLACKLIST
+from courlan.urlutils import extract_domain
+
+# functions reported in the profiles
+WATCHED = (
+    "urlsplit",
+    "split_url",
+    "urlunsplit",
+    "_hostinfo",
+    "get_tld",
+    "get_tldinfo",
+    "normalize_url",
+    "_normalize_url",
+)
+
+
+def legacy_validate_url(url: str) -> tuple[bool, SplitResult | None]:
+    "Validation as performed up to courlan 1.4."
+    try:
+        parsed_url = urlsplit(url)
+    except ValueError:
+        return False, None
+    if parsed_url.scheme not in PROTOCOLS:
+        return False, None
+    netloc = parsed_url.netloc
+    if (
+        len(netloc) < 4
+        or (netloc.lower().startswith("www.") and len(netloc) < 8)
+        or ("." not in netloc and ":" not in netloc)
+    ):
+        return False, None
+    return True, parsed_url
+
+
+def legacy_normalize_url(
+    parsed_url: SplitResult, strict: bool = False, language: str | None = None
+) -> str:
+    "Normalization as performed up to courlan 1.4."
+    scheme = parsed_url.scheme.lower()
+    netloc = decode_punycode(parsed_url.netloc.lower())
+    try:
+        port = parsed_url.port
+    except ValueError:
+        port = None
+    if (scheme == "http" and port == 80) or (scheme == "https" and port == 443):
+        netloc = netloc.rsplit(":", 1)[0]
+    newpath = normalize_part(PATH2.sub("", PATH1.sub("/", parsed_url.path)))
+    newquery = clean_query(parsed_url.query, strict, language)
+    if newquery and not newpath:
+        newpath = "/"
+    newfragment = "" if strict else normalize_fragment(parsed_url.fragment, language)
+    return urlunsplit((scheme, netloc, newpath, newquery, newfragment))
+
+
+def legacy_check_url(
+    url: str, strict: bool = False, language: str | None = None
+) -> tuple[str, str] | None:
+    "Pipeline of check_url() as performed up to courlan 1.4 (without redirects)."
+    try:
+        if basic_filter(url) is False:
+            raise ValueError
+        url = scrub_url(url)
+        if type_filter(url, strict=strict) is False:
+            raise ValueError
+        if language is not None and lang_filter(url, language, strict) is False:
+            raise ValueError
+        validation_test, parsed_url = legacy_validate_url(url)
+        if validation_test is False or parsed_url is None:
+            raise ValueError
+        if extension_filter(parsed_url.path) is False:
+            raise ValueError
+        if domain_filter(parsed_url.netloc) is False:
+            raise ValueError
+        if strict and path_filter(parsed_url.path, parsed_url.query) is False:
+            raise ValueError
+        url = legacy_normalize_url(parsed_url, strict, language)
+        if strict:
+            domain = extract_domain(url, blacklist=BLACKLIST, fast=True)
+        else:
+            domain = extract_domain(url, fast=True)
+        if domain is None:
+            return None
+    except (AttributeError, ValueError):
+        return None
+    return url, domain
+
+
+def profile(
+    function: Callable[..., tuple[str, str] | None], urls: list[str], **options: bool
+) -> dict[str, int]:
+    "Count the calls to the watched functions and measure the total time."
+    profiler = cProfile.Profile()
+    profiler.runcall(lambda: [function(u, **options) for u in urls])
+    stats = pstats.Stats(profiler).stats  # type: ignore[attr-defined]
+    calls = {name: 0 for name in WATCHED}
+    for (_, _, name), (_, ncalls, *_) in stats.items():
+        if name in calls:
+            calls[name] += ncalls
+    return calls
+
+
+def main() -> None:
+    "Compare both pipelines on a synthetic corpus."
+    num = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    rng = random.Random(42)
+    urls = synthetic_urls(rng, num, hosts=num // 10)
+    urls += [f"http://Site{i}.org:80/page" for i in range(num // 10)]
+    urls += [f"https://t{i}.co/x?utm_source=a&id={i}" for i in range(num // 10)]
+    for options in ({}, {"strict": True}):
+        assert [check_url(u, **options) for u in urls] == [
+            legacy_check_url(u, **options) for u in urls
+        ]
+        legacy = min(
+            repeat(
+                lambda opts=options: [legacy_check_url(u, **opts) for u in urls],
+                number=1,
+                repeat=3,
+            )
+        )
+        current = min(
+            repeat(
+                lambda opts=options: [check_url(u, **opts) for u in urls],
+                number=1,
+                repeat=3,
+            )
+        )
+        print(
+            f"{len(urls)} URLs {options}: former pipeline {legacy:.3f}s, "
+            f"split once {current:.3f}s, speedup {legacy / current:.2f}x"
+        )
+        before = profile(legacy_check_url, urls, **options)
+        after = profile(check_url, urls, **options)
+        for name in WATCHED:
+            print(f"  {name:>16}: {before[name]:>8} -> {after[name]:>8} calls")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""
+Benchmark query cleaning: fast path for simple and sorted queries vs. parsing,
+filtering and re-encoding every query, on tracker-free and tracker-heavy
+corpora.
+
+Usage: python benchmarks/query.py [number of queries]
+"""
+
+import random
+import sys
+from timeit import repeat
+
+from courlan.clean import _clean_query, clean_query
+
+PARAMS = ["id", "page", "p", "q", "lang", "post", "article", "cat", "s"]
+TRACKERS = ["utm_source", "utm_medium", "utm_campaign", "fbclid", "gclid", "ref"]
+
+
+def synthetic_queries(
+    rng: random.Random, num: int, trackers: float, ordered: float = 0.8
+) -> list[str]:
+    "Generate queries with a given share of trackers, most of them sorted."
+    queries = []
+    for _ in range(num):
+        fields = [
+            f"{rng.choice(TRACKERS if rng.random() < trackers else PARAMS)}="
+            f"{rng.randint(0, 9999)}"
+            for _ in range(rng.randint(1, 4))
+        ]
+        queries.append("&".join(sorted(fields) if rng.random() < ordered else fields))
+    return queries
+
+
+def main() -> None:
+    "Run the comparison on both corpora, in normal and strict mode."
+    num = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    rng = random.Random(42)
+    for name, queries in (
+        ("tracker-free", synthetic_queries(rng, num, 0)),
+        ("tracker-heavy", synthetic_queries(rng, num, 0.5)),
+    ):
+        for strict in (False, True):
+            assert [clean_query(q, strict) for q in queries] == [
+                _clean_query(q, strict) for q in queries
+            ]
+            legacy = min(
+                repeat(
+                    lambda qs=queries, s=strict: [_clean_query(q, s) for q in qs],
+                    number=1,
+                    repeat=3,
+                )
+            )
+            current = min(
+                repeat(
+                    lambda qs=queries, s=strict: [clean_query(q, s) for q in qs],
+                    number=1,
+                    repeat=3,
+                )
+            )
+            print(
+                f"{name}, strict={strict}, {num} queries: parse and encode "
+                f"{legacy:.3f}s, fast path {current:.3f}s, "
+                f"speedup {legacy / current:.2f}x"
+            )
+
+
+if __name__ == "__main__":
+    main()
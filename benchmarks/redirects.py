@@ -0,0 +1,69 @@
+"""
+Benchmark redirect checks: sequential HEAD requests vs. concurrent
+resolution, against local servers answering with a fixed latency.
+
+Usage: python benchmarks/redirects.py [number of URLs] [latency in ms]
+"""
+
+import sys
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Thread
+from time import perf_counter, sleep
+
+from courlan.network import RedirectResolver, redirection_test
+
+HOSTS = 8
+
+
+def start_server(latency: float) -> ThreadingHTTPServer:
+    "Start a server redirecting /old/ paths to /new/ after a delay."
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_HEAD(self) -> None:
+            sleep(latency)
+            if self.path.startswith("/old/"):
+                self.send_response(301)
+                self.send_header("Location", self.path.replace("/old/", "/new/"))
+            else:
+                self.send_response(200)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+
+        def log_message(self, *args: object) -> None:
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main() -> None:
+    "Resolve the same URLs both ways and compare."
+    num = int(sys.argv[1]) if len(sys.argv) > 1 else 400
+    latency = (int(sys.argv[2]) if len(sys.argv) > 2 else 20) / 1000
+    servers = [start_server(latency) for _ in range(HOSTS)]
+    urls = [
+        f"http://127.0.0.1:{servers[i % HOSTS].server_address[1]}/old/{i}"
+        for i in range(num)
+    ]
+
+    start = perf_counter()
+    sequential = {url: redirection_test(url) for url in urls}
+    duration = perf_counter() - start
+    print(f"{num} URLs, {HOSTS} hosts, sequential: {duration:.2f}s")
+
+    for workers in (4, 16, 32):
+        resolver = RedirectResolver(workers=workers)
+        start = perf_counter()
+        assert resolver.resolve(urls) == sequential
+        concurrent = perf_counter() - start
+        print(
+            f"{workers} workers, {resolver.per_host} per host: {concurrent:.2f}s, "
+            f"speedup {duration / concurrent:.1f}x"
+        )
+    for server in servers:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+"""
+Benchmark query cleaning with growing sets of parameter rules: exact names
+are looked up in sets, so the cost should not depend on their number.
+
+Usage: python benchmarks/rules.py [number of queries]
+"""
+
+import random
+import sys
+from timeit import timeit
+
+from query import synthetic_queries
+
+from courlan.clean import clean_query
+from courlan.rules import TRACKER_RULES
+
+
+def load_rules(rng: random.Random, num: int) -> None:
+    "Add rules for random names, globally and for random hosts, plus a few patterns."
+    TRACKER_RULES.clear()
+    lines = []
+    for i in range(num):
+        name = "".join(rng.choices("abcdefghijklmnopqrstuvwxyz_", k=8))
+        if i % 2:
+            lines.append(f"$removeparam={name}")
+        else:
+            lines.append(f"||site{rng.randint(0, 1000)}.org^$removeparam={name}")
+    lines += ["$removeparam=/^ga_[a-z]+=/", "$removeparam=/^mc_[a-z]+=/"]
+    TRACKER_RULES.load_adguard(lines)
+
+
+def main() -> None:
+    "Time clean_query() on the same queries with more and more rules."
+    num = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    rng = random.Random(42)
+    queries = synthetic_queries(rng, num, 0.3)
+    hosts = [f"www.site{rng.randint(0, 2000)}.org" for _ in queries]
+    pairs = list(zip(queries, hosts, strict=True))
+    for rules in (0, 100, 10000, 100000):
+        load_rules(rng, rules)
+        # first pass to compile the matchers of the hosts
+        [clean_query(q, host=h) for q, h in pairs]
+        duration = timeit(lambda: [clean_query(q, host=h) for q, h in pairs], number=3)
+        print(f"{rules:>6} rules: {duration / 3 / num * 1e6:.2f} µs per query")
+    TRACKER_RULES.clear()
+
+
+if __name__ == "__main__":
+    main()
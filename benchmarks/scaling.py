@@ -0,0 +1,46 @@
+"""
+Benchmark batch link extraction across pool types and worker counts.
+
+Usage: python benchmarks/scaling.py [number of pages]
+"""
+
+import os
+import random
+import sys
+from time import perf_counter
+
+from links import synthetic_page
+
+from courlan import extract_links_many
+
+
+def main() -> None:
+    "Time extract_links_many() on synthetic pages with growing worker counts."
+    num = int(sys.argv[1]) if len(sys.argv) > 1 else 64
+    rng = random.Random(42)
+    pages = [
+        (synthetic_page(rng, size=2 * 10**5), f"https://example{i % 8}.org/page")
+        for i in range(num)
+    ]
+    counts = sorted({1, 2, 4, os.cpu_count() or 1})
+
+    reference = None
+    for threads in (True, False):
+        for workers in counts:
+            start = perf_counter()
+            results = extract_links_many(
+                pages, workers=workers, threads=threads, strict=False
+            )
+            duration = perf_counter() - start
+            if reference is None:
+                reference = (duration, results)
+            assert results == reference[1]
+            print(
+                f"{'threads' if threads else 'processes'} x{workers}: "
+                f"{duration:.2f}s, {num / duration:.1f} pages/s, "
+                f"speedup {reference[0] / duration:.2f}x"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -11,8 +11,16 @@ __version__ = "1.4.0"
 
 
 # imports
+from .checker import UrlChecker
 from .clean import clean_url, normalize_url, scrub_url
-from .core import check_url, extract_links, filter_links
+from .core import (
+    check_url,
+    check_urls,
+    extract_links,
+    extract_links_many,
+    filter_links,
+    filter_links_many,
+)
 from .filters import (
     is_navigation_page,
     is_not_crawlable,
@@ -33,12 +41,16 @@ from .urlutils import (
 )
 
 __all__ = [
+    "UrlChecker",
     "clean_url",
     "normalize_url",
     "scrub_url",
     "check_url",
+    "check_urls",
     "extract_links",
+    "extract_links_many",
     "filter_links",
+    "filter_links_many",
     "is_navigation_page",
     "is_not_crawlable",
     "is_valid_url",
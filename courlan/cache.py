@@ -0,0 +1,80 @@
+"""
+Shared store for results computed on host names, which recur across URLs:
+validity, punycode decoding and domain information.
+"""
+
+from collections.abc import Callable, Hashable
+from threading import Lock
+from typing import Any, TypeVar
+
+# number of results remembered before the store is emptied
+HOST_CACHE_SIZE = 100000
+
+T = TypeVar("T")
+
+
+class HostCache:
+    """Bounded and thread-safe store of results by kind of computation and
+    host, along with the number of hits and misses for each kind. Lookups
+    do not take the lock, which only guards insertions."""
+
+    __slots__ = ("hits", "maxsize", "misses", "size", "_lock", "_tables")
+
+    def __init__(self, maxsize: int = HOST_CACHE_SIZE) -> None:
+        self.hits: dict[str, int] = {}
+        self.maxsize: int = maxsize
+        self.misses: dict[str, int] = {}
+        self.size: int = 0
+        self._lock: Lock = Lock()
+        self._tables: dict[str, dict[Hashable, Any]] = {}
+
+    def __len__(self) -> int:
+        return self.size
+
+    def get(
+        self, kind: str, key: Hashable, function: Callable[..., T], *args: Any
+    ) -> T:
+        "Return the stored result for the key or compute it with the function."
+        try:
+            result: T = self._tables[kind][key]
+        except KeyError:
+            pass
+        else:
+            self.hits[kind] = self.hits.get(kind, 0) + 1
+            return result
+        # computed outside of the lock, concurrent misses yield the same result
+        result = function(*args)
+        with self._lock:
+            if self.size >= self.maxsize:
+                for stored in self._tables.values():
+                    stored.clear()
+                self.size = 0
+            table = self._tables.setdefault(kind, {})
+            self.misses[kind] = self.misses.get(kind, 0) + 1
+            if key not in table:
+                table[key] = result
+                self.size += 1
+        return result
+
+    def statistics(self) -> dict[str, dict[str, float]]:
+        "Return the number of hits and misses and the hit rate for each kind."
+        stats = {}
+        for kind in sorted(self.misses):
+            hits, misses = self.hits.get(kind, 0), self.misses[kind]
+            stats[kind] = {
+                "hits": hits,
+                "misses": misses,
+                "hit_rate": hits / (hits + misses) if misses else 1.0,
+            }
+        return stats
+
+    def clear(self) -> None:
+        "Remove the stored results and reset the counters."
+        with self._lock:
+            self._tables.clear()
+            self.hits.clear()
+            self.misses.clear()
+            self.size = 0
+
+
+HOST_CACHE = HostCache()
@@ -0,0 +1,384 @@
+"""
+Configurable URL checking pipeline: the filters are run as a sequence of
+stages whose rejection rates and costs are recorded, so that the stages can
+be reordered to discard URLs as early as possible.
+"""
+
+import logging
+from collections import Counter
+from collections.abc import Callable, Iterable, Iterator, Mapping
+from functools import lru_cache
+from itertools import islice
+from threading import Lock
+from time import perf_counter_ns
+from urllib.parse import SplitResult
+
+from .cache import HOST_CACHE
+from .clean import _normalize_url, normalize_host, scrub_url
+from .filters import (
+    basic_filter,
+    domain_filter,
+    extension_filter,
+    lang_filter,
+    path_filter,
+    type_filter,
+    validate_url,
+)
+from .network import (
+    HostBreaker,
+    PersistentRedirectCache,
+    RedirectResolver,
+)
+from .settings import BLACKLIST
+from .urlutils import extract_domain
+
+LOGGER = logging.getLogger(__name__)
+
+# one check out of SAMPLE_INTERVAL is timed
+SAMPLE_INTERVAL = 64
+# number of checks between two reorderings in adaptive mode
+ADAPT_INTERVAL = 4096
+# number of URLs whose redirects are resolved together by check_reasons()
+REDIRECT_BATCH = 1000
+
+StageTest = Callable[[str, SplitResult], bool]
+
+
+class FilterStage:
+    "A test run on parsed URLs, along with its statistics."
+
+    __slots__ = ("calls", "name", "rejected", "test", "time", "timed")
+
+    def __init__(self, name: str, test: StageTest) -> None:
+        self.name: str = name
+        self.test: StageTest = test
+        self.calls: int = 0
+        self.rejected: int = 0
+        self.time: int = 0
+        self.timed: int = 0
+
+    @property
+    def cost(self) -> float:
+        "Average time spent per URL in seconds, measured on a sample."
+        return self.time / self.timed / 1e9 if self.timed else 0.0
+
+    @property
+    def rejection_rate(self) -> float:
+        "Share of the URLs reaching the stage which it rejects."
+        return self.rejected / self.calls if self.calls else 0.0
+
+    def reset(self) -> None:
+        "Reset the statistics."
+        self.calls = self.rejected = self.time = self.timed = 0
+
+
+# stages run on a URL, rejection by the last one and durations if timed
+StageRun = tuple[list[FilterStage], bool, list[int]]
+NO_STAGES: StageRun = ([], False, [])
+
+
+class UrlChecker:
+    """Check URLs with a given set of options, see check_url(). Custom stages
+    are functions taking the URL and its parts and returning False to discard
+    it, or FilterStage objects giving them a name; they are run after the
+    built-in filters. With adaptive=True the
+    stages are regularly reordered so that cheap stages which often reject
+    URLs come first. Rejections are counted by reason. Redirects are resolved
+    with the given resolver, concurrently when checking series of URLs.
+    A checker can be shared between threads, statistics are updated under
+    a lock."""
+
+    __slots__ = (
+        "adaptive",
+        "blacklist",
+        "checked",
+        "language",
+        "rejections",
+        "resolver",
+        "stages",
+        "strict",
+        "trailing_slash",
+        "with_nav",
+        "with_redirects",
+        "_lock",
+    )
+
+    def __init__(
+        self,
+        strict: bool = False,
+        with_redirects: bool = False,
+        language: str | None = None,
+        with_nav: bool = False,
+        trailing_slash: bool = True,
+        stages: Iterable[StageTest | FilterStage] = (),
+        adaptive: bool = False,
+        resolver: RedirectResolver | None = None,
+    ) -> None:
+        self.adaptive: bool = adaptive
+        self.blacklist: set[str] | None = BLACKLIST if strict else None
+        self.checked: int = 0
+        self.language: str | None = language
+        self.rejections: Counter[str] = Counter()
+        self.resolver: RedirectResolver = resolver or RedirectResolver()
+        self.strict: bool = strict
+        self.trailing_slash: bool = trailing_slash
+        self.with_nav: bool = with_nav
+        self.with_redirects: bool = with_redirects
+        self._lock: Lock = Lock()
+
+        self.stages: list[FilterStage] = [
+            FilterStage("type", self._type_filter),
+            FilterStage("extension", self._extension_filter),
+            FilterStage("host", self._host_filter),
+        ]
+        if language is not None:
+            self.stages.insert(1, FilterStage("language", self._lang_filter))
+        if strict:
+            self.stages.append(FilterStage("path", self._path_filter))
+        # custom stages are named after their function unless given a name
+        self.stages.extend(
+            FilterStage(stage.name, stage.test)
+            if isinstance(stage, FilterStage)
+            else FilterStage(stage.__name__, stage)
+            for stage in stages
+        )
+
+    def _type_filter(self, url: str, parts: SplitResult) -> bool:
+        "Run the type filter with the options of the checker."
+        return type_filter(url, strict=self.strict, with_nav=self.with_nav)
+
+    def _lang_filter(self, url: str, parts: SplitResult) -> bool:
+        "Run the language filter with the options of the checker."
+        return lang_filter(url, self.language, self.strict, self.trailing_slash)
+
+    def _extension_filter(self, url: str, parts: SplitResult) -> bool:
+        "Filter based on the extension of the path."
+        return extension_filter(parts.path)
+
+    def _host_filter(self, url: str, parts: SplitResult) -> bool:
+        "Run the domain filter, its results are shared across checkers."
+        return domain_filter(parts.netloc)
+
+    def _path_filter(self, url: str, parts: SplitResult) -> bool:
+        "Filter based on the path and the query in strict mode."
+        return path_filter(parts.path, parts.query)
+
+    def _normalize_host(self, parts: SplitResult) -> str:
+        "Decode punycode and strip default ports once per host."
+        return HOST_CACHE.get(
+            "normalize_host", (parts.scheme, parts.netloc), normalize_host, parts
+        )
+
+    def _extract_domain(self, hostpart: str) -> str | None:
+        "Extract the domain once per host, the blacklist depends on strictness."
+        return HOST_CACHE.get(
+            "extract_domain",
+            (hostpart, self.strict),
+            extract_domain,
+            hostpart,
+            self.blacklist,
+            True,
+        )
+
+    def _check(
+        self,
+        url: str,
+        resolved: Mapping[str, str | None] | None = None,
+        timed: bool = False,
+    ) -> tuple[tuple[str, str] | str, StageRun]:
+        """Run the checks and return the result or the reason of the rejection,
+        along with the stages run, whether the last one rejected the URL and
+        the measured durations."""
+        # length test
+        if basic_filter(url) is False:
+            return "basic", NO_STAGES
+
+        # clean
+        url = scrub_url(url)
+
+        # get potential redirect, possibly resolved beforehand
+        if self.with_redirects:
+            target = (
+                resolved[url]
+                if resolved is not None and url in resolved
+                else self.resolver.resolve_url(url)
+            )
+            if target is None:
+                return "redirect", NO_STAGES
+            url = target
+
+        # split and validate
+        validation_test, parts = validate_url(url)
+        if validation_test is False or parts is None:
+            return "validation", NO_STAGES
+
+        # filters, a sample of the checks is timed
+        stages = self.stages  # replaced as a whole by reorder()
+        reached, rejected = len(stages), False
+        times: list[int] = []
+        if timed:
+            for position, stage in enumerate(stages):
+                start = perf_counter_ns()
+                result = stage.test(url, parts)
+                times.append(perf_counter_ns() - start)
+                if not result:
+                    reached, rejected = position + 1, True
+                    break
+        else:
+            for position, stage in enumerate(stages):
+                if not stage.test(url, parts):
+                    reached, rejected = position + 1, True
+                    break
+        run = stages[:reached], rejected, times
+        if rejected:
+            return stages[reached - 1].name, run
+
+        # normalize, the URL is not split again
+        host = self._normalize_host(parts)
+        try:
+            url = _normalize_url(
+                parts, host, self.strict, self.language, self.trailing_slash
+            )
+        except ValueError:
+            return "normalization", run
+
+        # domain info: only the host name and the following character matter
+        domain = self._extract_domain(url[: len(parts.scheme) + len(host) + 4])
+        if domain is None:
+            return "domain", run
+
+        return (url, domain), run
+
+    def check_reason(
+        self, url: str, resolved: Mapping[str, str | None] | None = None
+    ) -> tuple[tuple[str, str] | None, str | None]:
+        """Check a URL and return the result of check() along with the reason
+        of the rejection: basic, redirect, validation, the name of a stage,
+        normalization, domain or error. Redirects can be resolved beforehand,
+        see RedirectResolver.resolve()."""
+        # read without the lock: only used to time samples and reorder stages
+        checked = self.checked + 1
+        if self.adaptive and not checked % ADAPT_INTERVAL:
+            self.reorder()
+        try:
+            result, run = self._check(url, resolved, not checked % SAMPLE_INTERVAL)
+        except (AttributeError, ValueError):
+            result, run = "error", NO_STAGES
+        # statistics are updated at once
+        stages, rejected, times = run
+        with self._lock:
+            self.checked += 1
+            for stage in stages:
+                stage.calls += 1
+            if rejected:
+                stages[-1].rejected += 1
+            # durations are only measured on samples
+            for stage, duration in zip(stages, times, strict=False):
+                stage.time += duration
+                stage.timed += 1
+            if isinstance(result, str):
+                self.rejections[result] += 1
+        if isinstance(result, str):
+            LOGGER.debug("rejected, %s: %s", result, url)
+            return None, result
+        return result, None
+
+    def check(self, url: str) -> tuple[str, str] | None:
+        "Check a URL and return the canonical URL and the domain, or None."
+        return self.check_reason(url)[0]
+
+    def check_reasons(
+        self, urls: Iterable[str]
+    ) -> Iterator[tuple[tuple[str, str] | None, str | None]]:
+        """Check a series of URLs and yield the results of check_reason() in
+        the same order. Redirects are resolved concurrently, batch by batch."""
+        if not self.with_redirects:
+            for url in urls:
+                yield self.check_reason(url)
+            return
+        iterator = iter(urls)
+        while batch := list(islice(iterator, REDIRECT_BATCH)):
+            resolved = self.resolver.resolve(self._redirect_candidates(batch))
+            for url in batch:
+                yield self.check_reason(url, resolved)
+
+    def _redirect_candidates(self, urls: list[str]) -> Iterator[str]:
+        "Yield the URLs to be tested for redirects, as they are after scrubbing."
+        for url in urls:
+            try:
+                if basic_filter(url):
+                    yield scrub_url(url)
+            except (AttributeError, ValueError):
+                continue
+
+    def check_many(self, urls: Iterable[str]) -> Iterator[tuple[str, str] | None]:
+        "Check a series of URLs and yield the results in the same order."
+        for result, _ in self.check_reasons(urls):
+            yield result
+
+    def reorder(self) -> None:
+        """Sort the stages by expected cost per rejected URL, so that cheap
+        stages which reject many URLs come first. Stages which have not been
+        timed yet keep their place."""
+        with self._lock:
+            ranked = iter(
+                sorted(
+                    (stage for stage in self.stages if stage.timed),
+                    key=lambda s: (
+                        s.cost / s.rejection_rate if s.rejected else float("inf"),
+                        s.cost,
+                    ),
+                )
+            )
+            self.stages = [
+                next(ranked) if stage.timed else stage for stage in self.stages
+            ]
+
+    def statistics(self) -> dict[str, dict[str, float]]:
+        "Return the number of calls, the rejection rate and the cost of each stage."
+        with self._lock:
+            return {
+                stage.name: {
+                    "calls": stage.calls,
+                    "rejected": stage.rejected,
+                    "rejection_rate": stage.rejection_rate,
+                    "cost": stage.cost,
+                }
+                for stage in self.stages
+            }
+
+    def reset(self) -> None:
+        "Reset the statistics."
+        with self._lock:
+            self.checked = 0
+            self.rejections.clear()
+            for stage in self.stages:
+                stage.reset()
+
+
+@lru_cache(maxsize=64)
+def get_checker(
+    strict: bool = False,
+    with_redirects: bool = False,
+    language: str | None = None,
+    with_nav: bool = False,
+    trailing_slash: bool = True,
+    redirect_cache: str | None = None,
+    skip_unreachable: bool = False,
+) -> UrlChecker:
+    """Return a checker for the given options, created once and then reused.
+    Redirect targets can be kept in a file between runs and hosts which
+    cannot be reached can be skipped for a while."""
+    resolver = None
+    if redirect_cache is not None or skip_unreachable:
+        resolver = RedirectResolver(
+            breaker=HostBreaker() if skip_unreachable else None,
+            cache=(
+                PersistentRedirectCache(redirect_cache)
+                if redirect_cache is not None
+                else None
+            ),
+        )
+    return UrlChecker(
+        strict, with_redirects, language, with_nav, trailing_slash, resolver=resolver
+    )
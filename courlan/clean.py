@@ -4,9 +4,12 @@ Functions performing URL trimming and cleaning
 
 import logging
 import re
+from html import unescape
 from urllib.parse import SplitResult, parse_qs, quote, urlencode, urlunsplit
 
+from .cache import HOST_CACHE
 from .filters import is_valid_url
+from .rules import TRACKER_RULES
 from .settings import ALLOWED_PARAMS, LANG_PARAMS, TARGET_LANGS
 from .urlutils import _parse
 
@@ -38,6 +41,16 @@ TRACKERS_RE = re.compile(
     r"(?:\b|_)(?:aff|affi|affiliate|campaign|cl?id|eid|ga|gl|"
     r"kwd|keyword|medium|ref|referr?er|session|source|uid|xtor)"
 )
+# queries in which parse_qs() and urlencode() leave names and values unchanged
+SIMPLE_QUERY = re.compile(r"[\w.~-]+=[\w.~-]+(?:&[\w.~-]+=[\w.~-]+)*\Z", re.ASCII)
+# URLs whose scheme, host and path are left unchanged by normalization:
+# lowercase ASCII host, no empty or leading /.. segments, no characters to quote
+NORMALIZED_URL = re.compile(
+    r"(https?)://([a-z0-9.-]+(?::([1-9][0-9]{0,4}))?)"
+    r"((?!/\.\.(?:[/?#]|\Z))(?:/[\w.~!=:,%-]+)*/?)"
+    r"(?:\?([^#\s]+))?(?:#(.+))?\Z",
+    re.ASCII,
+)
 
 
 def clean_url(url: str, language: str | None = None) -> str | None:
@@ -95,12 +108,51 @@ def scrub_url(url: str) -> str:
 
 
 def clean_query(
-    querystring: str, strict: bool = False, language: str | None = None
+    querystring: str,
+    strict: bool = False,
+    language: str | None = None,
+    host: str | None = None,
 ) -> str:
-    "Strip unwanted query elements"
+    """Strip unwanted query elements, the parameter rules which apply to the
+    host are used on top of the built-in ones, see courlan.rules."""
     if not querystring:
         return ""
+    matcher = TRACKER_RULES.matcher(host)
+
+    # fast path: simple parameters already sorted, only removals are needed
+    if SIMPLE_QUERY.match(querystring):
+        fields = querystring.split("&")
+        kept = []
+        previous = ""
+        for field in fields:
+            name = field[: field.index("=")]
+            if name < previous:
+                break
+            previous = name
+            teststr = name.lower()
+            if language in TARGET_LANGS and teststr in LANG_PARAMS:
+                break
+            if matcher is not None and matcher(teststr, field[len(name) + 1 :]):
+                continue
+            if strict:
+                if teststr in ALLOWED_PARAMS or teststr in LANG_PARAMS:
+                    kept.append(field)
+            elif not TRACKERS_RE.search(teststr):
+                kept.append(field)
+        else:
+            return querystring if len(kept) == len(fields) else "&".join(kept)
+
+    return _clean_query(querystring, strict, language, host)
 
+
+def _clean_query(
+    querystring: str,
+    strict: bool = False,
+    language: str | None = None,
+    host: str | None = None,
+) -> str:
+    "Parse, filter, sort and encode the query elements."
+    matcher = TRACKER_RULES.matcher(host)
     qdict = parse_qs(querystring)
     newqdict = {}
 
@@ -113,16 +165,22 @@ def clean_query(
         # get rid of trackers
         elif TRACKERS_RE.search(teststr):
             continue
+        # additional rules
+        values = qdict[qelem]
+        if matcher is not None:
+            values = [value for value in values if not matcher(teststr, value)]
+            if not values:
+                continue
         # control language
         if (
             language in TARGET_LANGS
             and teststr in LANG_PARAMS
-            and str(qdict[qelem][0]) not in TARGET_LANGS[language]
+            and str(values[0]) not in TARGET_LANGS[language]
         ):
             LOGGER.debug("bad lang: %s %s", language, qelem)
             raise ValueError
         # insert
-        newqdict[qelem] = qdict[qelem]
+        newqdict[qelem] = values
 
     return urlencode(newqdict, doseq=True)
 
@@ -131,7 +189,11 @@ def decode_punycode(string: str) -> str:
     "Probe for punycode in lower-cased hostname and try to decode it."
     if "xn--" not in string:
         return string
+    return HOST_CACHE.get("decode_punycode", string, _decode_punycode, string)
+
 
+def _decode_punycode(string: str) -> str:
+    "Decode the punycode parts of a hostname."
     parts = []
 
     for part in string.split("."):
@@ -151,45 +213,107 @@ def normalize_part(url_part: str) -> str:
     return quote(url_part, safe="/%!=:,-")
 
 
-def normalize_fragment(fragment: str, language: str | None = None) -> str:
+def normalize_fragment(
+    fragment: str, language: str | None = None, host: str | None = None
+) -> str:
     "Look for trackers in URL fragments using query analysis, normalize the output."
     if "=" in fragment:
         if "&" in fragment:
-            fragment = clean_query(fragment, False, language)
+            fragment = clean_query(fragment, False, language, host)
         elif TRACKERS_RE.search(fragment):
             fragment = ""
+        elif (matcher := TRACKER_RULES.matcher(host)) is not None:
+            name, _, value = fragment.partition("=")
+            if matcher(name.lower(), value):
+                fragment = ""
     return normalize_part(fragment)
 
 
-def normalize_url(
-    parsed_url: SplitResult | str,
-    strict: bool = False,
-    language: str | None = None,
-    trailing_slash: bool = True,
-) -> str:
-    "Takes a URL string or a parsed URL and returns a normalized URL string"
-    parsed_url = _parse(parsed_url)
-    # lowercase + remove fragments + normalize punycode
-    scheme = parsed_url.scheme.lower()
+def normalize_host(parsed_url: SplitResult) -> str:
+    "Lowercase the network location, decode punycode and strip default ports."
     netloc = decode_punycode(parsed_url.netloc.lower())
+    if ":" not in netloc:
+        return netloc
     # port: strip only the scheme's default port (80 for http, 443 for https)
     try:
         port = parsed_url.port
     except ValueError:
         port = None  # port could not be cast to integer value
+    scheme = parsed_url.scheme.lower()
     if (scheme == "http" and port == 80) or (scheme == "https" and port == 443):
         # strip the trailing default port (IPv6-safe)
         netloc = netloc.rsplit(":", 1)[0]
+    return netloc
+
+
+def normalize_url(
+    parsed_url: SplitResult | str,
+    strict: bool = False,
+    language: str | None = None,
+    trailing_slash: bool = True,
+) -> str:
+    "Takes a URL string or a parsed URL and returns a normalized URL string"
+    url = parsed_url.geturl() if isinstance(parsed_url, SplitResult) else parsed_url
+    if isinstance(url, str) and _is_normalized(url, strict, language, trailing_slash):
+        return url
+    parsed_url = _parse(parsed_url)
+    return _normalize_url(
+        parsed_url, normalize_host(parsed_url), strict, language, trailing_slash
+    )
+
+
+def _is_normalized(
+    url: str,
+    strict: bool = False,
+    language: str | None = None,
+    trailing_slash: bool = True,
+) -> bool:
+    "Tell if normalize_url() would return the URL string as it is."
+    match = NORMALIZED_URL.match(url)
+    if match is None or "xn--" in match[2] or ("&" in url and unescape(url) != url):
+        return False
+    scheme, netloc, port, path, query, fragment = match.groups()
+    if port and (int(port) > 65535 or port == ("443" if scheme == "https" else "80")):
+        return False
+    if query:
+        # unsorted or escaped queries would be parsed twice
+        names = [field.partition("=")[0] for field in query.split("&")]
+        if (
+            not path
+            or not SIMPLE_QUERY.match(query)
+            or names != sorted(names)
+            or clean_query(query, strict, language, netloc) != query
+        ):
+            return False
+    elif not trailing_slash and path.endswith("/"):
+        return False
+    return not fragment or (
+        not strict and normalize_fragment(fragment, language, netloc) == fragment
+    )
+
+
+def _normalize_url(
+    parsed_url: SplitResult,
+    netloc: str,
+    strict: bool = False,
+    language: str | None = None,
+    trailing_slash: bool = True,
+) -> str:
+    "Normalize a parsed URL whose network location is already normalized."
+    # lowercase + remove fragments
+    scheme = parsed_url.scheme.lower()
     # path: https://github.com/saintamh/alcazar/blob/master/alcazar/utils/urls.py
     # leading /../'s in the path are removed
     newpath = normalize_part(PATH2.sub("", PATH1.sub("/", parsed_url.path)))
     # strip unwanted query elements
-    newquery = clean_query(parsed_url.query, strict, language)
+    newquery = clean_query(parsed_url.query, strict, language, netloc)
     if newquery and not newpath:
         newpath = "/"
     elif not trailing_slash and not newquery and newpath.endswith("/"):
         newpath = newpath.rstrip("/")
     # fragment
-    newfragment = "" if strict else normalize_fragment(parsed_url.fragment, language)
+    newfragment = (
+        "" if strict else normalize_fragment(parsed_url.fragment, language, netloc)
+    )
     # rebuild
     return urlunsplit((scheme, netloc, newpath, newquery, newfragment))
@@ -5,12 +5,12 @@ Implements a basic command-line interface.
 import argparse
 import logging
 import sys
-from collections.abc import Iterator, Sequence
+from collections.abc import Sequence
 from concurrent.futures import ProcessPoolExecutor, as_completed
 from contextlib import ExitStack
 from itertools import islice
 
-from .core import check_url
+from .checker import get_checker
 from .sampling import _make_sample
 from .urlstore import UrlStore
 
@@ -43,6 +43,11 @@ def parse_args(args: Sequence[str] | None) -> argparse.Namespace:
         help="name of file to store discarded URLs (optional)",
         type=str,
     )
+    group1.add_argument(
+        "--reasons",
+        help="write the reason of the rejection next to discarded URLs",
+        action="store_true",
+    )
     group1.add_argument(
         "-v", "--verbose", help="increase output verbosity", action="store_true"
     )
@@ -62,6 +67,16 @@ def parse_args(args: Sequence[str] | None) -> argparse.Namespace:
     group2.add_argument(
         "-r", "--redirects", help="check redirects", action="store_true"
     )
+    group2.add_argument(
+        "--redirect-cache",
+        help="keep the results of redirect checks in a file between runs",
+        type=str,
+    )
+    group2.add_argument(
+        "--skip-unreachable",
+        help="skip hosts for a while after repeated connection failures",
+        action="store_true",
+    )
     group3 = argsparser.add_argument_group(
         "Sampling", "Use sampling by host, configure sample size"
     )
@@ -81,34 +96,31 @@ def _cli_check_urls(
     with_redirects: bool = False,
     language: str | None = None,
     with_nav: bool = False,
+    with_reasons: bool = False,
+    redirect_cache: str | None = None,
+    skip_unreachable: bool = False,
 ) -> list[tuple[bool, str]]:
-    "Internal function to be used with CLI multiprocessing."
+    """Internal function to be used with CLI multiprocessing.
+    Discarded URLs can be followed by a tab and the reason of the rejection."""
+    checker = get_checker(
+        strict,
+        with_redirects,
+        language,
+        with_nav,
+        redirect_cache=redirect_cache,
+        skip_unreachable=skip_unreachable,
+    )
     results = []
-    for url in urls:
-        result = check_url(
-            url,
-            strict=strict,
-            with_redirects=with_redirects,
-            language=language,
-            with_nav=with_nav,
-        )
+    for url, (result, reason) in zip(urls, checker.check_reasons(urls), strict=True):
         if result is not None:
             results.append((True, result[0]))
+        elif with_reasons:
+            results.append((False, f"{url}\t{reason}"))
         else:
             results.append((False, url))
     return results
 
 
-def _batch_lines(inputfile: str) -> Iterator[list[str]]:
-    "Read input line in batches"
-    with open(inputfile, encoding="utf-8", errors="ignore") as inputfh:
-        while True:
-            batch = [line.strip() for line in islice(inputfh, 10**5)]
-            if not batch:
-                return
-            yield batch
-
-
 def _cli_sample(args: argparse.Namespace) -> None:
     "Sample URLs on the CLI."
     if args.verbose:
@@ -119,8 +131,7 @@ def _cli_sample(args: argparse.Namespace) -> None:
     urlstore = UrlStore(
         compressed=True, language=None, strict=args.strict, verbose=args.verbose
     )
-    for batch in _batch_lines(args.inputfile):
-        urlstore.add_urls(batch)
+    urlstore.import_file(args.inputfile)
 
     with open(args.outputfile, "w", encoding="utf-8") as outputfh:
         for url in _make_sample(
@@ -164,6 +175,9 @@ def _cli_process(args: argparse.Namespace) -> None:
                     strict=args.strict,
                     with_redirects=args.redirects,
                     language=args.language,
+                    with_reasons=args.reasons,
+                    redirect_cache=args.redirect_cache,
+                    skip_unreachable=args.skip_unreachable,
                 )
                 for batch in batches
             )
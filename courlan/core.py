@@ -3,37 +3,48 @@ Core functions needed to make the module work.
 """
 
 # import locale
+import codecs
 import logging
 import re
+from collections import OrderedDict
+from collections.abc import Callable, Iterable, Iterator
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from itertools import repeat
+from threading import Lock
+from typing import Any
 from urllib.robotparser import RobotFileParser
 
-from .clean import normalize_url, scrub_url
-from .filters import (
-    basic_filter,
-    domain_filter,
-    extension_filter,
-    is_navigation_page,
-    is_not_crawlable,
-    lang_filter,
-    path_filter,
-    type_filter,
-    validate_url,
-)
-from .network import redirection_test
-from .settings import BLACKLIST
+from .checker import get_checker
+from .filters import NAVIGATION, NOT_CRAWLABLE, scan_url
+from .robots import RobotsRules, compile_rules
 from .urlutils import (
-    extract_domain,
-    fix_relative_urls,
+    LinkContext,
     get_base_url,
-    is_external,
     is_known_link,
 )
 
 LOGGER = logging.getLogger(__name__)
 
-FIND_LINKS_REGEX = re.compile(r"<a\s+[^<>]+?>", re.I)
+
+# anchor tags, the pattern stays linear on unclosed tags
+FIND_LINKS_REGEX = re.compile(r"<a\s[^<>]*>", re.I)
+# first href value of a tag, ending at the first quote, space or closing bracket
+LINK_REGEX = re.compile(r"""href=["']?([^ <>][^ <>"']*)(?=["' >])""", re.I)
 HREFLANG_REGEX = re.compile(r'hreflang=["\']?([a-z-]+)', re.I)
-LINK_REGEX = re.compile(r'href=["\']?([^ ]+?)(["\' >])', re.I)
+# same patterns to scan raw documents
+FIND_LINKS_BYTES_REGEX = re.compile(FIND_LINKS_REGEX.pattern.encode(), re.I)
+LINK_BYTES_REGEX = re.compile(LINK_REGEX.pattern.encode(), re.I)
+HREFLANG_BYTES_REGEX = re.compile(HREFLANG_REGEX.pattern.encode(), re.I)
+BASE_HREF_REGEX = re.compile(r"""<base\s[^<>]*?href=["']?([^"'\s<>]+)""", re.I)
+BASE_HREF_BYTES_REGEX = re.compile(BASE_HREF_REGEX.pattern.encode(), re.I)
+META_CHARSET_REGEX = re.compile(rb"""<meta[^<>]+?charset=["']?([a-z0-9_.:-]+)""", re.I)
+BOMS = (
+    (codecs.BOM_UTF8, "utf-8"),
+    (codecs.BOM_UTF32_LE, "utf-32"),
+    (codecs.BOM_UTF32_BE, "utf-32"),
+    (codecs.BOM_UTF16_LE, "utf-16"),
+    (codecs.BOM_UTF16_BE, "utf-16"),
+)
 
 
 def check_url(
@@ -59,78 +70,175 @@ def check_url(
     Raises:
         Nothing: invalid URLs are caught internally and None is returned.
     """
+    return get_checker(
+        strict, with_redirects, language, with_nav, trailing_slash
+    ).check(url)
 
-    # first sanity check
-    # use standard parsing library, validate and strip fragments, then normalize
-    try:
-        # length test
-        if basic_filter(url) is False:
-            LOGGER.debug("rejected, basic filter: %s", url)
-            raise ValueError
-
-        # clean
-        url = scrub_url(url)
-
-        # get potential redirect, can raise ValueError
-        if with_redirects:
-            url = redirection_test(url)
-
-        # spam & structural elements
-        if type_filter(url, strict=strict, with_nav=with_nav) is False:
-            LOGGER.debug("rejected, type filter: %s", url)
-            raise ValueError
-
-        # internationalization and language heuristics in URL
-        if (
-            language is not None
-            and lang_filter(url, language, strict, trailing_slash) is False
-        ):
-            LOGGER.debug("rejected, lang filter: %s", url)
-            raise ValueError
-
-        # split and validate
-        validation_test, parsed_url = validate_url(url)
-        if validation_test is False or parsed_url is None:
-            LOGGER.debug("rejected, validation test: %s", url)
-            raise ValueError
-
-        # content filter based on extensions
-        if extension_filter(parsed_url.path) is False:
-            LOGGER.debug("rejected, extension filter: %s", url)
-            raise ValueError
-
-        # unsuitable domain/host name
-        if domain_filter(parsed_url.netloc) is False:
-            LOGGER.debug("rejected, domain name: %s", url)
-            raise ValueError
-
-        # strict content filtering
-        if strict and path_filter(parsed_url.path, parsed_url.query) is False:
-            LOGGER.debug("rejected, path filter: %s", url)
-            raise ValueError
-
-        # normalize
-        url = normalize_url(parsed_url, strict, language, trailing_slash)
-
-        # domain info: use blacklist in strict mode only
-        if strict:
-            domain = extract_domain(url, blacklist=BLACKLIST, fast=True)
-        else:
-            domain = extract_domain(url, fast=True)
-        if domain is None:
-            LOGGER.debug("rejected, domain name: %s", url)
-            return None
-
-    # handle exceptions
-    except (AttributeError, ValueError):
-        LOGGER.debug("discarded URL: %s", url)
+
+def check_urls(
+    urls: Iterable[str],
+    strict: bool = False,
+    with_redirects: bool = False,
+    language: str | None = None,
+    with_nav: bool = False,
+    trailing_slash: bool = True,
+) -> Iterator[tuple[str, str] | None]:
+    """Check a series of URLs with the same options as check_url() and
+    yield the results in the same order. Checks which only depend on the
+    host name are performed once per distinct host, redirects are resolved
+    concurrently."""
+    checker = get_checker(strict, with_redirects, language, with_nav, trailing_slash)
+    return checker.check_many(urls)
+
+
+class UrlCheckCache:
+    """Bounded cache of check_url() results, keyed by the link and the
+    filtering options, to be shared across the pages of a site."""
+
+    __slots__ = ("hits", "maxsize", "misses", "_data", "_lock")
+
+    def __init__(self, maxsize: int = 100000) -> None:
+        self.hits: int = 0
+        self.maxsize: int = maxsize
+        self.misses: int = 0
+        self._data: OrderedDict[tuple[Any, ...], tuple[str, str] | None] = OrderedDict()
+        self._lock: Lock = Lock()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __getstate__(self) -> dict[str, Any]:
+        return {slot: getattr(self, slot) for slot in self.__slots__ if slot != "_lock"}
+
+    def __setstate__(self, state: dict[str, Any]) -> None:
+        for slot, value in state.items():
+            setattr(self, slot, value)
+        self._lock = Lock()
+
+    def check(self, url: str, **options: Any) -> tuple[str, str] | None:
+        "Return the result of check_url() with the given options, computed once."
+        key = (url, *sorted(options.items()))
+        with self._lock:
+            if key in self._data:
+                self.hits += 1
+                self._data.move_to_end(key)
+                return self._data[key]
+            self.misses += 1
+        result = check_url(url, **options)
+        with self._lock:
+            self._data[key] = result
+            if len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+        return result
+
+    @property
+    def hit_rate(self) -> float:
+        "Share of lookups answered from the cache."
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def clear(self) -> None:
+        "Empty the cache and reset the statistics."
+        with self._lock:
+            self._data.clear()
+            self.hits = self.misses = 0
+
+
+def _sniff_encoding(pagecontent: bytes | memoryview) -> str:
+    "Guess the encoding of a raw HTML document using its BOM or meta tags."
+    start = bytes(pagecontent[:1024])
+    for bom, encoding in BOMS:
+        if start.startswith(bom):
+            return encoding
+    match = META_CHARSET_REGEX.search(start)
+    if match:
+        try:
+            return codecs.lookup(match[1].decode("ascii")).name
+        except LookupError:
+            LOGGER.debug("Unknown encoding: %s", match[1])
+    return "utf-8"
+
+
+def _find_base_href(
+    pagecontent: str | bytes | memoryview, encoding: str | None = None
+) -> str | None:
+    "Look for a <base href> element giving the URL relative links refer to."
+    if isinstance(pagecontent, str):
+        match = BASE_HREF_REGEX.search(pagecontent)
+        return match[1] if match else None
+    rawmatch = BASE_HREF_BYTES_REGEX.search(pagecontent)
+    if rawmatch is None:
         return None
+    return rawmatch[1].decode(encoding or _sniff_encoding(pagecontent), errors="ignore")
 
-    return url, domain
+
+def _extract_candidates(
+    pagecontent: str | bytes | memoryview,
+    language: str | None,
+    encoding: str | None = None,
+) -> set[str]:
+    """Collect the targets of the anchor tags in a HTML document, excluding
+    nofollow links and links marked for another language. Raw documents are
+    scanned as such, only the link targets are decoded."""
+    if isinstance(pagecontent, str):
+        return _scan_links(
+            pagecontent, FIND_LINKS_REGEX, LINK_REGEX, HREFLANG_REGEX, language
+        )
+    encoding = encoding or _sniff_encoding(pagecontent)
+    # markup cannot be found in the bytes of UTF-16 or UTF-32 documents
+    if "<a href=".encode(encoding, errors="ignore") != b"<a href=":
+        return _scan_links(
+            bytes(pagecontent).decode(encoding, errors="ignore"),
+            FIND_LINKS_REGEX,
+            LINK_REGEX,
+            HREFLANG_REGEX,
+            language,
+        )
+    return {
+        link.decode(encoding, errors="ignore")
+        for link in _scan_links(
+            pagecontent,
+            FIND_LINKS_BYTES_REGEX,
+            LINK_BYTES_REGEX,
+            HREFLANG_BYTES_REGEX,
+            language.encode() if language is not None else None,
+        )
+    }
+
+
+def _scan_links(
+    pagecontent: Any, find_links: Any, find_href: Any, find_lang: Any, language: Any
+) -> set[Any]:
+    """Run the link scanner on a string or bytes-like document: anchor tags
+    are found first, then their target is searched within each tag."""
+    # tokens of the same type as the document
+    rel, nofollow, hreflang, default = (
+        (b"rel=", b"nofollow", b"hreflang", b"x-default")
+        if isinstance(find_links.pattern, bytes)
+        else ("rel=", "nofollow", "hreflang", "x-default")
+    )
+    candidates = set()
+    for match in find_links.finditer(pagecontent):
+        link = match[0]
+        hrefmatch = find_href.search(link)
+        if hrefmatch is None:
+            continue
+        href = hrefmatch[1]
+        if rel in link and nofollow in link:
+            continue
+        # https://en.wikipedia.org/wiki/Hreflang
+        if language is not None and hreflang in link:
+            langmatch = find_lang.search(link)
+            if not langmatch or not (
+                (lang := langmatch[1].lower()).startswith(language) or lang == default
+            ):
+                continue
+        candidates.add(href)
+    return candidates
 
 
 def extract_links(
-    pagecontent: str,
+    pagecontent: str | bytes | memoryview,
     url: str | None = None,
     external_bool: bool = False,
     *,
@@ -141,12 +249,15 @@ def extract_links(
     with_nav: bool = False,
     redirects: bool = False,
     reference: str | None = None,
+    encoding: str | None = None,
+    cache: UrlCheckCache | None = None,
     base_url: str | None = None,
 ) -> set[str]:
     """Filter links in a HTML document using a series of heuristics
     Args:
-        pagecontent: whole page as a string
-        url: full URL of the original page
+        pagecontent: whole page as a string, or as bytes-like object
+        url: full URL of the original page (a <base href> in the page
+             takes precedence for relative links)
         external_bool: set to True for external links only, False for
                   internal links only
         no_filter: override settings and bypass checks to return all possible URLs
@@ -156,6 +267,8 @@ def extract_links(
         with_nav: set to True to include navigation pages instead of discarding them
         redirects: set to True for redirection test (per HTTP HEAD request)
         reference: provide a host reference for external/internal evaluation
+        encoding: encoding of raw documents (default: guessed from BOM or meta tags)
+        cache: UrlCheckCache instance to reuse link checks across pages
 
     Returns:
         A set containing filtered HTTP links checked for sanity and consistency.
@@ -168,7 +281,6 @@ def extract_links(
 
     base_url = get_base_url(url or "")
     url = url or base_url
-    candidates: set[str] = set()
     validlinks: set[str] = set()
     if not pagecontent:
         return validlinks
@@ -177,33 +289,21 @@ def extract_links(
     reference = reference or base_url
 
     # extract links
-    for link in (m[0] for m in FIND_LINKS_REGEX.finditer(pagecontent)):
-        if "rel=" in link and "nofollow" in link:
-            continue
-        # https://en.wikipedia.org/wiki/Hreflang
-        if no_filter is False and language is not None and "hreflang" in link:
-            langmatch = HREFLANG_REGEX.search(link)
-            if langmatch and (
-                (lang := langmatch[1].lower()).startswith(language)
-                or lang == "x-default"
-            ):
-                linkmatch = LINK_REGEX.search(link)
-                if linkmatch:
-                    candidates.add(linkmatch[1])
-        # default
-        else:
-            linkmatch = LINK_REGEX.search(link)
-            if linkmatch:
-                candidates.add(linkmatch[1])
+    candidates = _extract_candidates(
+        pagecontent, language if no_filter is False else None, encoding
+    )
+
+    # page information shared by all links
+    context = LinkContext(url, reference, _find_base_href(pagecontent, encoding))
 
     # filter candidates
     for link in candidates:
         # repair using base
         if not link.startswith("http"):
-            link = fix_relative_urls(url, link)
+            link = context.fix_relative(link)
         # check
         if no_filter is False:
-            checked = check_url(
+            checked = (cache.check if cache is not None else check_url)(
                 link,
                 strict=strict,
                 trailing_slash=trailing_slash,
@@ -215,9 +315,7 @@ def extract_links(
                 continue
             link = checked[0]
             # external/internal links
-            if reference and external_bool != is_external(
-                url=link, reference=reference, ignore_suffix=True
-            ):
+            if reference and external_bool != context.is_external(link):
                 continue
         if is_known_link(link, validlinks):
             continue
@@ -228,14 +326,16 @@ def extract_links(
 
 
 def filter_links(
-    htmlstring: str,
+    htmlstring: str | bytes | memoryview,
     url: str | None,
     *,
     lang: str | None = None,
-    rules: RobotFileParser | None = None,
+    rules: RobotFileParser | RobotsRules | None = None,
     external: bool = False,
     strict: bool = False,
     with_nav: bool = True,
+    encoding: str | None = None,
+    cache: UrlCheckCache | None = None,
     base_url: str | None = None,
 ) -> tuple[list[str], list[str]]:
     "Find links in a HTML document, filter and prioritize them for crawling purposes."
@@ -244,6 +344,7 @@ def filter_links(
         raise ValueError("'base_url' is deprecated, use 'url' instead.")
 
     links, links_priority = [], []
+    matcher = compile_rules(rules) if rules is not None else None
 
     for link in extract_links(
         pagecontent=htmlstring,
@@ -252,16 +353,88 @@ def filter_links(
         language=lang,
         strict=strict,
         with_nav=with_nav,
+        encoding=encoding,
+        cache=cache,
     ):
-        # sanity check
-        if is_not_crawlable(link) or (
-            rules is not None and not rules.can_fetch("*", link)
+        # sanity check, the patterns searched during the checks are not run again
+        categories = scan_url(link, NAVIGATION | NOT_CRAWLABLE)
+        if categories & NOT_CRAWLABLE or (
+            matcher is not None and not matcher.allowed(link)
         ):
             continue
         # store
-        if is_navigation_page(link):
+        if categories & NAVIGATION:
             links_priority.append(link)
         else:
             links.append(link)
 
     return links, links_priority
+
+
+def _process_chunk(
+    func: Callable[..., Any],
+    chunk: list[tuple[str | bytes | memoryview, str | None]],
+    options: dict[str, Any],
+) -> list[Any]:
+    "Run a link extraction function on a chunk of pages."
+    return [func(page, url, **options) for page, url in chunk]
+
+
+def _process_many(
+    func: Callable[..., Any],
+    pages: Iterable[tuple[str | bytes | memoryview, str | None]],
+    options: dict[str, Any],
+    workers: int | None,
+    threads: bool,
+    chunksize: int,
+) -> list[Any]:
+    "Distribute pages in chunks over a pool of workers, keep the input order."
+    if workers == 1:
+        return _process_chunk(func, list(pages), options)
+    chunks: list[list[tuple[str | bytes | memoryview, str | None]]] = [[]]
+    for page, url in pages:
+        if len(chunks[-1]) == chunksize:
+            chunks.append([])
+        # memoryviews cannot be sent to other processes
+        if not threads and isinstance(page, memoryview):
+            page = page.tobytes()
+        chunks[-1].append((page, url))
+    pool = ThreadPoolExecutor if threads else ProcessPoolExecutor
+    with pool(max_workers=workers) as executor:
+        results = executor.map(_process_chunk, repeat(func), chunks, repeat(options))
+        return [result for chunk in results for result in chunk]
+
+
+def extract_links_many(
+    pages: Iterable[tuple[str | bytes | memoryview, str | None]],
+    *,
+    workers: int | None = None,
+    threads: bool = False,
+    chunksize: int = 8,
+    **kwargs: Any,
+) -> list[set[str]]:
+    """Run extract_links() on a batch of (document, URL) pairs in parallel.
+    Args:
+        pages: documents along with their URLs
+        workers: size of the pool (default: number of processors), 1 to run in place
+        threads: use threads instead of processes
+        chunksize: number of pages sent to a worker at once
+        kwargs: further arguments passed to extract_links()
+
+    Returns:
+        A list of sets of links, in the order of the input.
+    """
+    return _process_many(extract_links, pages, kwargs, workers, threads, chunksize)
+
+
+def filter_links_many(
+    pages: Iterable[tuple[str | bytes | memoryview, str | None]],
+    *,
+    workers: int | None = None,
+    threads: bool = False,
+    chunksize: int = 8,
+    **kwargs: Any,
+) -> list[tuple[list[str], list[str]]]:
+    """Run filter_links() on a batch of (document, URL) pairs in parallel,
+    see extract_links_many() for the arguments."""
+    return _process_many(filter_links, pages, kwargs, workers, threads, chunksize)
@@ -10,10 +10,18 @@ from urllib.parse import SplitResult, urlsplit
 
 from babel import Locale, UnknownLocaleError
 
+from .cache import HOST_CACHE
+
 LOGGER = logging.getLogger(__name__)
 
 
 PROTOCOLS = {"http", "https"}
+# common case of urlsplit(): lowercase scheme, plain ASCII host name,
+# no characters which urlsplit() would remove or reject
+SIMPLE_URL = re.compile(
+    r"(https?)://([!$-.0-9:;=@-Z_a-z~]+)(?![^/?#])"
+    r"([^?#\t\n\r]*)(?:\?([^#\t\n\r]*))?(?:#([^\t\n\r]*))?\Z"
+)
 
 # domain/host names
 IP_SET = {
@@ -61,8 +69,8 @@ SITE_STRUCTURE = re.compile(
     r"archives|uploads|modules|attachment|oembed)/|"
     # wordpress + short URL
     r"[/_-](?:tags?|schlagwort|[ck]ategor[a-z]{1,2}|[ck]at|auth?or|user)/[^/]+/?$|"
-    # mixed/blogspot
-    r"[^0-9]/[0-9]+/[0-9]+/$|[^0-9]/[0-9]{4}/$",
+    # mixed/blogspot, the lookbehind lets all branches start with a delimiter
+    r"/(?<=[^0-9]/)(?:[0-9]+/[0-9]+|[0-9]{4})/$",
     re.IGNORECASE,
 )
 FILE_TYPE = re.compile(
@@ -104,6 +112,27 @@ INDEX_PAGE_FILTER = re.compile(
     r".{0,5}/(default|home|index)(\.[a-z]{3,5})?/?$", re.IGNORECASE
 )
 
+# categories of patterns searched by scan_url()
+SITE = 1
+FILES = 2
+ADULT = 4
+NAVIGATION = 8
+NOT_CRAWLABLE = 16
+INDEX_PAGE = 32
+# patterns searched by scan_url(), the index page pattern is matched at the start
+CATEGORY_PATTERNS = (
+    (SITE, SITE_STRUCTURE),
+    (FILES, FILE_TYPE),
+    (ADULT, ADULT_AND_VIDEOS),
+    (NAVIGATION, NAVIGATION_FILTER),
+    (NOT_CRAWLABLE, NOTCRAWLABLE),
+)
+ALL_CATEGORIES = SITE | FILES | ADULT | NAVIGATION | NOT_CRAWLABLE | INDEX_PAGE
+# all of them start with one of these characters, which lets the search skip ahead
+CATEGORY_START = r"(?=[/_.?-])"
+# combined expressions by set of categories and category of each group
+SCANNERS: dict[int, tuple[re.Pattern[str], dict[int, int]]] = {}
+
 # document types
 EXTENSION_REGEX = re.compile(r"\.[a-z]{2,5}$")
 # https://en.wikipedia.org/wiki/List_of_file_formats#Web_page
@@ -141,7 +170,12 @@ def basic_filter(url: str) -> bool:
 
 
 def domain_filter(domain: str) -> bool:
-    "Find invalid domain/host names."
+    "Find invalid domain/host names, the result is computed once per host."
+    return HOST_CACHE.get("domain_filter", domain, _domain_filter, domain)
+
+
+def _domain_filter(domain: str) -> bool:
+    "Run the tests on a domain/host name."
     # no valid FQDN exceeds the DNS length limit
     if len(domain) > 253:
         return False
@@ -226,35 +260,88 @@ def lang_filter(
     return score >= 0
 
 
+def _combine_categories(categories: int) -> tuple[re.Pattern[str], dict[int, int]]:
+    """Combine the patterns of the given categories into one alternation
+    and tell which category each of its top-level groups belongs to."""
+    alternatives = "|".join(
+        f"(?P<c{category}>{pattern.pattern})"
+        for category, pattern in CATEGORY_PATTERNS
+        if category & categories
+    )
+    # all the patterns are case-insensitive
+    scanner = re.compile(f"{CATEGORY_START}(?:{alternatives})", re.IGNORECASE)
+    return scanner, {
+        index: int(name[1:])
+        for name, index in scanner.groupindex.items()
+        if name.startswith("c")
+    }
+
+
+def scan_url(url: str, categories: int = ALL_CATEGORIES) -> int:
+    """Tell which of the given categories of patterns (site structure, file
+    types, adult content, navigation, not crawlable, index page) match the
+    URL, as a combination of flags. All categories are searched at once:
+    the search goes on from a match for the categories not found yet."""
+    found = (
+        INDEX_PAGE if categories & INDEX_PAGE and INDEX_PAGE_FILTER.match(url) else 0
+    )
+    remaining = categories & ~INDEX_PAGE
+    position = 0
+    while remaining:
+        try:
+            scanner, groups = SCANNERS[remaining]
+        except KeyError:
+            scanner, groups = SCANNERS[remaining] = _combine_categories(remaining)
+        match = scanner.search(url, position)
+        if match is None:
+            break
+        # other categories do not match before this position
+        category = groups[match.lastindex]  # type: ignore[index]
+        found |= category
+        remaining &= ~category
+        position = match.start()
+    return found
+
+
 def path_filter(urlpath: str, query: str) -> bool:
     "Filters based on URL path: index page, imprint, etc."
-    if NOTCRAWLABLE.search(urlpath):
+    categories = scan_url(urlpath, NOT_CRAWLABLE | INDEX_PAGE)
+    if categories & NOT_CRAWLABLE:
         return False
-    return bool(not INDEX_PAGE_FILTER.match(urlpath) or query)
+    return bool(not categories & INDEX_PAGE or query)
 
 
 def type_filter(url: str, strict: bool = False, with_nav: bool = False) -> bool:
     """Make sure the target URL is from a suitable type (HTML page with primarily text).
     Strict: Try to filter out other document types, spam, video and adult websites."""
-    if (
-        # feeds + blogspot
-        url.endswith(("/feed", "/rss", "_archive.html"))
-        or
+    # feeds + blogspot
+    if url.endswith(("/feed", "/rss", "_archive.html")):
+        return False
+    categories = scan_url(
+        url,
+        SITE | (NAVIGATION if with_nav else 0) | ((FILES | ADULT) if strict else 0),
+    )
+    return not (
         # website structure
-        (SITE_STRUCTURE.search(url) and (not with_nav or not is_navigation_page(url)))
+        (categories & SITE and not categories & NAVIGATION)
         or
         # type (also hidden in parameters), videos, adult content
-        (strict and (FILE_TYPE.search(url) or ADULT_AND_VIDEOS.search(url)))
-    ):
-        return False
-    # default
-    return True
+        categories & (FILES | ADULT)
+    )
+
+
+def split_url(url: str) -> SplitResult:
+    "Split the URL into its components, same as urlsplit() but faster."
+    match = SIMPLE_URL.match(url)
+    if match:
+        return SplitResult(*match.groups(""))
+    return urlsplit(url)
 
 
 def validate_url(url: str | None) -> tuple[bool, SplitResult | None]:
     "Parse and validate the input."
     try:
-        parsed_url = urlsplit(url)
+        parsed_url = split_url(url) if isinstance(url, str) else urlsplit(url)
     except ValueError:
         return False, None
 
@@ -282,10 +369,10 @@ def is_valid_url(url: str | None) -> bool:
 def is_navigation_page(url: str) -> bool:
     """Determine if the URL is related to navigation and overview pages
     rather than content pages, e.g. /page/1 vs. article page."""
-    return bool(NAVIGATION_FILTER.search(url))
+    return bool(scan_url(url, NAVIGATION))
 
 
 def is_not_crawlable(url: str) -> bool:
     """Run tests to check if the URL may lead to deep web or pages
     generally not usable in a crawling context."""
-    return bool(NOTCRAWLABLE.search(url))
+    return bool(scan_url(url, NOT_CRAWLABLE))
@@ -4,6 +4,8 @@ Meta-functions to be applied module-wide.
 
 import logging
 
+from .cache import HOST_CACHE
+from .checker import get_checker
 from .filters import langcodes_score
 
 LOGGER = logging.getLogger(__name__)
@@ -22,3 +24,5 @@ def clear_caches() -> None:
     This may release some memory."""
     urllib_clear_cache()
     langcodes_score.cache_clear()
+    HOST_CACHE.clear()
+    get_checker.cache_clear()
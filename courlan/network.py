@@ -3,9 +3,19 @@ Functions devoted to requests over the WWW.
 """
 
 import logging
+import sqlite3
+from collections import deque
+from collections.abc import Callable, Iterable
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from threading import Lock
+from time import monotonic, time
+from urllib.parse import urljoin
 
 import urllib3
 
+from .cache import HOST_CACHE_SIZE
+from .filters import split_url
+
 LOGGER = logging.getLogger(__name__)
 # only silence the warning triggered by cert_reqs="CERT_NONE" triggers
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
@@ -36,13 +46,34 @@ RETRY_STRATEGY = urllib3.util.Retry(
     ],  # unofficial: https://en.wikipedia.org/wiki/List_of_HTTP_status_codes#Unofficial_codes
     backoff_factor=1,
 )
+# concurrent requests when resolving redirects in batches, in total and per host
+REDIRECT_WORKERS = 16
+REDIRECT_PER_HOST = 2
+# consecutive failures after which a host is skipped, and for how long (seconds)
+BREAKER_THRESHOLD = 3
+BREAKER_COOLDOWN = 300.0
+# time during which redirect targets and failures are remembered (seconds)
+REDIRECT_TTL = 3600.0
+REDIRECT_NEGATIVE_TTL = 300.0
+REDIRECT_CACHE_SIZE = 100000
+# number of writes between two clean-ups of a persistent cache
+PRUNE_INTERVAL = 1000
+
 HTTP_POOL = urllib3.PoolManager(
-    cert_reqs="CERT_NONE", num_pools=100, retries=RETRY_STRATEGY, timeout=10
+    cert_reqs="CERT_NONE",
+    num_pools=100,
+    maxsize=REDIRECT_PER_HOST,
+    retries=RETRY_STRATEGY,
+    timeout=10,
 )
 
 ACCEPTABLE_CODES = {200, 300, 301, 302, 303, 304, 305, 306, 307, 308}
 
 
+class UnreachableError(ValueError):
+    "The host of a URL cannot be reached."
+
+
 # Test redirects
 def redirection_test(url: str) -> str:
     """Test final URL to handle redirects
@@ -53,7 +84,8 @@ def redirection_test(url: str) -> str:
         The final URL seen.
 
     Raises:
-        ValueError: if the URL cannot be reached or returns an unacceptable status.
+        UnreachableError: if the URL cannot be reached.
+        ValueError: if the URL returns an unacceptable status.
     """
     # headers.update({
     #    "User-Agent" : str(sample(settings.USER_AGENTS, 1)), # select a random user agent
@@ -62,11 +94,309 @@ def redirection_test(url: str) -> str:
         rhead = HTTP_POOL.request("HEAD", url)
     except Exception as err:
         LOGGER.warning("cannot reach URL: %s %s", url, err)
-        raise ValueError(f"cannot reach URL: {url}") from err
+        raise UnreachableError(f"cannot reach URL: {url}") from err
     # response
     if rhead.status in ACCEPTABLE_CODES:
         # geturl() works across urllib3 1.26+/2.x; in 2.x it is Optional[str]
-        final_url = rhead.geturl() or url
+        # and only holds the path if there was no redirect
+        final_url = urljoin(url, rhead.geturl() or url)
         LOGGER.debug("result found: %s %s", final_url, rhead.status)
         return final_url
     raise ValueError(f"cannot reach URL: {url}")
+
+
+def _host(url: str) -> str:
+    "Get the lowercased host of a URL, if any."
+    try:
+        return split_url(url).netloc.lower()
+    except ValueError:
+        return ""
+
+
+class HostBreaker:
+    """Count consecutive failures to reach each host. After a given number
+    of them the host is skipped during a cool-down, then a single request is
+    let through to test it again."""
+
+    __slots__ = ("clock", "cooldown", "threshold", "_failures", "_lock", "_skipped")
+
+    def __init__(
+        self,
+        threshold: int = BREAKER_THRESHOLD,
+        cooldown: float = BREAKER_COOLDOWN,
+        clock: Callable[[], float] = monotonic,
+    ) -> None:
+        self.clock: Callable[[], float] = clock
+        self.cooldown: float = cooldown
+        self.threshold: int = threshold
+        self._failures: dict[str, int] = {}
+        self._lock: Lock = Lock()
+        # hosts and time until which they are skipped
+        self._skipped: dict[str, float] = {}
+
+    def allow(self, host: str) -> bool:
+        "Tell if a request can be sent to the host."
+        with self._lock:
+            until = self._skipped.get(host)
+            if until is None:
+                return True
+            now = self.clock()
+            if now < until:
+                return False
+            # let one request through, the next ones wait for its outcome
+            self._skipped[host] = now + self.cooldown
+            return True
+
+    def record(self, host: str, success: bool) -> None:
+        "Register the outcome of a request to the host."
+        with self._lock:
+            if success:
+                self._failures.pop(host, None)
+                self._skipped.pop(host, None)
+                return
+            if len(self._failures) > HOST_CACHE_SIZE:
+                self._failures.clear()
+            failures = self._failures[host] = self._failures.get(host, 0) + 1
+            if failures >= self.threshold:
+                if host not in self._skipped:
+                    LOGGER.warning(
+                        "skipping host after %s failures: %s", failures, host
+                    )
+                self._skipped[host] = self.clock() + self.cooldown
+
+    def skipped(self) -> list[str]:
+        "List the hosts currently skipped."
+        with self._lock:
+            now = self.clock()
+            return [host for host, until in self._skipped.items() if now < until]
+
+
+class RedirectCache:
+    """Bounded store of redirect targets, along with URLs which could not be
+    resolved (stored as None), which expire after a given time. Looking up
+    an unknown or expired URL raises KeyError."""
+
+    __slots__ = ("clock", "maxsize", "negative_ttl", "ttl", "_data", "_lock")
+
+    def __init__(
+        self,
+        ttl: float = REDIRECT_TTL,
+        negative_ttl: float = REDIRECT_NEGATIVE_TTL,
+        maxsize: int = REDIRECT_CACHE_SIZE,
+        clock: Callable[[], float] = monotonic,
+    ) -> None:
+        self.clock: Callable[[], float] = clock
+        self.maxsize: int = maxsize
+        self.negative_ttl: float = negative_ttl
+        self.ttl: float = ttl
+        self._data: dict[str, tuple[str | None, float]] = {}
+        self._lock: Lock = Lock()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __getitem__(self, url: str) -> str | None:
+        target, expiry = self._data[url]
+        if self.clock() >= expiry:
+            with self._lock:
+                self._data.pop(url, None)
+            raise KeyError(url)
+        return target
+
+    def __setitem__(self, url: str, target: str | None) -> None:
+        ttl = self.ttl if target is not None else self.negative_ttl
+        with self._lock:
+            if len(self._data) >= self.maxsize:
+                self._data.clear()
+            self._data[url] = target, self.clock() + ttl
+
+    def clear(self) -> None:
+        "Remove all entries."
+        with self._lock:
+            self._data.clear()
+
+
+class PersistentRedirectCache:
+    """Store of redirect targets and failures in a SQLite database, so that
+    they can be reused across runs and processes. Entries expire after a
+    given time, the oldest ones are removed beyond a given number of URLs.
+    It can be used in place of a RedirectCache."""
+
+    __slots__ = (
+        "clock",
+        "filename",
+        "maxsize",
+        "negative_ttl",
+        "ttl",
+        "_connection",
+        "_lock",
+        "_writes",
+    )
+
+    def __init__(
+        self,
+        filename: str,
+        ttl: float = 7 * 86400,
+        negative_ttl: float = 86400,
+        maxsize: int = 10**7,
+        clock: Callable[[], float] = time,
+    ) -> None:
+        self.clock: Callable[[], float] = clock
+        self.filename: str = filename
+        self.maxsize: int = maxsize
+        self.negative_ttl: float = negative_ttl
+        self.ttl: float = ttl
+        self._lock: Lock = Lock()
+        self._writes: int = 0
+        self._connection: sqlite3.Connection = sqlite3.connect(
+            filename, timeout=30, isolation_level=None, check_same_thread=False
+        )
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS redirects "
+            "(url TEXT PRIMARY KEY, target TEXT, timestamp REAL NOT NULL)"
+        )
+        self._connection.execute(
+            "CREATE INDEX IF NOT EXISTS redirects_timestamp ON redirects (timestamp)"
+        )
+        self.prune()
+
+    def __del__(self) -> None:
+        self.close()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return int(
+                self._connection.execute("SELECT COUNT(*) FROM redirects").fetchone()[0]
+            )
+
+    def __getitem__(self, url: str) -> str | None:
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT target, timestamp FROM redirects WHERE url = ?", (url,)
+            ).fetchone()
+        if row is None:
+            raise KeyError(url)
+        target, timestamp = row
+        ttl = self.ttl if target is not None else self.negative_ttl
+        if self.clock() >= timestamp + ttl:
+            raise KeyError(url)
+        return target
+
+    def __setitem__(self, url: str, target: str | None) -> None:
+        with self._lock:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO redirects VALUES (?, ?, ?)",
+                (url, target, self.clock()),
+            )
+            self._writes += 1
+        if not self._writes % PRUNE_INTERVAL:
+            self.prune()
+
+    def prune(self) -> None:
+        "Remove expired entries and the oldest ones beyond the maximum size."
+        now = self.clock()
+        with self._lock:
+            self._connection.execute(
+                "DELETE FROM redirects WHERE timestamp <= ? "
+                "OR (target IS NULL AND timestamp <= ?)",
+                (now - self.ttl, now - self.negative_ttl),
+            )
+            self._connection.execute(
+                "DELETE FROM redirects WHERE url IN (SELECT url FROM redirects "
+                "ORDER BY timestamp DESC LIMIT -1 OFFSET ?)",
+                (self.maxsize,),
+            )
+
+    def clear(self) -> None:
+        "Remove all entries."
+        with self._lock:
+            self._connection.execute("DELETE FROM redirects")
+
+    def close(self) -> None:
+        "Close the database."
+        if hasattr(self, "_connection"):
+            self._connection.close()
+
+
+class RedirectResolver:
+    """Resolve the redirects of many URLs concurrently with a pool of threads
+    sharing the connection pool, while limiting the number of simultaneous
+    requests to a host. The transport is a function returning the final URL
+    or raising ValueError, UnreachableError if the host cannot be reached;
+    redirection_test() by default. Optionally, hosts which cannot be reached
+    are skipped by a breaker and results are kept in a cache."""
+
+    __slots__ = ("breaker", "cache", "per_host", "transport", "workers")
+
+    def __init__(
+        self,
+        workers: int = REDIRECT_WORKERS,
+        per_host: int = REDIRECT_PER_HOST,
+        transport: Callable[[str], str] = redirection_test,
+        breaker: HostBreaker | None = None,
+        cache: RedirectCache | PersistentRedirectCache | None = None,
+    ) -> None:
+        if workers < 1 or per_host < 1:
+            raise ValueError("at least one request at a time is needed")
+        self.breaker: HostBreaker | None = breaker
+        self.cache: RedirectCache | PersistentRedirectCache | None = cache
+        self.per_host: int = per_host
+        self.transport: Callable[[str], str] = transport
+        self.workers: int = workers
+
+    def resolve_url(self, url: str) -> str | None:
+        "Return the final URL seen or None if the URL cannot be reached."
+        if self.cache is not None:
+            try:
+                return self.cache[url]
+            except KeyError:
+                pass
+        host = _host(url)
+        if self.breaker is not None and not self.breaker.allow(host):
+            LOGGER.debug("host skipped: %s", url)
+            return None
+        target: str | None
+        try:
+            target = self.transport(url)
+        except UnreachableError:
+            target, reached = None, False
+        except ValueError:
+            target, reached = None, True
+        else:
+            reached = True
+        if self.breaker is not None:
+            self.breaker.record(host, reached)
+        if self.cache is not None:
+            self.cache[url] = target
+        return target
+
+    def resolve(self, urls: Iterable[str]) -> dict[str, str | None]:
+        """Resolve the redirects of the URLs, each distinct URL once, and
+        return the final URLs seen, None for URLs which cannot be reached."""
+        queues: dict[str, deque[str]] = {}
+        for url in dict.fromkeys(urls):
+            queues.setdefault(_host(url), deque()).append(url)
+
+        results: dict[str, str | None] = {}
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            pending: dict[Future[str | None], tuple[str, str]] = {}
+
+            def submit(host: str) -> None:
+                "Schedule the next URL of the host."
+                url = queues[host].popleft()
+                pending[executor.submit(self.resolve_url, url)] = host, url
+
+            for host, queue in queues.items():
+                for _ in range(min(self.per_host, len(queue))):
+                    submit(host)
+            # a request to a host is only scheduled when a previous one is done
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    host, url = pending.pop(future)
+                    results[url] = future.result()
+                    if queues[host]:
+                        submit(host)
+        return results
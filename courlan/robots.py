@@ -0,0 +1,208 @@
+"""
+Compiled representation of robots.txt rules: the most specific rule wins
+and wildcards (* and $) are supported, as described in RFC 9309.
+"""
+
+import logging
+import re
+from collections.abc import Iterable
+from urllib.parse import quote, unquote
+from urllib.robotparser import RobotFileParser
+from weakref import WeakKeyDictionary
+
+LOGGER = logging.getLogger(__name__)
+
+# header of the serialized format
+RULES_MAGIC = b"ROBOTS1\n"
+SCHEME_NETLOC_REGEX = re.compile(r"^[a-z][a-z0-9+.-]*://[^/?#]*", re.I)
+
+# compiled rules by parser, along with its modification time and the user agent
+COMPILED_RULES: "WeakKeyDictionary[RobotFileParser, tuple[float, str, RobotsRules]]" = (
+    WeakKeyDictionary()
+)
+
+
+def _encode_path(path: str) -> str:
+    "Bring a path to the form used for comparisons, like RobotFileParser."
+    return quote(unquote(path))
+
+
+def _rule_pattern(path: str) -> re.Pattern[str]:
+    "Translate a rule path with wildcards into a regular expression."
+    anchored = path.endswith("$")
+    if anchored:
+        path = path[:-1]
+    pattern = ".*".join(re.escape(quote(part)) for part in path.split("*"))
+    return re.compile(pattern + r"\Z" if anchored else pattern)
+
+
+class RobotsRules:
+    """Rules of a robots.txt file for a given user agent, compiled into a
+    table of prefixes and patterns for wildcards. The methods mirror those of
+    RobotFileParser so that both can be used interchangeably, the user agent
+    arguments are ignored."""
+
+    __slots__ = (
+        "delay",
+        "disallow_all",
+        "last_checked",
+        "rules",
+        "sitemaps",
+        "_lengths",
+        "_literals",
+        "_wildcards",
+    )
+
+    def __init__(
+        self,
+        rules: Iterable[tuple[str, bool]] = (),
+        delay: float | None = None,
+        last_checked: float = 0,
+        sitemaps: list[str] | None = None,
+        disallow_all: bool = False,
+    ) -> None:
+        self.rules: list[tuple[str, bool]] = sorted(
+            {(path, allow) for path, allow in rules if path}
+        )
+        self.delay: float | None = delay
+        self.disallow_all: bool = disallow_all
+        self.last_checked: float = last_checked
+        self.sitemaps: list[str] | None = sitemaps
+        # plain prefixes are looked up by length, longest first
+        self._literals: dict[str, bool] = {}
+        # rules with wildcards: most specific first, allow wins on equal length
+        self._wildcards: list[tuple[int, bool, re.Pattern[str]]] = []
+        for path, allow in self.rules:
+            if "*" in path or path.endswith("$"):
+                self._wildcards.append((len(path), allow, _rule_pattern(path)))
+            else:
+                prefix = quote(path)
+                self._literals[prefix] = allow or self._literals.get(prefix, False)
+        self._lengths: list[int] = sorted(
+            {len(prefix) for prefix in self._literals}, reverse=True
+        )
+        self._wildcards.sort(key=lambda rule: (-rule[0], not rule[1]))
+
+    def __reduce__(self) -> tuple[type["RobotsRules"], tuple[object, ...]]:
+        return self.__class__, (
+            self.rules,
+            self.delay,
+            self.last_checked,
+            self.sitemaps,
+            self.disallow_all,
+        )
+
+    @classmethod
+    def from_parser(
+        cls, parser: RobotFileParser, useragent: str = "*"
+    ) -> "RobotsRules":
+        "Compile the rules a RobotFileParser holds for the given user agent."
+        # attributes not covered by the type stubs
+        if getattr(parser, "allow_all", False):
+            return cls(last_checked=parser.mtime())
+        # nothing can be fetched until the file has been read
+        if getattr(parser, "disallow_all", False) or not parser.mtime():
+            return cls(last_checked=parser.mtime(), disallow_all=True)
+        entry = next(
+            (e for e in getattr(parser, "entries", []) if e.applies_to(useragent)),
+            getattr(parser, "default_entry", None),
+        )
+        if entry is None:
+            return cls(last_checked=parser.mtime(), sitemaps=parser.site_maps())
+        return cls(
+            [(unquote(line.path), line.allowance) for line in entry.rulelines],
+            delay=entry.delay,
+            last_checked=parser.mtime(),
+            sitemaps=parser.site_maps(),
+        )
+
+    @classmethod
+    def from_text(cls, text: str, useragent: str = "*") -> "RobotsRules":
+        "Parse and compile the content of a robots.txt file."
+        parser = RobotFileParser()
+        parser.parse(text.splitlines())
+        return cls.from_parser(parser, useragent)
+
+    def dumps(self) -> bytes:
+        """Serialize the rules in a compact line-based format: a header with
+        the fetch time, crawl delay and disallow flag, then one line per rule
+        (A or D followed by the path) and per sitemap (S followed by the URL)."""
+        delay = "" if self.delay is None else repr(self.delay)
+        lines = [f"{self.last_checked!r} {delay} {int(self.disallow_all)}"]
+        lines.extend(("A" if allow else "D") + path for path, allow in self.rules)
+        lines.extend("S" + sitemap for sitemap in self.sitemaps or [])
+        return RULES_MAGIC + "\n".join(lines).encode("utf-8")
+
+    @classmethod
+    def loads(cls, data: bytes) -> "RobotsRules":
+        "Restore rules serialized with dumps()."
+        if not data.startswith(RULES_MAGIC):
+            raise ValueError("not a serialized set of robots.txt rules")
+        header, *lines = data[len(RULES_MAGIC) :].decode("utf-8").split("\n")
+        last_checked, delay, disallow_all = header.split(" ")
+        rules, sitemaps = [], []
+        for line in lines:
+            if line[0] == "S":
+                sitemaps.append(line[1:])
+            else:
+                rules.append((line[1:], line[0] == "A"))
+        return cls(
+            rules,
+            delay=(int(delay) if delay.isdigit() else float(delay)) if delay else None,
+            last_checked=float(last_checked),
+            sitemaps=sitemaps or None,
+            disallow_all=disallow_all == "1",
+        )
+
+    def allowed(self, url: str) -> bool:
+        "Tell if the URL can be fetched according to the rules."
+        if self.disallow_all:
+            return False
+        if not self.rules:
+            return True
+        path = _encode_path(SCHEME_NETLOC_REGEX.sub("", url, count=1)) or "/"
+        length, allowed = -1, True
+        for size in self._lengths:
+            if (
+                size <= len(path)
+                and (allow := self._literals.get(path[:size])) is not None
+            ):
+                length, allowed = size, allow
+                break
+        for size, allow, pattern in self._wildcards:
+            if size < length or (size == length and (allowed or not allow)):
+                break
+            if pattern.match(path):
+                return allow
+        return allowed
+
+    def can_fetch(self, useragent: str, url: str) -> bool:
+        "Same as allowed(), with the signature of RobotFileParser.can_fetch()."
+        return self.allowed(url)
+
+    def crawl_delay(self, useragent: str = "*") -> float | None:
+        "Return the crawl delay given in the file, if any."
+        return self.delay if self.last_checked else None
+
+    def mtime(self) -> float:
+        "Return the time the rules were fetched or parsed."
+        return self.last_checked
+
+    def site_maps(self) -> list[str] | None:
+        "Return the sitemaps listed in the file, if any."
+        return self.sitemaps or None
+
+
+def compile_rules(
+    rules: RobotFileParser | RobotsRules, useragent: str = "*"
+) -> RobotsRules:
+    """Return compiled rules for a RobotFileParser, reusing the result as long
+    as the parser has not been updated."""
+    if isinstance(rules, RobotsRules):
+        return rules
+    cached = COMPILED_RULES.get(rules)
+    if cached is not None and cached[:2] == (rules.mtime(), useragent):
+        return cached[2]
+    compiled = RobotsRules.from_parser(rules, useragent)
+    COMPILED_RULES[rules] = rules.mtime(), useragent, compiled
+    return compiled
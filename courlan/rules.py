@@ -0,0 +1,250 @@
+"""
+Rules telling which query parameters to remove, globally or for given hosts,
+loaded from ClearURLs or AdGuard lists. Exact names are looked up in sets and
+patterns are combined into a single regular expression, so that the cost of a
+lookup does not depend on the number of rules.
+"""
+
+import json
+import logging
+import re
+from collections.abc import Iterable, Mapping
+from threading import Lock
+from typing import Any
+
+from .cache import HOST_CACHE_SIZE
+
+LOGGER = logging.getLogger(__name__)
+
+# parameter names used as such, anything else in a rule is a pattern
+PLAIN_NAME = re.compile(r"[\w-]+\Z")
+# ||example.com^$removeparam=utm_source,domain=example.org|example.net
+ADGUARD_RULE = re.compile(r"(?:\|\|([^\^$/]+)\^?)?\$(.*)")
+# commas separate the options, unless they are escaped in a regex
+ADGUARD_OPTIONS = re.compile(r"(?<!\\),")
+
+
+class ParamTable:
+    "Parameter rules of a given scope."
+
+    __slots__ = ("fields", "names", "patterns")
+
+    def __init__(self) -> None:
+        # exact names, lowercased
+        self.names: set[str] = set()
+        # regular expressions matching whole names
+        self.patterns: list[str] = []
+        # regular expressions searched in "name=value" strings (AdGuard)
+        self.fields: list[str] = []
+
+    def __len__(self) -> int:
+        return len(self.names) + len(self.patterns) + len(self.fields)
+
+
+def _combine(patterns: list[str]) -> re.Pattern[str] | None:
+    "Compile a list of patterns into one, if any."
+    if not patterns:
+        return None
+    return re.compile("|".join(f"(?:{p})" for p in dict.fromkeys(patterns)), re.I)
+
+
+class ParamMatcher:
+    "Tell if a query parameter is to be removed, using the rules of a host."
+
+    __slots__ = ("fields", "names", "patterns")
+
+    def __init__(self, tables: Iterable[ParamTable]) -> None:
+        tables = [table for table in tables if table]
+        # the sets are shared with the tables, not copied
+        self.names: tuple[set[str], ...] = tuple(t.names for t in tables if t.names)
+        self.patterns: re.Pattern[str] | None = _combine(
+            [pattern for table in tables for pattern in table.patterns]
+        )
+        self.fields: re.Pattern[str] | None = _combine(
+            [pattern for table in tables for pattern in table.fields]
+        )
+
+    def __call__(self, name: str, value: str) -> bool:
+        "Tell if the parameter with the given lowercased name and value is removed."
+        for names in self.names:
+            if name in names:
+                return True
+        return bool(
+            (self.patterns is not None and self.patterns.fullmatch(name))
+            or (self.fields is not None and self.fields.search(f"{name}={value}"))
+        )
+
+
+class ParamRules:
+    """Set of global and host-specific parameter rules. Rules for a domain
+    also apply to its subdomains. Matchers combining the rules which apply to
+    a host are compiled on first use."""
+
+    __slots__ = ("_global", "_hosts", "_lock", "_matchers", "_providers")
+
+    def __init__(self) -> None:
+        self._global: ParamTable = ParamTable()
+        self._hosts: dict[str, ParamTable] = {}
+        self._lock: Lock = Lock()
+        self._matchers: dict[str, ParamMatcher | None] = {}
+        # tables restricted to URLs matching a pattern (ClearURLs providers)
+        self._providers: list[tuple[re.Pattern[str], ParamTable]] = []
+
+    def __len__(self) -> int:
+        return (
+            len(self._global)
+            + sum(len(table) for table in self._hosts.values())
+            + sum(len(table) for _, table in self._providers)
+        )
+
+    def _tables(self, hosts: Iterable[str]) -> list[ParamTable]:
+        "Get the tables of the given hosts, or the global one."
+        tables = [
+            self._hosts.setdefault(host.lower().lstrip("."), ParamTable())
+            for host in hosts
+        ]
+        return tables or [self._global]
+
+    def add(self, rule: str, hosts: Iterable[str] = (), regex: bool = False) -> None:
+        """Add a rule removing the parameter with the given name, or the
+        parameters whose name matches the given regular expression, either
+        everywhere or on the given hosts and their subdomains."""
+        with self._lock:
+            for table in self._tables(hosts):
+                if regex and not PLAIN_NAME.match(rule):
+                    table.patterns.append(re.compile(rule).pattern)
+                else:
+                    table.names.add(rule.lower())
+            self._matchers.clear()
+
+    def load_clearurls(
+        self, data: Mapping[str, Any] | str, referral: bool = False
+    ) -> int:
+        """Load the providers of a ClearURLs rule file, given as JSON or
+        already decoded. The parameter rules (and the referral marketing
+        rules if asked to) are used, exceptions and redirections are not.
+        Return the number of rules added."""
+        if isinstance(data, str):
+            data = json.loads(data)
+        if not isinstance(data, Mapping):
+            raise ValueError("not a ClearURLs rule file")
+        added = 0
+        with self._lock:
+            for name, provider in data.get("providers", {}).items():
+                rules = list(provider.get("rules", []))
+                if referral:
+                    rules += provider.get("referralMarketing", [])
+                if not rules:
+                    continue
+                pattern = provider.get("urlPattern", ".*")
+                if pattern in (".*", "^.*$"):
+                    table = self._global
+                else:
+                    try:
+                        compiled = re.compile(pattern, re.I)
+                    except re.error:
+                        LOGGER.warning("invalid URL pattern in provider: %s", name)
+                        continue
+                    table = ParamTable()
+                    self._providers.append((compiled, table))
+                for rule in rules:
+                    try:
+                        if PLAIN_NAME.match(rule):
+                            table.names.add(rule.lower())
+                        else:
+                            table.patterns.append(re.compile(rule).pattern)
+                        added += 1
+                    except re.error:
+                        LOGGER.warning("invalid rule in provider %s: %s", name, rule)
+            self._matchers.clear()
+        return added
+
+    def load_adguard(self, lines: Iterable[str]) -> int:
+        """Load the $removeparam rules of an AdGuard filter list, optionally
+        restricted to domains with ||domain^ or domain=. Exception rules,
+        negated domains and other types of rules are skipped.
+        Return the number of rules added."""
+        added = 0
+        with self._lock:
+            for line in lines:
+                line = line.strip()
+                if not line or line.startswith(("!", "#", "@@")):
+                    continue
+                match = ADGUARD_RULE.fullmatch(line)
+                if match is None or "removeparam=" not in match[2]:
+                    continue
+                options = dict(
+                    option.replace("\\,", ",").partition("=")[::2]
+                    for option in ADGUARD_OPTIONS.split(match[2])
+                )
+                param = options["removeparam"]
+                domains = options.get("domain", "").split("|")
+                if not param or any(d.startswith("~") for d in domains):
+                    continue
+                hosts = [d for d in (match[1], *domains) if d]
+                if param.startswith("/"):
+                    # patterns are case-insensitive, flags are not needed
+                    body = param[1:].rpartition("/")[0]
+                    try:
+                        re.compile(body)
+                    except re.error:
+                        LOGGER.warning("invalid AdGuard rule: %s", line)
+                        continue
+                    for table in self._tables(hosts):
+                        table.fields.append(body)
+                else:
+                    for table in self._tables(hosts):
+                        table.names.add(param.lower())
+                added += 1
+            self._matchers.clear()
+        return added
+
+    def matcher(self, host: str | None = None) -> ParamMatcher | None:
+        "Return a matcher for the rules which apply to the host, None if there are none."
+        netloc = host or ""
+        try:
+            return self._matchers[netloc]
+        except KeyError:
+            pass
+        with self._lock:
+            if len(self._matchers) > HOST_CACHE_SIZE:
+                self._matchers.clear()
+            matcher = self._matchers[netloc] = self._compile(netloc)
+        return matcher
+
+    def _compile(self, netloc: str) -> ParamMatcher | None:
+        "Gather the tables which apply to the host and combine them."
+        host = netloc.rpartition("@")[2].lower()
+        if not host.startswith("["):
+            host = host.partition(":")[0]
+        labels = host.split(".")
+        tables = [
+            self._hosts[suffix]
+            for suffix in (".".join(labels[i:]) for i in range(len(labels)))
+            if suffix in self._hosts
+        ]
+        if host:
+            tables.extend(
+                table
+                for pattern, table in self._providers
+                if pattern.match(f"https://{host}/") or pattern.match(f"http://{host}/")
+            )
+        # most hosts share the matcher of the global rules
+        if not tables and netloc:
+            if "" not in self._matchers:
+                self._matchers[""] = self._compile("")
+            return self._matchers[""]
+        tables.append(self._global)
+        return ParamMatcher(tables) if any(tables) else None
+
+    def clear(self) -> None:
+        "Remove all rules."
+        with self._lock:
+            self._global = ParamTable()
+            self._hosts.clear()
+            self._matchers.clear()
+            self._providers.clear()
+
+
+# rules applied by clean_query() and normalize_fragment() on top of the trackers
+TRACKER_RULES = ParamRules()
@@ -0,0 +1,120 @@
+"""
+Versioned binary file format for URL stores: a fixed header points to an index
+of hosts, the URL paths and rules of each host are stored as separate payloads
+and only read on first access.
+"""
+
+import logging
+import os
+import pickle
+import struct
+from threading import Lock
+from typing import Any, BinaryIO
+
+LOGGER = logging.getLogger(__name__)
+
+STORE_MAGIC = b"COURLAN\x00"
+STORE_VERSION = 1
+# magic string, format version, offset of the index
+HEADER = struct.Struct(">8sHQ")
+
+
+def is_store_file(filename: str) -> bool:
+    "Tell if the file uses the binary store format."
+    with open(filename, "rb") as inputfh:
+        return inputfh.read(len(STORE_MAGIC)) == STORE_MAGIC
+
+
+class StoreFile:
+    "Open a binary store file, read its index and give access to the payloads."
+
+    __slots__ = ("filename", "index", "version", "_file", "_lock")
+
+    def __init__(self, filename: str) -> None:
+        self.filename: str = filename
+        self._file: BinaryIO = open(filename, "rb")
+        self._lock: Lock = Lock()
+        header = self._file.read(HEADER.size)
+        if len(header) < HEADER.size or not header.startswith(STORE_MAGIC):
+            self.close()
+            raise ValueError(f"not a URL store file: {filename}")
+        _, self.version, offset = HEADER.unpack(header)
+        if self.version > STORE_VERSION:
+            self.close()
+            raise ValueError(f"unsupported store format version: {self.version}")
+        self._file.seek(offset)
+        self.index: dict[str, Any] = pickle.load(self._file)
+
+    def __del__(self) -> None:
+        self.close()
+
+    def close(self) -> None:
+        "Close the underlying file."
+        if hasattr(self, "_file"):
+            self._file.close()
+
+    def read(self, offset: int, length: int) -> bytes:
+        "Read a payload from the file."
+        if hasattr(os, "pread"):
+            return os.pread(self._file.fileno(), length, offset)
+        with self._lock:  # pragma: no cover
+            self._file.seek(offset)
+            return self._file.read(length)
+
+    def blob(self, ref: tuple[int, int] | None) -> "StoredBlob | None":
+        "Return a lazy reference to a payload."
+        return StoredBlob(self, *ref) if ref is not None else None
+
+
+class StoredBlob:
+    """Reference to a payload which has not been read yet.
+    Pickling it stores the payload itself."""
+
+    __slots__ = ("length", "offset", "source")
+
+    def __init__(self, source: StoreFile, offset: int, length: int) -> None:
+        self.length: int = length
+        self.offset: int = offset
+        self.source: StoreFile = source
+
+    def __reduce__(self) -> tuple[Any, ...]:
+        return bytes, (self.read(),)
+
+    def read(self) -> bytes:
+        "Get the payload as stored on disk."
+        return self.source.read(self.offset, self.length)
+
+
+class StoreWriter:
+    """Write a binary store file: payloads first, then the index. The file
+    is written under a temporary name and moved into place by finish()."""
+
+    __slots__ = ("filename", "size", "_file", "_tmpname")
+
+    def __init__(self, filename: str) -> None:
+        self.filename: str = filename
+        self._tmpname: str = filename + ".tmp"
+        self._file: BinaryIO = open(self._tmpname, "wb")
+        self._file.write(HEADER.pack(STORE_MAGIC, STORE_VERSION, 0))
+        self.size: int = HEADER.size
+
+    def write(self, data: bytes | None) -> tuple[int, int] | None:
+        "Append a payload and return its position."
+        if data is None:
+            return None
+        ref = self.size, len(data)
+        self._file.write(data)
+        self.size += len(data)
+        return ref
+
+    def finish(self, index: dict[str, Any]) -> int:
+        "Write the index, complete the header and return the file size."
+        offset = self.size
+        pickle.dump(index, self._file, protocol=5)
+        self.size = self._file.tell()
+        self._file.seek(0)
+        self._file.write(HEADER.pack(STORE_MAGIC, STORE_VERSION, offset))
+        self._file.close()
+        os.replace(self._tmpname, self.filename)
+        LOGGER.debug("%s bytes written to %s", self.size, self.filename)
+        return self.size
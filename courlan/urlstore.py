@@ -3,8 +3,12 @@ Defines a URL store which holds URLs along with relevant information and entails
 """
 
 import gc
+import io
 import logging
+import os
 import pickle
+import re
+import shutil
 import signal
 import sys
 
@@ -22,24 +26,82 @@ try:
 except ImportError:
     HAS_ZLIB = False
 
+try:
+    import lzma
+
+    HAS_LZMA = True
+except ImportError:
+    HAS_LZMA = False
+
 
 from collections import defaultdict, deque
-from collections.abc import Callable
+from collections.abc import Callable, Iterable, Iterator
+from contextlib import ExitStack
 from datetime import datetime, timedelta
 from enum import Enum
+from itertools import islice
 from operator import itemgetter
-from threading import Lock
-from typing import Any
+from threading import Lock, Thread
+from time import perf_counter
+from typing import IO, Any
 from urllib.robotparser import RobotFileParser
 
 from .clean import normalize_url
-from .core import filter_links
+from .core import UrlCheckCache, filter_links
 from .filters import lang_filter, validate_url
 from .meta import clear_caches
-from .urlutils import get_base_url, get_host_and_path, is_known_link
+from .robots import RULES_MAGIC, RobotsRules, compile_rules
+from .storage import StoredBlob, StoreFile, StoreWriter, is_store_file
+from .urlutils import get_base_url, get_host_and_path, get_tldinfo, is_known_link
 
 LOGGER = logging.getLogger(__name__)
 
+JOURNAL_SUFFIX = ".journal"
+STORED_SETTINGS = ("compressed", "done", "language", "strict", "trailing_slash")
+COMPACTING_SUFFIX = ".compacting"
+# decoded robots.txt rules kept in memory
+RULES_CACHE_SIZE = 1000
+# serialized rules above this size are compressed in compressed mode
+RULES_COMPRESSION_THRESHOLD = 512
+# left by the domain extraction after IP addresses and unknown host names
+PORT_REGEX = re.compile(r":\d+$")
+
+
+def get_site(host: str) -> str:
+    """Return the registered domain a host belongs to (e.g. "example.com" for
+    "https://blog.example.com"), or the bare host name if it cannot be determined.
+    Ports are stripped in both cases."""
+    site = get_tldinfo(host, fast=True)[1] or host.split("://", 1)[-1]
+    return PORT_REGEX.sub("", site)
+
+
+def _open_url_list(source: str | IO[Any], stack: ExitStack) -> IO[str]:
+    """Open a list of URLs for reading as text, the input can be a file name
+    or a file object, either plain or compressed with gzip, bz2 or xz."""
+    if isinstance(source, str):
+        binary: Any = stack.enter_context(open(source, "rb"))
+    elif isinstance(source, io.TextIOBase):
+        return source
+    else:
+        binary = source
+    if not hasattr(binary, "peek"):
+        binary = io.BufferedReader(binary)
+        # same for the buffer, or it closes the stream once collected
+        stack.callback(binary.detach)
+    magic = binary.peek(6)[:6]
+    if magic.startswith(b"\x1f\x8b") and HAS_ZLIB:
+        import gzip
+
+        binary = stack.enter_context(gzip.GzipFile(fileobj=binary))
+    elif magic.startswith(b"BZh") and HAS_BZ2:
+        binary = stack.enter_context(bz2.BZ2File(binary))
+    elif magic.startswith(b"\xfd7zXZ\x00") and HAS_LZMA:
+        binary = stack.enter_context(lzma.LZMAFile(binary))
+    textfile = io.TextIOWrapper(binary, encoding="utf-8", errors="ignore")
+    # do not close a file object owned by the caller
+    stack.callback(textfile.detach)
+    return textfile
+
 
 class Compressor:
     "Use system information on available compression modules and define corresponding methods."
@@ -88,11 +150,12 @@ class DomainEntry:
 
     def __init__(self, state: State = State.OPEN) -> None:
         self.count: int = 0
-        self.rules: bytes | RobotFileParser | None = None
+        # serialized rules, legacy formats: parser object or compressed pickle
+        self.rules: bytes | RobotFileParser | StoredBlob | None = None
         self.state: State = state
         self.timestamp: datetime | None = None
         self.total: int = 0
-        self.tuples: bytes | deque[UrlPathTuple] = deque()
+        self.tuples: bytes | deque[UrlPathTuple] | StoredBlob = deque()
 
 
 class UrlPathTuple:
@@ -109,6 +172,153 @@ class UrlPathTuple:
         return self.urlpath.decode("utf-8")
 
 
+def _copy_tuple(urlpath: bytes, visited: bool) -> UrlPathTuple:
+    "Create a URL path tuple from stored data without decoding it."
+    url = UrlPathTuple.__new__(UrlPathTuple)
+    url.urlpath, url.visited = urlpath, visited
+    return url
+
+
+def _merge_tuples(urls: deque[UrlPathTuple], others: Iterable[UrlPathTuple]) -> None:
+    "Append new URL paths to a deque and carry over the visited flags of known ones."
+    known = {u.urlpath: u for u in urls}
+    paths = {u.path() for u in urls}
+    for other in others:
+        url = known.get(other.urlpath)
+        if url is not None:
+            url.visited = url.visited or other.visited
+        elif not is_known_link(other.path(), paths):
+            url = _copy_tuple(other.urlpath, other.visited)
+            urls.append(url)
+            known[url.urlpath] = url
+            paths.add(url.path())
+
+
+def _read_journal(filename: str) -> Iterator[tuple[Any, ...]]:
+    "Iterate over the records of a journal file, stopping at a truncated tail."
+    with open(filename, "rb") as inputfh:
+        while True:
+            try:
+                yield pickle.load(inputfh)
+            except EOFError:
+                return
+            except (pickle.UnpicklingError, ValueError) as err:
+                LOGGER.warning("Truncated journal record in %s: %s", filename, err)
+                return
+
+
+def _compact_journal(checkpoint: "Checkpoint", segment: str) -> None:
+    """Remove a closed journal segment once the snapshot taken from the store
+    has been written. If this fails the segment is kept, it is replayed by
+    load_store()."""
+    checkpoint.wait()
+    try:
+        if checkpoint.error is not None:
+            raise checkpoint.error
+        os.remove(segment)
+    except Exception as err:
+        LOGGER.error("Compaction of journal segment %s failed: %s", segment, err)
+        return
+    LOGGER.debug("Journal segment %s compacted into %s", segment, checkpoint.filename)
+
+
+class Journal:
+    """Append-only log of the operations performed on a URL store. Once enough
+    records have been written the journal is rotated and a snapshot of the
+    store is written in the background, replacing the closed segment."""
+
+    __slots__ = (
+        "compact_every",
+        "filename",
+        "records",
+        "_file",
+        "_snapshot",
+        "_thread",
+    )
+
+    def __init__(
+        self,
+        filename: str,
+        snapshot: Callable[[], "Checkpoint"],
+        compact_every: int = 100000,
+    ) -> None:
+        self.compact_every: int = compact_every
+        self.filename: str = filename
+        self.records: int = 0
+        self._file = open(filename + JOURNAL_SUFFIX, "wb")
+        self._snapshot: Callable[[], Checkpoint] = snapshot
+        self._thread: Thread | None = None
+
+    def append(self, record: tuple[Any, ...]) -> None:
+        "Write a record to the journal and trigger compaction if necessary."
+        pickle.dump(record, self._file, protocol=5)
+        self._file.flush()
+        self.records += 1
+        if self.records >= self.compact_every:
+            self.compact()
+
+    def compact(self, wait: bool = False) -> None:
+        """Rotate the journal and replace the closed segment with a snapshot of
+        the store, written in the background unless wait is True. Operations
+        are journaled once applied, so the snapshot contains all of them."""
+        if self._thread is not None and self._thread.is_alive():
+            if not wait:
+                return
+            self._thread.join()
+        journal = self.filename + JOURNAL_SUFFIX
+        segment = journal + COMPACTING_SUFFIX
+        self._file.close()
+        if os.path.exists(segment):
+            # left by a failed compaction: keep its records and add the new ones
+            with open(segment, "ab") as outputfh, open(journal, "rb") as inputfh:
+                shutil.copyfileobj(inputfh, outputfh)
+            os.remove(journal)
+        else:
+            os.replace(journal, segment)
+        self._file = open(journal, "wb")
+        self.records = 0
+        self._thread = Thread(
+            target=_compact_journal, args=(self._snapshot(), segment), daemon=True
+        )
+        self._thread.start()
+        if wait:
+            self._thread.join()
+
+    def close(self) -> None:
+        "Close the journal file and wait for a running compaction to finish."
+        self._file.close()
+        if self._thread is not None:
+            self._thread.join()
+
+
+class Checkpoint:
+    """Information about a copy of the store written to disk in the background:
+    file size in bytes, number of hosts, time during which the store was locked
+    and total duration (in seconds)."""
+
+    __slots__ = ("duration", "error", "filename", "hosts", "pause", "size", "_thread")
+
+    def __init__(self, filename: str, hosts: int, pause: float) -> None:
+        self.duration: float | None = None
+        self.error: Exception | None = None
+        self.filename: str = filename
+        self.hosts: int = hosts
+        self.pause: float = pause
+        self.size: int | None = None
+        self._thread: Thread | None = None
+
+    @property
+    def done(self) -> bool:
+        "Tell if the checkpoint has been written."
+        return self._thread is None or not self._thread.is_alive()
+
+    def wait(self) -> "Checkpoint":
+        "Wait until the checkpoint has been written."
+        if self._thread is not None:
+            self._thread.join()
+        return self
+
+
 class UrlStore:
     """Defines a class to store domain-classified URLs and perform checks against it.
 
@@ -119,10 +329,15 @@ class UrlStore:
         "compressed",
         "done",
         "language",
+        "site_index",
         "strict",
         "trailing_slash",
         "urldict",
+        "_checkpoint",
+        "_dirty",
+        "_journal",
         "_lock",
+        "_rules_cache",
     )
 
     def __init__(
@@ -136,10 +351,15 @@ class UrlStore:
         self.compressed: bool = compressed
         self.done: bool = False
         self.language: str | None = language
+        self.site_index: defaultdict[str, set[str]] = defaultdict(set)
         self.strict: bool = strict
         self.trailing_slash: bool = trailing_slash
         self.urldict: defaultdict[str, DomainEntry] = defaultdict(DomainEntry)
+        self._checkpoint: Checkpoint | None = None
+        self._dirty: set[str] | None = None
+        self._journal: Journal | None = None
         self._lock: Lock = Lock()
+        self._rules_cache: dict[str, tuple[Any, RobotsRules]] = {}
 
         def dump_unvisited_urls(num: Any, frame: Any) -> None:
             LOGGER.debug(
@@ -159,14 +379,44 @@ class UrlStore:
                 LOGGER.warning("Cannot set signal handlers outside the main thread")
 
     def __getstate__(self) -> dict[str, Any]:
-        "Return the picklable state, excluding the unpicklable lock."
-        return {slot: getattr(self, slot) for slot in self.__slots__ if slot != "_lock"}
+        "Return the picklable state, excluding the lock and the journal."
+        return {
+            slot: getattr(self, slot)
+            for slot in self.__slots__
+            if not slot.startswith("_")
+        }
 
     def __setstate__(self, state: dict[str, Any]) -> None:
         "Restore state after unpickling and re-create the lock."
         for slot, value in state.items():
             setattr(self, slot, value)
+        self._checkpoint = None
+        self._dirty = None
+        self._journal = None
         self._lock = Lock()
+        self._rules_cache = {}
+        # stores written before the site index existed
+        if "site_index" not in state:
+            self._rebuild_site_index()
+
+    def _index_host(self, host: str) -> None:
+        "Register a host in the site index (to be called with the lock held)."
+        self.site_index[get_site(host)].add(host)
+
+    def _unindex_host(self, host: str) -> None:
+        "Remove a host from the site index (to be called with the lock held)."
+        site = get_site(host)
+        hosts = self.site_index.get(site)
+        if hosts is not None:
+            hosts.discard(host)
+            if not hosts:
+                del self.site_index[site]
+
+    def _rebuild_site_index(self) -> None:
+        "Re-create the site index from the hosts in store."
+        self.site_index = defaultdict(set)
+        for host in self.urldict:
+            self._index_host(host)
 
     def _buffer_urls(
         self, data: list[str], visited: bool = False
@@ -206,8 +456,16 @@ class UrlStore:
         if domain not in self.urldict:
             return deque()
         raw = self.urldict[domain].tuples
+        if isinstance(raw, StoredBlob):  # still on disk
+            raw = raw.read()
+            if self.compressed:
+                self.urldict[domain].tuples = raw
         if isinstance(raw, bytes):  # compressed
-            return COMPRESSOR.decompress(raw)
+            urls = COMPRESSOR.decompress(raw)
+            if not self.compressed:
+                # the host is in use again: keep the live version only
+                self.urldict[domain].tuples = urls
+            return urls
         return raw
 
     def _set_done(self) -> None:
@@ -222,7 +480,7 @@ class UrlStore:
         timestamp: datetime | None = None,
         to_left: deque[UrlPathTuple] | None = None,
         replace: bool = False,
-    ) -> None:
+    ) -> str:
         # http/https switch
         if domain.startswith("http://"):
             candidate = "https" + domain[4:]
@@ -236,10 +494,12 @@ class UrlStore:
                 if candidate in self.urldict:
                     self.urldict[domain] = self.urldict[candidate]
                     del self.urldict[candidate]
+                    self._unindex_host(candidate)
+                    self._index_host(domain)
 
         # load URLs or create entry
         if domain in self.urldict and self.urldict[domain].state is State.BUSTED:
-            return
+            return domain
         if replace and to_right is not None:
             urls = to_right  # skip dedup: store caller's already-mutated deque
         else:
@@ -258,6 +518,10 @@ class UrlStore:
                 )
 
         with self._lock:
+            if domain not in self.urldict:
+                self._index_host(domain)
+            if self._dirty is not None:
+                self._dirty.add(domain)
             if self.compressed:
                 self.urldict[domain].tuples = COMPRESSOR.compress(urls)
             else:
@@ -273,6 +537,7 @@ class UrlStore:
                 self.urldict[domain].state = State.OPEN
                 if self.done:
                     self.done = False
+        return domain
 
     def _search_urls(self, urls: list[str], switch: int | None = None) -> list[str]:
         # init
@@ -308,19 +573,83 @@ class UrlStore:
         if urls:
             for host, urltuples in self._buffer_urls(urls, visited).items():
                 self._store_urls(host, to_right=urltuples)
+                self._log("add", host, urltuples, False)
         if appendleft:
             for host, urltuples in self._buffer_urls(appendleft, visited).items():
                 self._store_urls(host, to_left=urltuples)
+                self._log("add", host, urltuples, True)
+
+    def import_file(
+        self,
+        source: str | IO[Any],
+        presorted: bool = False,
+        visited: bool = False,
+        batch_size: int = 100000,
+    ) -> dict[str, float]:
+        """Stream a list of URLs (one per line, plain or compressed with gzip,
+        bz2 or xz) into the store. At most batch_size lines are held in memory
+        and each host is written once per batch. With presorted=True (input
+        sorted by host), the URLs of a host are collected across batches
+        and written at once. Returns ingestion statistics, the URLs counted
+        are the ones added to the store."""
+        start = perf_counter()
+        known_urls = self.total_url_number()
+        stats: dict[str, float] = {"lines": 0, "urls": 0, "hosts": 0}
+        # URL paths by host, deduplicated across batches
+        pending: dict[str, dict[bytes, UrlPathTuple]] = {}
+
+        def flush(hosts: Iterable[str]) -> None:
+            for host in list(hosts):
+                urltuples = deque(pending.pop(host).values())
+                self._store_urls(host, to_right=urltuples)
+                self._log("add", host, urltuples, False)
+                stats["hosts"] += 1
+
+        with ExitStack() as stack:
+            inputfh = _open_url_list(source, stack)
+            while True:
+                batch = [line.strip() for line in islice(inputfh, batch_size)]
+                if not batch:
+                    break
+                stats["lines"] += len(batch)
+                last = None
+                for host, urltuples in self._buffer_urls(
+                    [line for line in batch if line], visited
+                ).items():
+                    paths = pending.setdefault(host, {})
+                    for url in urltuples:
+                        paths.setdefault(url.urlpath, url)
+                    last = host
+                # the last host of a sorted batch may continue in the next one
+                flush(h for h in pending if not presorted or h != last)
+            flush(pending)
+
+        stats["urls"] = self.total_url_number() - known_urls
+        stats["seconds"] = perf_counter() - start
+        stats["urls_per_second"] = stats["urls"] / max(stats["seconds"], 1e-9)
+        LOGGER.info(
+            "Imported %s URLs from %s lines (%s host writes) in %.2f s: %.0f URLs/s",
+            stats["urls"],
+            stats["lines"],
+            stats["hosts"],
+            stats["seconds"],
+            stats["urls_per_second"],
+        )
+        return stats
 
     def add_from_html(
         self,
-        htmlstring: str,
+        htmlstring: str | bytes | memoryview,
         url: str,
         external: bool = False,
         lang: str | None = None,
         with_nav: bool = True,
+        encoding: str | None = None,
+        cache: UrlCheckCache | None = None,
     ) -> None:
-        "Find links in a HTML document, filter them and add them to the data store."
+        """Find links in a HTML document, filter them and add them to the data store.
+        Raw documents are accepted, their encoding is guessed if not given.
+        A UrlCheckCache can be shared between calls to reuse link checks."""
         # lang = lang or self.language
         base_url = get_base_url(url)
         rules = self.get_rules(base_url)
@@ -332,6 +661,8 @@ class UrlStore:
             rules=rules,
             strict=self.strict,
             with_nav=with_nav,
+            encoding=encoding,
+            cache=cache,
         )
         self.add_urls(urls=links, appendleft=links_priority)
 
@@ -339,7 +670,12 @@ class UrlStore:
         "Declare domains void and prune the store."
         with self._lock:
             for d in domains:
+                if d not in self.urldict:
+                    self._index_host(d)
                 self.urldict[d] = DomainEntry(state=State.BUSTED)
+            if self._dirty is not None:
+                self._dirty.update(domains)
+        self._log("discard", domains)
         self._set_done()
         num = gc.collect()
         LOGGER.debug("%s objects in GC after UrlStore.discard", num)
@@ -348,6 +684,9 @@ class UrlStore:
         "Re-initialize the URL store."
         with self._lock:
             self.urldict = defaultdict(DomainEntry)
+            self.site_index = defaultdict(set)
+            self._rules_cache = {}
+        self._log("reset")
         clear_caches()
         num = gc.collect()
         LOGGER.debug("UrlStore reset, %s objects in GC", num)
@@ -374,6 +713,35 @@ class UrlStore:
         "Return the number of websites for which there are still URLs to visit."
         return len(self.get_unvisited_domains())
 
+    # SITES / REGISTERED DOMAINS
+
+    def get_known_sites(self) -> list[str]:
+        "Return all known registered domains (sites) as a list."
+        return list(self.site_index.keys())
+
+    def get_site_hosts(self, site: str) -> list[str]:
+        """Return the hosts in store belonging to the given registered domain
+        (ex. "example.org"), a host or a URL can also be passed."""
+        if "://" in site:
+            site = get_site(get_base_url(site))
+        return list(self.site_index.get(site, ()))
+
+    def site_url_number(self, site: str) -> int:
+        "Find number of all URLs in store for the given registered domain."
+        return sum(self.urldict[h].total for h in self.get_site_hosts(site))
+
+    def site_download_count(self, site: str) -> int:
+        "Return the total download count across all hosts of a registered domain."
+        return sum(self.urldict[h].count for h in self.get_site_hosts(site))
+
+    def is_exhausted_site(self, site: str) -> bool:
+        "Tell if all known URLs on all hosts of the registered domain have been visited."
+        return all(self.is_exhausted_domain(h) for h in self.get_site_hosts(site))
+
+    def discard_site(self, site: str) -> None:
+        "Declare all hosts of a registered domain void and prune the store."
+        self.discard(self.get_site_hosts(site))
+
     # URL-BASED QUERIES
 
     def find_known_urls(self, domain: str) -> list[str]:
@@ -419,16 +787,27 @@ class UrlStore:
                         url.visited = True
                         with self._lock:
                             self.urldict[domain].count += 1
+                        timestamp = datetime.now()
                         self._store_urls(
-                            domain, url_tuples, timestamp=datetime.now(), replace=True
+                            domain, url_tuples, timestamp=timestamp, replace=True
                         )
+                        self._log_visits(domain, [url.path()], timestamp)
                     return domain + url.path()
         # nothing to draw from
-        with self._lock:
-            self.urldict[domain].state = State.ALL_VISITED
+        self._exhaust_domain(domain)
         self._set_done()
         return None
 
+    def _exhaust_domain(self, domain: str) -> None:
+        "Mark a domain as fully visited, creating its entry if necessary."
+        with self._lock:
+            if domain not in self.urldict:
+                self._index_host(domain)
+            if self._dirty is not None:
+                self._dirty.add(domain)
+            self.urldict[domain].state = State.ALL_VISITED
+        self._log("exhausted", domain)
+
     def get_download_urls(
         self,
         time_limit: float = 10.0,
@@ -500,26 +879,51 @@ class UrlStore:
             total_diff = now + timedelta(0, schedule_secs - time_limit)
             # store new info
             self._store_urls(domain, url_tuples, timestamp=total_diff, replace=True)
+            self._log_visits(domain, urlpaths, total_diff)
         # sort by first tuple element (time in secs)
         self._set_done()
         return sorted(targets, key=itemgetter(0))
 
     # CRAWLING
 
-    def store_rules(self, website: str, rules: RobotFileParser | None) -> None:
-        "Store crawling rules for a given website."
-        if self.compressed:
-            rules = COMPRESSOR.compress(rules)
-        self.urldict[website].rules = rules
-
-    def get_rules(self, website: str) -> RobotFileParser | None:
+    def store_rules(
+        self, website: str, rules: RobotFileParser | RobotsRules | None
+    ) -> None:
+        "Store crawling rules for a given website in a compact form."
+        compiled = compile_rules(rules) if rules is not None else None
+        raw = _encode_rules(compiled, self.compressed)
+        with self._lock:
+            if website not in self.urldict:
+                self._index_host(website)
+            if self._dirty is not None:
+                self._dirty.add(website)
+            self.urldict[website].rules = raw
+            if compiled is not None:
+                self._cache_rules(website, raw, compiled)
+        self._log("rules", website, compiled)
+
+    def _cache_rules(self, website: str, raw: Any, rules: RobotsRules) -> None:
+        "Keep decoded rules along with their source (to be called with the lock held)."
+        if len(self._rules_cache) >= RULES_CACHE_SIZE:
+            del self._rules_cache[next(iter(self._rules_cache))]
+        self._rules_cache[website] = raw, rules
+
+    def get_rules(self, website: str) -> RobotsRules | None:
         "Return the stored crawling rules for the given website."
         if website not in self.urldict:
             return None
         raw = self.urldict[website].rules
-        if isinstance(raw, bytes):  # compressed
-            return COMPRESSOR.decompress(raw)
-        return raw
+        if raw is None:
+            return None
+        # valid as long as the stored rules are the same object
+        cached = self._rules_cache.get(website)
+        if cached is not None and cached[0] is raw:
+            return cached[1]
+        rules = _decode_rules(raw.read() if isinstance(raw, StoredBlob) else raw)
+        with self._lock:
+            if self.urldict[website].rules is raw:
+                self._cache_rules(website, raw, rules)
+        return rules
 
     def get_crawl_delay(self, website: str, default: float = 5) -> float:
         "Return the delay as extracted from robots.txt, or a given default."
@@ -568,16 +972,392 @@ class UrlStore:
                 flush=True,
             )
 
+    # MERGING
+
+    def merge(self, other: "UrlStore") -> None:
+        """Merge another store into this one host by host. URL paths are
+        deduplicated, visited flags, download counts, latest timestamps and
+        rules are kept. The data is taken as is, without new validation or
+        normalization."""
+        # discarded at once after the merge
+        busted: set[str] = set()
+        for host, entry in list(other.urldict.items()):
+            if entry.state is State.BUSTED:
+                busted.add(host)
+                continue
+            # http/https variants share an entry
+            if host.startswith("https://"):
+                variants = (host, "http" + host[5:])
+            else:
+                variants = (host, "https" + host[4:])
+            if not busted.isdisjoint(variants):
+                continue
+            known = next((h for h in variants if h in self.urldict), None)
+            if known is None:
+                urls: deque[UrlPathTuple] = deque()
+                count, timestamp = entry.count, entry.timestamp
+            else:
+                current = self.urldict[known]
+                if current.state is State.BUSTED:
+                    continue
+                urls = self._load_urls(known)
+                count = current.count + entry.count
+                timestamp = max(
+                    (t for t in (current.timestamp, entry.timestamp) if t),
+                    default=None,
+                )
+            _merge_tuples(urls, other._load_urls(host))
+            # the https variant wins as with add_urls()
+            target = self._store_urls(host, urls, timestamp=timestamp, replace=True)
+            with self._lock:
+                self.urldict[target].count = count
+            self._log("host", target, urls, count, timestamp)
+            rules = other.get_rules(host)
+            if rules is not None and self.urldict[target].rules is None:
+                self.store_rules(target, rules)
+        if busted:
+            self.discard(sorted(busted))
+        self._set_done()
+
+    def merge_files(self, filenames: list[str]) -> None:
+        "Load stores from disk one after another and merge them into this one."
+        for filename in filenames:
+            self.merge(load_store(filename))
+
     # PERSISTANCE
 
-    def write(self, filename: str) -> None:
-        "Write the URL store to disk."
+    def write(self, filename: str, binary: bool = False) -> None:
+        """Write the URL store to disk. With binary=True a versioned format is
+        used which allows for loading the URLs of each host on demand."""
+        if binary:
+            self._write_binary(filename)
+            return
         with open(filename, "wb") as output:
             pickle.dump(self, output)
 
+    def _write_binary(self, filename: str) -> int:
+        "Write the store in binary format and return the file size."
+        return self.checkpoint(filename, wait=True).size or 0
+
+    def _freeze(self) -> dict[str, tuple[Any, ...]]:
+        """Take a consistent copy of the host data (to be called with the lock held).
+        Only live URL lists are copied, compressed and on-disk data is immutable
+        and shared as is. Changes are tracked from then on."""
+        frozen = {}
+        for host, entry in self.urldict.items():
+            tuples: Any = entry.tuples
+            if isinstance(tuples, deque):
+                tuples = [(u.urlpath, u.visited) for u in tuples]
+            frozen[host] = (
+                entry.count,
+                entry.state.value,
+                entry.timestamp,
+                entry.total,
+                tuples,
+                entry.rules,
+            )
+        self._dirty = set()
+        return frozen
+
+    def checkpoint(self, filename: str, wait: bool = False) -> Checkpoint:
+        """Write the store to disk in binary format without blocking it: only
+        live URL lists are copied, serialization happens in a background thread.
+        Hosts left unchanged in the meantime then keep their compressed form only,
+        until they are used again. Returns information on the checkpoint,
+        use its wait() method to block until it has been written."""
+        if self._checkpoint is not None:
+            self._checkpoint.wait()
+        start = perf_counter()
+        with self._lock:
+            frozen = self._freeze()
+            settings = {slot: getattr(self, slot) for slot in STORED_SETTINGS}
+            sites = {site: set(hosts) for site, hosts in self.site_index.items()}
+        checkpoint = Checkpoint(filename, len(frozen), perf_counter() - start)
+
+        def write_checkpoint() -> None:
+            try:
+                checkpoint.size, compressed = _write_hosts(
+                    filename, frozen.items(), {"settings": settings, "sites": sites}
+                )
+            except Exception as err:
+                LOGGER.error("Checkpoint %s failed: %s", filename, err)
+                checkpoint.error = err
+            else:
+                self._set_cold(compressed)
+            checkpoint.duration = perf_counter() - start
+            LOGGER.info(
+                "Checkpoint %s: %s hosts, %s bytes, %.3f s (store locked %.3f s)",
+                filename,
+                checkpoint.hosts,
+                checkpoint.size,
+                checkpoint.duration,
+                checkpoint.pause,
+            )
+
+        checkpoint._thread = Thread(target=write_checkpoint, daemon=True)
+        checkpoint._thread.start()
+        self._checkpoint = checkpoint
+        return checkpoint.wait() if wait else checkpoint
+
+    def _set_cold(self, compressed: dict[str, bytes]) -> None:
+        """Replace the live URL lists of hosts left unchanged since they were
+        frozen by their compressed version."""
+        with self._lock:
+            for host, payload in compressed.items():
+                entry = self.urldict.get(host)
+                if (
+                    entry is not None
+                    and isinstance(entry.tuples, deque)
+                    and self._dirty is not None
+                    and host not in self._dirty
+                ):
+                    entry.tuples = payload
+
+    def _log(self, *record: Any) -> None:
+        "Append an operation to the journal if one is active."
+        if self._journal is not None:
+            self._journal.append(record)
+
+    def _log_visits(
+        self, domain: str, urlpaths: list[str], timestamp: datetime
+    ) -> None:
+        """Journal visited paths along with the resulting count and timestamp,
+        the latter changes even if no path has been visited."""
+        if self._journal is not None:
+            self._journal.append(
+                ("visit", domain, urlpaths, self.urldict[domain].count, timestamp)
+            )
+
+    def _replay(self, record: tuple[Any, ...]) -> None:
+        "Apply a journal record to the store."
+        operation, args = record[0], record[1:]
+        if operation == "add":
+            host, urltuples, left = args
+            if left:
+                self._store_urls(host, to_left=urltuples)
+            else:
+                self._store_urls(host, to_right=urltuples)
+        elif operation == "visit":
+            # absolute values: replaying a record twice is harmless
+            host, urlpaths, count, timestamp = args
+            if host not in self.urldict:
+                return
+            url_tuples = self._load_urls(host)
+            paths = set(urlpaths)
+            for url in url_tuples:
+                if url.path() in paths:
+                    url.visited = True
+            self.urldict[host].count = count
+            self._store_urls(host, url_tuples, timestamp=timestamp, replace=True)
+        elif operation == "host":
+            host, url_tuples, count, timestamp = args
+            host = self._store_urls(host, url_tuples, timestamp=timestamp, replace=True)
+            self.urldict[host].count = count
+        elif operation == "rules":
+            self.store_rules(*args)
+        elif operation == "exhausted":
+            self._exhaust_domain(*args)
+        elif operation == "discard":
+            self.discard(*args)
+        elif operation == "reset":
+            self.reset()
+        else:
+            LOGGER.warning("Unknown journal record: %s", operation)
+
+    def replay_journal(self, filename: str) -> int:
+        "Apply the operations recorded in a journal file, return their number."
+        num = 0
+        for record in _read_journal(filename):
+            self._replay(record)
+            num += 1
+        self._set_done()
+        return num
+
+    def start_journal(self, filename: str, compact_every: int = 100000) -> None:
+        """Write a snapshot of the store to the given file and record all
+        subsequent changes in an append-only journal next to it. Every
+        compact_every operations the journal is replaced by a checkpoint of
+        the store written in the background. Use load_store(filename) to recover."""
+        self.close_journal()
+        checkpoint = self.checkpoint(filename, wait=True)
+        if checkpoint.error is not None:
+            raise checkpoint.error
+        segment = filename + JOURNAL_SUFFIX + COMPACTING_SUFFIX
+        if os.path.exists(segment):
+            os.remove(segment)
+        self._journal = Journal(
+            filename, lambda: self.checkpoint(filename), compact_every
+        )
+
+    def compact_journal(self, wait: bool = True) -> None:
+        "Replace the current journal with a checkpoint of the store."
+        if self._journal is not None:
+            self._journal.compact(wait=wait)
+
+    def close_journal(self) -> None:
+        "Stop journaling, the snapshot and journal files stay consistent."
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
+
+
+def _encode_rules(rules: RobotsRules | None, compressed: bool) -> bytes | None:
+    "Serialize robots.txt rules, compress them if they are large enough."
+    if rules is None:
+        return None
+    raw = rules.dumps()
+    if compressed and len(raw) > RULES_COMPRESSION_THRESHOLD:
+        return COMPRESSOR.compressor(raw)
+    return raw
+
+
+def _decode_rules(raw: Any) -> RobotsRules:
+    "Restore stored robots.txt rules, including legacy formats."
+    if isinstance(raw, bytes):
+        if not raw.startswith(RULES_MAGIC):
+            raw = COMPRESSOR.decompressor(raw)
+        if raw.startswith(RULES_MAGIC):
+            return RobotsRules.loads(raw)
+        # pickled parser
+        raw = pickle.loads(raw)
+    return compile_rules(raw)
+
+
+def _get_payload(raw: Any) -> bytes | None:
+    "Serialize host data for the binary format, reusing compressed data."
+    if raw is None or isinstance(raw, bytes):
+        return raw
+    if isinstance(raw, StoredBlob):
+        return raw.read()
+    if isinstance(raw, list):  # frozen URL paths
+        raw = deque(_copy_tuple(urlpath, visited) for urlpath, visited in raw)
+    return COMPRESSOR.compress(raw)
+
+
+def _write_hosts(
+    filename: str,
+    hosts: Iterable[tuple[str, tuple[Any, ...]]],
+    index: dict[str, Any],
+    keep: bool = True,
+) -> tuple[int, dict[str, bytes]]:
+    """Write host data to a file in binary format, return the file size
+    and, if required, the compressed form of the URL lists given as lists."""
+    writer = StoreWriter(filename)
+    compressed, positions = {}, {}
+    for host, (count, state, timestamp, total, urls, rules) in hosts:
+        tuples, rules = _get_payload(urls), _get_payload(rules)
+        if keep and isinstance(urls, list) and tuples is not None:
+            compressed[host] = tuples
+        positions[host] = (
+            count,
+            state,
+            timestamp,
+            total,
+            writer.write(tuples),
+            writer.write(rules),
+        )
+    index["hosts"] = positions
+    return writer.finish(index), compressed
+
+
+def _load_binary(filename: str) -> UrlStore:
+    "Open a store in binary format, the data of each host is read on first access."
+    source = StoreFile(filename)
+    url_store = UrlStore()
+    for slot, value in source.index["settings"].items():
+        setattr(url_store, slot, value)
+    for host, values in source.index["hosts"].items():
+        count, state, timestamp, total, tuples_ref, rules_ref = values
+        entry = DomainEntry(state=State(state))
+        entry.count, entry.timestamp, entry.total = count, timestamp, total
+        entry.tuples = source.blob(tuples_ref) or deque()
+        entry.rules = source.blob(rules_ref)
+        url_store.urldict[host] = entry
+    url_store.site_index = defaultdict(set, source.index["sites"])
+    source.index = {}
+    return url_store
+
+
+def _open_store(filename: str) -> UrlStore:
+    "Load a store written in binary or pickle format."
+    if is_store_file(filename):
+        return _load_binary(filename)
+    with open(filename, "rb") as inputfh:
+        url_store: UrlStore = pickle.load(inputfh)
+    return url_store
+
 
 def load_store(filename: str) -> UrlStore:
-    "Load a URL store from disk."
-    with open(filename, "rb") as output:
-        url_store = pickle.load(output)
+    """Load a URL store from disk, replaying the operations
+    recorded in a journal if the store was journaled."""
+    url_store = _open_store(filename)
+    journal = filename + JOURNAL_SUFFIX
+    # closed segment pending compaction first, then the current journal
+    for segment in (journal + COMPACTING_SUFFIX, journal):
+        if os.path.exists(segment):
+            num = url_store.replay_journal(segment)
+            LOGGER.debug("%s journal records replayed from %s", num, segment)
     return url_store
+
+
+def convert_store(source: str, destination: str) -> int:
+    "Convert a pickled URL store to the binary format, return the file size."
+    return _open_store(source)._write_binary(destination)
+
+
+def _merge_stored_hosts(
+    parts: list[tuple[StoreFile, tuple[Any, ...]]],
+) -> tuple[Any, ...]:
+    "Merge the data of a host stored in several files."
+    if any(values[1] == State.BUSTED.value for _, values in parts):
+        return 0, State.BUSTED.value, None, 0, deque(), None
+    urls: deque[UrlPathTuple] = deque()
+    count, timestamp, rules = 0, None, None
+    for source, (num, _, stamp, _, tuples_ref, rules_ref) in parts:
+        if tuples_ref is not None:
+            _merge_tuples(urls, COMPRESSOR.decompress(source.read(*tuples_ref)))
+        count += num
+        if stamp is not None and (timestamp is None or stamp > timestamp):
+            timestamp = stamp
+        if rules is None and rules_ref is not None:
+            rules = source.read(*rules_ref)
+    state = State.ALL_VISITED if all(u.visited for u in urls) else State.OPEN
+    return count, state.value, timestamp, len(urls), urls, rules
+
+
+def merge_store_files(filenames: list[str], destination: str) -> int:
+    """Merge stores written in binary format into a new file, one host at a
+    time so that memory use does not depend on the size of the stores.
+    Returns the size of the new file."""
+    sources = [StoreFile(filename) for filename in filenames]
+    groups: dict[str, list[tuple[StoreFile, tuple[Any, ...]]]] = {}
+    for source in sources:
+        for host, values in source.index["hosts"].items():
+            groups.setdefault(host, []).append((source, values))
+    # http/https variants share an entry
+    for host in [h for h in groups if h.startswith("http://")]:
+        if "https" + host[4:] in groups:
+            groups["https" + host[4:]].extend(groups.pop(host))
+    sites: defaultdict[str, set[str]] = defaultdict(set)
+    for host in groups:
+        sites[get_site(host)].add(host)
+    settings = dict(sources[0].index["settings"]) if sources else {}
+
+    def merged_hosts() -> Iterator[tuple[str, tuple[Any, ...]]]:
+        settings["done"] = True
+        for host, parts in groups.items():
+            values = _merge_stored_hosts(parts)
+            if values[1] == State.OPEN.value:
+                settings["done"] = False
+            yield host, values
+
+    # the index is written last, once all hosts have been merged
+    size, _ = _write_hosts(
+        destination,
+        merged_hosts(),
+        {"settings": settings, "sites": dict(sites)},
+        keep=False,
+    )
+    for source in sources:
+        source.close()
+    return size
@@ -8,6 +8,8 @@ from urllib.parse import SplitResult, urljoin, urlsplit, urlunsplit
 
 from tld import Result, get_tld
 
+from .cache import HOST_CACHE
+
 DOMAIN_REGEX = re.compile(
     r"(?:(?:f|ht)tp)s?://"  # protocols
     r"(?:[^/?#]{,63}\.)?"  # subdomain, www, etc.
@@ -18,7 +20,11 @@ DOMAIN_REGEX = re.compile(
 )
 STRIP_PORT_REGEX = re.compile(r"(?<=\D):\d+")
 CLEAN_FLD_REGEX = re.compile(r"^www[0-9]*\.")
+# scheme, host and the following character: all get_tldinfo() looks at
+HOST_PREFIX_REGEX = re.compile(r"[^/?#]*://[^/?#]*[/?#]?")
 FEED_WHITELIST_REGEX = re.compile(r"(?:feed(?:burner|proxy))", re.I)
+# characters removed or stripped by urllib.parse
+UNSAFE_CHARS = frozenset(chr(i) for i in range(33)) | {"\x7f"}
 
 
 def get_tldinfo(url: str, fast: bool = False) -> tuple[str | None, str | None]:
@@ -26,6 +32,16 @@ def get_tldinfo(url: str, fast: bool = False) -> tuple[str | None, str | None]:
     With ``fast=True`` a regex shortcut is tried before the ``tld`` library."""
     if not url or not isinstance(url, str):
         return None, None
+    prefix = HOST_PREFIX_REGEX.match(url)
+    if prefix is None:
+        return _get_tldinfo(url, fast)
+    return HOST_CACHE.get(
+        "get_tldinfo", (prefix[0], fast), _get_tldinfo, prefix[0], fast
+    )
+
+
+def _get_tldinfo(url: str, fast: bool) -> tuple[str | None, str | None]:
+    "Extract domain info from the URL or from its beginning."
     if fast:
         # try with regexes
         domain_match = DOMAIN_REGEX.match(url)
@@ -120,6 +136,66 @@ def fix_relative_urls(baseurl: str, url: str) -> str:
     return urljoin(baseurl, url)
 
 
+class LinkContext:
+    """Information on the page links are found on, computed once and reused
+    for every link: parsed base URL (from a <base href> if given) and
+    domain of the host reference for external/internal evaluation."""
+
+    __slots__ = ("base", "netloc", "prefix", "reference", "scheme", "stripped_ref")
+
+    def __init__(
+        self, url: str, reference: str | None = None, base_href: str | None = None
+    ) -> None:
+        self.base: str = urljoin(url, base_href) if base_href else url
+        parsed_base = urlsplit(self.base)
+        self.netloc: str = parsed_base.netloc
+        self.scheme: str = parsed_base.scheme
+        # absolute paths can be appended to this prefix
+        self.prefix: str | None = (
+            f"{self.scheme}://{self.netloc}"
+            if self.scheme in ("http", "https") and self.netloc
+            else None
+        )
+        self.stripped_ref: str | None
+        self.reference: str | None
+        self.stripped_ref, self.reference = get_tldinfo(
+            reference or get_base_url(url), fast=True
+        )
+
+    def fix_relative(self, url: str) -> str:
+        "Prepend protocol and host information to relative links, see fix_relative_urls()."
+        # fast path for plain absolute paths
+        if (
+            self.prefix is not None
+            and url[:1] == "/"
+            and url[1:2] != "/"
+            and "/." not in url
+            and url[-1] not in "?#"
+            and "?#" not in url
+            and ";" not in url
+            and not UNSAFE_CHARS.intersection(url)
+        ):
+            return self.prefix + url
+
+        if url.startswith("{"):
+            return url
+
+        split_url = urlsplit(url)
+        if split_url.netloc not in (self.netloc, ""):
+            if split_url.scheme:
+                return url
+            return urlunsplit(split_url._replace(scheme=self.scheme or "http"))
+
+        return urljoin(self.base, url)
+
+    def is_external(self, url: str, ignore_suffix: bool = True) -> bool:
+        "Determine if a link leads to another host, see is_external()."
+        stripped_domain, domain = get_tldinfo(url, fast=True)
+        if ignore_suffix:
+            return stripped_domain != self.stripped_ref
+        return domain != self.reference
+
+
 def filter_urls(link_list: list[str], urlfilter: str | None) -> list[str]:
     "Return a list of links corresponding to the given substring pattern."
     if urlfilter is None:
@@ -2,23 +2,37 @@
 Unit tests for the courlan package.
 """
 
+import codecs
 import io
+import json
 import logging
 import os
+import pickle
+import random
+import re
 import subprocess
 import sys
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import redirect_stdout
+from html import unescape
+from time import perf_counter, sleep
 from unittest.mock import MagicMock, patch
 from urllib.parse import SplitResult, urlsplit
+from urllib.robotparser import RobotFileParser
 
 import pytest
 
 from courlan import (
     check_url,
+    check_urls,
     clean_url,
     cli,
     extract_domain,
     extract_links,
+    extract_links_many,
+    filter_links_many,
     filter_urls,
     fix_relative_urls,
     get_base_url,
@@ -34,17 +48,57 @@ from courlan import (
     scrub_url,
     validate_url,
 )
-from courlan.core import filter_links
+from courlan.cache import HOST_CACHE, HostCache
+from courlan.checker import FilterStage, UrlChecker, get_checker
+from courlan.clean import (
+    _clean_query,
+    _is_normalized,
+    _normalize_url,
+    clean_query,
+    decode_punycode,
+    normalize_host,
+)
+from courlan.core import UrlCheckCache, _extract_candidates, filter_links
 from courlan.filters import (
+    ADULT,
+    ADULT_AND_VIDEOS,
+    ALL_CATEGORIES,
+    FILE_TYPE,
+    FILES,
+    INDEX_PAGE,
+    INDEX_PAGE_FILTER,
+    NAVIGATION,
+    NAVIGATION_FILTER,
+    NOT_CRAWLABLE,
+    NOTCRAWLABLE,
+    SCANNERS,
+    SITE,
     domain_filter,
     extension_filter,
     langcodes_score,
     path_filter,
+    scan_url,
+    split_url,
     type_filter,
 )
 from courlan.meta import clear_caches
-from courlan.network import redirection_test
-from courlan.urlutils import _parse, is_known_link
+from courlan.network import (
+    HostBreaker,
+    PersistentRedirectCache,
+    RedirectCache,
+    RedirectResolver,
+    UnreachableError,
+    redirection_test,
+)
+from courlan.robots import RobotsRules, compile_rules
+from courlan.rules import TRACKER_RULES, ParamRules
+from courlan.urlutils import (
+    LinkContext,
+    _get_tldinfo,
+    _parse,
+    get_tldinfo,
+    is_known_link,
+)
 
 logging.basicConfig(stream=sys.stdout, level=logging.DEBUG)
 RESOURCES_DIR = os.path.join(os.path.abspath(os.path.dirname(__file__)), "data")
@@ -153,6 +207,47 @@ def test_fix_relative():
     assert fix_relative_urls("https://www.example.org", "{privacy}") == "{privacy}"
 
 
+def test_link_context():
+    "The page context gives the same results as the standalone functions."
+    links = [
+        "page.html",
+        "/page.html",
+        "/",
+        "/a/../b",
+        "/a/./b?c=d#e",
+        "/a?",
+        "/a;p",
+        "/a\tb",
+        "//example.org/test.html",
+        "//www.eff.org",
+        "../../test.html",
+        "{privacy}",
+        "https://www.eff.org",
+        "www.eff.org",
+        "?q=1",
+        "#top",
+    ]
+    for base in (
+        "https://example.org",
+        "http://www.example.org/dir/subdir/file.html?q=1",
+        "https://example.org:8080/dir/",
+        "",
+    ):
+        context = LinkContext(base)
+        for link in links:
+            assert context.fix_relative(link) == fix_relative_urls(base, link)
+    context = LinkContext("https://example.org/dir/page", base_href="/other/")
+    assert context.fix_relative("page.html") == "https://example.org/other/page.html"
+    assert context.fix_relative("/page") == "https://example.org/page"
+    for url in ("https://www.example.org/test", "https://example.com", "h1234"):
+        for ignore_suffix in (True, False):
+            assert LinkContext("https://example.org/page").is_external(
+                url, ignore_suffix
+            ) == is_external(url, "https://example.org", ignore_suffix)
+    context = LinkContext("https://example.org/page", reference="https://test.com")
+    assert context.is_external("https://example.org/page") is True
+
+
 def test_scrub():
     # clean: scrub + normalize
     assert clean_url(5) is None
@@ -490,6 +585,49 @@ def test_navigation():
     assert is_not_crawlable("https://test.org/page") is False
 
 
+def test_scan_url():
+    "All pattern categories give the same results as separate searches."
+    # former expression for site structures
+    site_structure = re.compile(
+        r"/(?:wp-(?:admin|content|includes|json|themes)|"
+        r"paged?|seite|search|suche|gall?er[a-z]{1,2}|labels|"
+        r"archives|uploads|modules|attachment|oembed)/|"
+        r"[/_-](?:tags?|schlagwort|[ck]ategor[a-z]{1,2}|[ck]at|auth?or|user)/[^/]+/?$|"
+        r"[^0-9]/[0-9]+/[0-9]+/$|[^0-9]/[0-9]{4}/$",
+        re.I,
+    )
+    patterns = (
+        (SITE, site_structure.search),
+        (FILES, FILE_TYPE.search),
+        (ADULT, ADULT_AND_VIDEOS.search),
+        (NAVIGATION, NAVIGATION_FILTER.search),
+        (NOT_CRAWLABLE, NOTCRAWLABLE.search),
+        (INDEX_PAGE, INDEX_PAGE_FILTER.match),
+    )
+    rng = random.Random(0)
+    chars = "/0123456789abx-_.?:"
+    words = ["tag", "page", "login", "index", "home", "img", ".jpg", "porno"]
+    words += ["seite", "?p=", "archives", "user", "mailto:", ".html", "2020", "Tag"]
+    for _ in range(20000):
+        url = "".join(
+            rng.choice(chars) if rng.random() < 0.6 else rng.choice(words)
+            for _ in range(rng.randint(0, 12))
+        )
+        expected = sum(category for category, search in patterns if search(url))
+        assert scan_url(url) == expected
+        assert scan_url(url, NAVIGATION) == expected & NAVIGATION
+        subset = rng.randint(1, ALL_CATEGORIES)
+        assert scan_url(url, subset) == expected & subset
+        assert is_navigation_page(url) is bool(expected & NAVIGATION)
+        assert is_not_crawlable(url) is bool(expected & NOT_CRAWLABLE)
+    # line breaks are crossed as in separate searches
+    for url in ("https://example.org/x\n/tag/x", "https://example.org/login\n/"):
+        assert scan_url(url) == sum(c for c, search in patterns if search(url))
+    # one combined expression per set of categories, matches at the same position
+    assert scan_url("https://example.org/tag/x", SITE | NAVIGATION) == SITE | NAVIGATION
+    assert set(SCANNERS[SITE | NAVIGATION][1].values()) == {SITE, NAVIGATION}
+
+
 def test_validate():
     assert validate_url("http://www.test[.org/test")[0] is False
     # assert validate_url('http://www.test.org:7ERT/test')[0] is False
@@ -514,6 +652,21 @@ def test_validate():
     assert not is_valid_url("http://localhost/")
     assert not is_valid_url("http://a.b/")
 
+    # the fast path splits URLs exactly like urlsplit
+    rng = random.Random(0)
+    chars = "htps:/?#[]@.;aZ09%\t\n\r \\é~!-_=&\x01"
+    for _ in range(20000):
+        url = rng.choice(["http://", "https://", "HTTP://", "http:/", ""]) + "".join(
+            rng.choice(chars) for _ in range(rng.randint(0, 20))
+        )
+        try:
+            expected = urlsplit(url)
+        except ValueError:
+            with pytest.raises(ValueError):
+                split_url(url)
+        else:
+            assert split_url(url) == expected
+
 
 def test_normalization():
     assert normalize_url("HTTPS://WWW.DWDS.DE/") == "https://www.dwds.de/"
@@ -546,6 +699,8 @@ def test_normalization():
     assert normalize_url("https://[::1]:443/") == "https://[::1]/"
     # non-default port preserved
     assert normalize_url("http://[::1]:8080/") == "http://[::1]:8080/"
+    assert normalize_host(urlsplit("HTTPS://xn--Mnchen-3ya.DE:443/")) == "münchen.de"
+    assert normalize_host(urlsplit("http://Example.org:443/")) == "example.org:443"
 
     # punycode
     assert normalize_url("http://xn--Mnchen-3ya.de") == "http://münchen.de"
@@ -587,6 +742,71 @@ def test_normalization():
     assert normalize_url("http://test.org/#page2") == "http://test.org/#page2"
 
 
+def test_normalized_urls():
+    "Test the shortcut for URLs which are already normalized."
+    assert _is_normalized("https://example.org/a/b?id=1&page=2#x")
+    assert _is_normalized("http://example.org:8080/")
+    assert not _is_normalized("http://example.org:80/")
+    assert not _is_normalized("https://example.org/#x", strict=True)
+    assert not _is_normalized("https://example.org/", trailing_slash=False)
+    assert not _is_normalized("https://example.org?id=1")
+    assert not _is_normalized("https://example.org/?id=1&copy=2")
+    url = "https://example.org/a?id=1"
+    assert normalize_url(url) is url
+
+    # same results as the whole normalization, on raw and normalized URLs
+    def outcome(url, *args):
+        try:
+            return normalize_url(url, *args)
+        except ValueError:
+            return ValueError
+
+    def reference(url, *args, parsed=False):
+        try:
+            parsed_url = urlsplit(url if parsed else unescape(url))
+            return _normalize_url(parsed_url, normalize_host(parsed_url), *args)
+        except ValueError:
+            return ValueError
+
+    def parsed_outcome(url, *args):
+        try:
+            return normalize_url(urlsplit(url), *args)
+        except ValueError:
+            return ValueError
+
+    rng = random.Random(3)
+    schemes = ["http", "https", "HTTPS", "ftp"]
+    hosts = ["example.org", "Example.org", "xn--mnchen-3ya.de", "a-b.co.uk", "1.2.3.4"]
+    hosts += ["münchen.de", "[::1]", "user@example.org", "example.org."]
+    ports = ["", ":80", ":443", ":8080", ":0", ":080", ":99999"]
+    segments = ["a", "A", "..", ".", "", "a b", "%41", "%zz", "ä", "!x", "a=b", "~"]
+    queries = ["", "?", "?id=1", "?id=1&page=2", "?page=2&id=1", "?utm_source=x"]
+    queries += ["?lang=de", "?lang=en", "?a=1&amp;b=2", "?a=1&copy=2", "?a=b c"]
+    fragments = ["", "#", "#x", "#page=2", "#a=1&b=2", "#utm_source=x", "#ä", "#a#b"]
+    urls = []
+    for _ in range(5000):
+        path = "/".join(rng.choices(segments, k=rng.randint(0, 3)))
+        urls.append(
+            f"{rng.choice(schemes)}://{rng.choice(hosts)}{rng.choice(ports)}"
+            f"{'/' + path if path or rng.random() < 0.5 else ''}"
+            f"{rng.choice(queries)}{rng.choice(fragments)}"
+        )
+    urls += [outcome(url) for url in urls if outcome(url) is not ValueError]
+    for url in urls:
+        for args in (
+            (False, None, True),
+            (True, None, True),
+            (False, "de", True),
+            (False, None, False),
+        ):
+            assert outcome(url, *args) == reference(url, *args), (url, args)
+            assert parsed_outcome(url, *args) == reference(url, *args, parsed=True), (
+                url,
+                args,
+            )
+    assert sum(_is_normalized(url) for url in urls) > len(urls) // 10
+
+
 def test_qelems():
     assert (
         normalize_url("http://test.net/foo.html?utm_source=twitter")
@@ -620,6 +840,128 @@ def test_qelems():
             language="de",
         )
 
+    # fast path for simple and sorted queries
+    assert clean_query("id=1&page=2") == "id=1&page=2"
+    assert clean_query("fbclid=x&id=1&utm_source=a") == "id=1"
+    assert clean_query("id=1&page=2&testid=3", strict=True) == "id=1&page=2"
+    assert clean_query("page=2&id=1") == "id=1&page=2"
+    with pytest.raises(ValueError):
+        clean_query("lang=en&page=2", language="de")
+
+    # same results as parsing and re-encoding the query
+    def outcome(function, *args):
+        try:
+            return function(*args)
+        except ValueError:
+            return ValueError
+
+    rng = random.Random(1)
+    names = ["a", "A", "id", "lang", "page", "ref", "utm_source", "fbclid", "x-y"]
+    names += ["a.b", "a~", "", "a+b", "a%20b", "é"]
+    values = ["1", "en", "de", "", "a b", "a+b", "%41", "%zz", "é", "a=b", "1;2"]
+    for _ in range(20000):
+        fields = [
+            f"{rng.choice(names)}={rng.choice(values)}" if rng.random() < 0.95 else "a"
+            for _ in range(rng.randint(0, 5))
+        ]
+        query = "&".join(sorted(fields) if rng.random() < 0.5 else fields)
+        for strict, language in ((False, None), (True, None), (False, "de")):
+            assert outcome(clean_query, query, strict, language) == outcome(
+                _clean_query, query, strict, language
+            )
+
+
+def test_param_rules():
+    "Test global and host-specific rules for query parameters."
+    rules = ParamRules()
+    assert rules.matcher("example.org") is None and len(rules) == 0
+    rules.add("Sid")
+    rules.add("ref", hosts=["example.org"])
+    rules.add("pk_[a-z]+", regex=True)
+    matcher = rules.matcher("www.example.org:8080")
+    assert matcher("sid", "1") and matcher("ref", "x") and matcher("pk_abc", "1")
+    assert not matcher("pk_", "1") and not matcher("id", "1")
+    # other hosts share the matcher of the global rules
+    assert not rules.matcher("example.com")("ref", "x")
+    assert rules.matcher("example.com") is rules.matcher("other.net") is rules.matcher()
+    assert len(rules) == 3
+
+    # AdGuard
+    assert (
+        rules.load_adguard(
+            [
+                "! comment",
+                "$removeparam=fbclid",
+                "||shop.com^$removeparam=aff",
+                "$removeparam=cid,domain=news.net|blog.net",
+                "$removeparam=/^track_[0-9]{1\\,3}=/",
+                "$removeparam=x,domain=~example.org",
+                "@@||example.org^$removeparam=fbclid",
+                "||ads.example.org^",
+            ]
+        )
+        == 4
+    )
+    assert rules.matcher("m.shop.com")("aff", "1")
+    assert not rules.matcher("shop.net")("aff", "1")
+    assert rules.matcher("blog.net")("cid", "1")
+    assert rules.matcher()("fbclid", "1") and rules.matcher()("track_12", "1")
+    assert not rules.matcher()("track_1234", "1") and not rules.matcher()("x", "1")
+
+    # ClearURLs
+    data = {
+        "providers": {
+            "globalRules": {"urlPattern": ".*", "rules": ["gs_l", "ved"]},
+            "amazon": {
+                "urlPattern": "^https?:\\/\\/(?:[a-z0-9-]+\\.)*?amazon(?:\\.[a-z]{2,}){1,}",
+                "rules": ["pf_rd_[a-z]*", "qid"],
+                "referralMarketing": ["tag"],
+            },
+            "broken": {"urlPattern": "(", "rules": ["x"]},
+        }
+    }
+    assert rules.load_clearurls(json.dumps(data)) == 4
+    assert rules.matcher("www.amazon.co.uk")("pf_rd_p", "1")
+    assert not rules.matcher("www.amazon.co.uk")("tag", "1")
+    assert not rules.matcher("example.org")("qid", "1")
+    assert rules.matcher("example.org")("ved", "1")
+    assert rules.load_clearurls(data, referral=True) == 5
+    assert rules.matcher("amazon.de")("tag", "1")
+    with pytest.raises(ValueError):
+        rules.load_clearurls("[]")
+    rules.clear()
+    assert len(rules) == 0 and rules.matcher("amazon.de") is None
+
+    # used when normalizing URLs
+    try:
+        TRACKER_RULES.add("tag", hosts=["amazon.de"])
+        TRACKER_RULES.add("session_id")
+        assert (
+            normalize_url("https://www.amazon.de/dp/1?tag=x&th=1#tag=y")
+            == "https://www.amazon.de/dp/1?th=1"
+        )
+        assert (
+            normalize_url("https://example.org/?b=1&tag=x")
+            == "https://example.org/?b=1&tag=x"
+        )
+        assert clean_query("a=1&a=2&tag=3", host="amazon.de") == "a=1&a=2"
+        assert clean_query("tag=1&session_id=2", True, host="amazon.de") == ""
+        assert normalize_url("https://amazon.de/#a=1&tag=x") == "https://amazon.de/#a=1"
+        rng = random.Random(2)
+        names = ["a", "tag", "lang", "utm_source", "sid", "é", "a+b"]
+        values = ["1", "de", "", "a b", "%41"]
+        for _ in range(5000):
+            query = "&".join(
+                sorted(
+                    f"{rng.choice(names)}={rng.choice(values)}"
+                    for _ in range(rng.randint(0, 4))
+                )
+            )
+            for host in ("amazon.de", "example.org"):
+                assert clean_query(query, host=host) == _clean_query(query, host=host)
+    finally:
+        TRACKER_RULES.clear()
+
 
 def test_urlcheck():
     assert check_url("AAA") is None
@@ -758,6 +1100,157 @@ def test_urlcheck_port():
     assert check_url("http://example.com:80:80") is None
 
 
+def test_urlcheck_batch():
+    "Batch checks give the same results as check_url."
+    with open(os.path.join(RESOURCES_DIR, "input.txt"), encoding="utf-8") as inputfh:
+        urls = [line.strip() for line in inputfh]
+    for scheme in ("http", "HTTPS", "ftp"):
+        for host in (
+            "example.org",
+            "www.Example.org:443",
+            "xn--mnchen-3ya.de",
+            "www.bbc.co.uk",
+            "127.0.0.1",
+            "[::1]:8080",
+            "test.xyz:80",
+            "user@example.net",
+            "ex_ample.org",
+        ):
+            for path in ("", "/", "/a/b.html", "?q=1", "#frag", "/de/seite", "/tag/x"):
+                urls.append(f"{scheme}://{host}{path}")
+    random.Random(1).shuffle(urls)
+    for options in (
+        {},
+        {"strict": True},
+        {"language": "de"},
+        {"trailing_slash": False},
+        {"strict": True, "with_nav": True},
+    ):
+        expected = [check_url(url, **options) for url in urls]
+        assert list(check_urls(urls, **options)) == expected
+    assert list(check_urls([])) == []
+    # results are streamed
+    assert next(check_urls(iter(["https://example.org/page"]))) == (
+        "https://example.org/page",
+        "example.org",
+    )
+
+
+def test_url_checker():
+    "Configurable checks with statistics and stage reordering."
+    checker = UrlChecker(strict=True, language="de")
+    assert [stage.name for stage in checker.stages] == [
+        "type",
+        "language",
+        "extension",
+        "host",
+        "path",
+    ]
+    urls = [
+        "https://example.org/de/artikel.html",
+        "https://example.org/en/article.html",
+        "https://example.org/picture.jpg",
+        "https://example.org/impressum",
+        "https://12345.org/page",
+        "ftp://example.org/page",
+    ]
+    expected = [check_url(url, strict=True, language="de") for url in urls]
+    assert list(checker.check_many(urls)) == expected
+    stats = checker.statistics()
+    assert stats["type"]["calls"] == 5 and stats["type"]["rejected"] == 1
+    assert stats["language"]["rejected"] == 1
+    assert stats["host"]["rejection_rate"] == 1 / 3
+    assert stats["path"]["rejected"] == 1
+    assert checker.checked == 6
+
+    # custom stages run last
+    def no_articles(url, parts):
+        return "artikel" not in parts.path
+
+    checker = UrlChecker(stages=[no_articles])
+    assert checker.stages[-1].name == "no_articles"
+    assert checker.check("https://example.org/de/artikel.html") is None
+    assert checker.statistics()["no_articles"]["rejected"] == 1
+    checker = UrlChecker(
+        stages=[
+            FilterStage("no-drafts", lambda url, parts: "/draft/" not in parts.path),
+            FilterStage("no-previews", lambda url, parts: "/preview" not in parts.path),
+        ]
+    )
+    assert checker.check_reason("https://example.org/draft/a.html")[1] == "no-drafts"
+    assert checker.check_reason("https://example.org/preview/a")[1] == "no-previews"
+
+    # domains are cached per host, including hosts without domain
+    clear_caches()
+    checker = UrlChecker()
+    for _ in range(2):
+        assert checker._extract_domain("https://example.org/") == "example.org"
+        assert checker._extract_domain("https://localhost/") is None
+    assert HOST_CACHE.statistics()["extract_domain"]["hits"] == 2
+    # the blacklist only applies in strict mode
+    assert checker._extract_domain("https://www.amazon.com/") == "amazon.com"
+    assert UrlChecker(strict=True)._extract_domain("https://www.amazon.com/") is None
+
+    # reordering according to measured cost and rejection rate
+    checker = UrlChecker()
+    for stage, (time, rejected) in zip(
+        checker.stages, ((100, 0), (50, 10), (10, 50)), strict=True
+    ):
+        stage.calls, stage.timed, stage.time, stage.rejected = 100, 100, time, rejected
+    checker.reorder()
+    assert [stage.name for stage in checker.stages] == ["host", "extension", "type"]
+    checker.reset()
+    assert checker.statistics()["host"]["calls"] == 0
+
+    # adaptive mode gives the same results
+    checker = UrlChecker(language="en", adaptive=True)
+    urls = [f"https://example{i % 7}.org/media/{i}.jpg" for i in range(9000)]
+    assert list(checker.check_many(urls)) == [None] * 9000
+    assert checker.stages[0].name == "extension"
+
+    # shared between threads: no statistics are lost
+    checker = UrlChecker(adaptive=True)
+    urls = [
+        f"https://example{i % 7}.org/{i}.{('jpg', 'html')[i % 2]}" for i in range(20000)
+    ]
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        results = list(executor.map(checker.check, urls))
+    assert results == [check_url(url) for url in urls]
+    stats = checker.statistics()
+    assert checker.checked == len(urls) == sum(checker.rejections.values()) + 10000
+    assert sum(stage["rejected"] for stage in stats.values()) == 10000
+    assert stats[checker.stages[0].name]["calls"] == len(urls)
+
+    # rejection reasons
+    checker = UrlChecker(strict=True)
+    assert checker.check_reason("https://example.org/page") == (
+        ("https://example.org/page", "example.org"),
+        None,
+    )
+    assert checker.check_reason("http://ab") == (None, "basic")
+    assert checker.check_reason("httpx://example.org/page") == (None, "validation")
+    assert checker.check_reason("https://example.org/login") == (None, "path")
+    assert checker.check_reason("https://www.amazon.com/page") == (None, "domain")
+    assert checker.check_reason(None) == (None, "error")
+    assert checker.rejections == {
+        "basic": 1,
+        "validation": 1,
+        "path": 1,
+        "domain": 1,
+        "error": 1,
+    }
+    checker = UrlChecker(language="de")
+    assert checker.check_reason("https://example.org/?lang=en") == (
+        None,
+        "normalization",
+    )
+
+    # check_url uses cached checkers
+    assert get_checker(strict=True) is get_checker(strict=True)
+    clear_caches()
+    assert get_checker(strict=True) is not checker
+
+
 def test_domain_filter():
     "Test filters related to domain and hostnames."
     assert domain_filter("") is False
@@ -804,6 +1297,71 @@ def test_domain_filter():
     # assert domain_filter("test.invalidtld") is False
 
 
+def test_host_cache():
+    "Test the shared store of results computed per host."
+    cache = HostCache(maxsize=3)
+    calls = []
+
+    def compute(host):
+        calls.append(host)
+        return host.upper()
+
+    assert cache.get("upper", "a", compute, "a") == "A"
+    assert cache.get("upper", "a", compute, "a") == "A"
+    assert cache.get("other", "a", str.lower, "A") == "a"
+    assert calls == ["a"] and len(cache) == 2
+    assert cache.statistics() == {
+        "other": {"hits": 0, "misses": 1, "hit_rate": 0.0},
+        "upper": {"hits": 1, "misses": 1, "hit_rate": 0.5},
+    }
+    # bounded size
+    for host in "bcd":
+        cache.get("upper", host, compute, host)
+    assert len(cache) <= 3
+    cache.clear()
+    assert len(cache) == 0 and cache.statistics() == {}
+
+    # concurrent use
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        results = list(
+            executor.map(
+                lambda i: cache.get("upper", str(i % 10), compute, str(i % 10)),
+                range(1000),
+            )
+        )
+    assert results == [str(i % 10) for i in range(1000)]
+    stats = cache.statistics()["upper"]
+    assert stats["hits"] + stats["misses"] == 1000 and len(cache) <= 3
+
+    # same results as the uncached functions
+    clear_caches()
+    urls = [
+        "https://www.example.org/page",
+        "https://www.example.org?page=1",
+        "https://www.example.org#top",
+        "https://www.example.org",
+        "http://user@sub.example.co.uk:8080/",
+        "https://127.0.0.1/path",
+        "https://localhost/",
+        "www.example.org/page",
+        "ftp://example.org/file",
+        "https://xn--h1aagokeh.xn--p1ai/",
+    ]
+    for _ in range(2):
+        for url in urls:
+            for fast in (False, True):
+                assert get_tldinfo(url, fast=fast) == _get_tldinfo(url, fast)
+    assert decode_punycode("xn--h1aagokeh.xn--p1ai") == "историк.рф"
+    assert decode_punycode("xn--h1aagokeh.xn--p1ai") == "историк.рф"
+    assert domain_filter("example.org") is domain_filter("example.org") is True
+    stats = HOST_CACHE.statistics()
+    assert stats["decode_punycode"] == {"hits": 1, "misses": 1, "hit_rate": 0.5}
+    assert stats["domain_filter"]["hits"] == 1
+    assert stats["get_tldinfo"] == {"hits": 18, "misses": 18, "hit_rate": 0.5}
+    clear_caches()
+    assert len(HOST_CACHE) == 0
+
+
 def test_urlcheck_redirects():
     "Test redirection checks with a mocked HTTP pool."
 
@@ -855,6 +1413,233 @@ def test_redirection(httpserver):
         redirection_test(httpserver.url_for("/missing"))
 
 
+def test_redirect_resolver(httpserver):
+    "Test the concurrent resolution of redirects."
+    httpserver.expect_request("/redirect", method="HEAD").respond_with_data(
+        "", status=301, headers={"Location": httpserver.url_for("/final")}
+    )
+    httpserver.expect_request("/final", method="HEAD").respond_with_data("", status=200)
+    httpserver.expect_request("/missing", method="HEAD").respond_with_data(
+        "", status=404
+    )
+    urls = [httpserver.url_for(path) for path in ("/redirect", "/final", "/missing")]
+    assert RedirectResolver(workers=4).resolve(urls * 2) == {
+        urls[0]: urls[1],
+        urls[1]: urls[1],
+        urls[2]: None,
+    }
+    with pytest.raises(ValueError):
+        RedirectResolver(per_host=0)
+
+    # limited number of simultaneous requests per host
+    active, peaks, lock = Counter(), Counter(), threading.Lock()
+
+    def transport(url):
+        "Record the number of requests in progress."
+        host = urlsplit(url).netloc
+        with lock:
+            active[host] += 1
+            active["all"] += 1
+            peaks[host] = max(peaks[host], active[host])
+            peaks["all"] = max(peaks["all"], active["all"])
+        sleep(0.01)
+        with lock:
+            active[host] -= 1
+            active["all"] -= 1
+        if "missing" in url:
+            raise ValueError
+        return url.replace("/old/", "/new/")
+
+    resolver = RedirectResolver(workers=8, per_host=2, transport=transport)
+    urls = [f"https://site{i % 4}.org/old/{i}" for i in range(40)]
+    results = resolver.resolve(urls + ["https://site0.org/missing"])
+    assert results["https://site0.org/missing"] is None
+    assert all(results[url] == url.replace("/old/", "/new/") for url in urls)
+    assert max(peaks[f"site{i}.org"] for i in range(4)) == 2
+    assert peaks["all"] > 2
+
+    # used by checkers on series of URLs, in the original order
+    checker = UrlChecker(with_redirects=True, resolver=resolver)
+    inputs = ["https://site1.org/old/a", "https://site0.org/missing", "ftp://x", *urls]
+    results = list(checker.check_reasons(inputs))
+    assert results[:3] == [
+        (("https://site1.org/new/a", "site1.org"), None),
+        (None, "redirect"),
+        (None, "basic"),
+    ]
+    assert [result for result, _ in results[3:]] == [
+        (url.replace("/old/", "/new/"), url.split("/")[2]) for url in urls
+    ]
+    assert list(checker.check_many(inputs[:2])) == [
+        ("https://site1.org/new/a", "site1.org"),
+        None,
+    ]
+    assert checker.check("https://site2.org/old/b") == (
+        "https://site2.org/new/b",
+        "site2.org",
+    )
+
+
+def test_redirect_breaker():
+    "Test skipping hosts which cannot be reached and caching redirect targets."
+    now = [0.0]
+    clock = lambda: now[0]  # noqa: E731
+    calls = Counter()
+
+    def transport(url):
+        "Stand-in for redirection_test()."
+        calls[url] += 1
+        if "down.org" in url:
+            raise UnreachableError(url)
+        if "missing" in url:
+            raise ValueError(url)
+        return url + "/"
+
+    # unreachable host
+    with patch("courlan.network.HTTP_POOL.request") as mock_request:
+        mock_request.side_effect = Exception("unreachable")
+        with pytest.raises(UnreachableError):
+            redirection_test("https://down.org/")
+
+    # the breaker opens after three failures and lets a trial through later
+    breaker = HostBreaker(threshold=3, cooldown=60, clock=clock)
+    resolver = RedirectResolver(workers=1, transport=transport, breaker=breaker)
+    for i in range(10):
+        assert resolver.resolve_url(f"https://down.org/{i}") is None
+    assert calls.total() == 3 and breaker.skipped() == ["down.org"]
+    # unacceptable status codes do not count: the host answers
+    for i in range(5):
+        assert resolver.resolve_url(f"https://up.org/missing/{i}") is None
+    assert resolver.resolve_url("https://up.org/page") == "https://up.org/page/"
+    assert breaker.skipped() == ["down.org"]
+    now[0] = 61
+    assert breaker.skipped() == []
+    assert resolver.resolve_url("https://down.org/trial") is None
+    assert resolver.resolve_url("https://down.org/next") is None
+    assert calls["https://down.org/trial"] == 1 and not calls["https://down.org/next"]
+    assert breaker.skipped() == ["down.org"]
+    # the host is back
+    now[0] = 122
+    assert resolver.resolve_url("https://Down.org/back").startswith("https://Down")
+    assert breaker.skipped() == []
+
+    # a dead host does not stall the batch
+    calls.clear()
+    breaker = HostBreaker(threshold=3, cooldown=60, clock=clock)
+    resolver = RedirectResolver(workers=4, transport=transport, breaker=breaker)
+    urls = [f"https://down.org/{i}" for i in range(50)]
+    urls += [f"https://up.org/{i}" for i in range(50)]
+    results = resolver.resolve(urls)
+    assert sum(calls[url] for url in urls[:50]) <= 4
+    assert all(results[url] is None for url in urls[:50])
+    assert all(results[url] == url + "/" for url in urls[50:])
+
+    # targets and failures are cached for different durations
+    calls.clear()
+    cache = RedirectCache(ttl=100, negative_ttl=10, maxsize=4, clock=clock)
+    resolver = RedirectResolver(transport=transport, cache=cache)
+    for _ in range(2):
+        assert resolver.resolve_url("https://up.org/a") == "https://up.org/a/"
+        assert resolver.resolve_url("https://up.org/missing") is None
+    assert calls.total() == 2 and len(cache) == 2
+    now[0] += 20
+    assert resolver.resolve_url("https://up.org/a") == "https://up.org/a/"
+    assert resolver.resolve_url("https://up.org/missing") is None
+    assert calls.total() == 3 and len(cache) == 2
+    now[0] += 100
+    with pytest.raises(KeyError):
+        cache["https://up.org/a"]
+    for i in range(5):
+        cache[f"https://up.org/{i}"] = None
+    assert len(cache) <= 4
+    cache.clear()
+    assert len(cache) == 0
+
+
+def test_redirect_persistent_cache(tmp_path):
+    "Test the redirect cache kept in a file between runs."
+    filename = str(tmp_path / "redirects.db")
+    now = [1000.0]
+    clock = lambda: now[0]  # noqa: E731
+    calls = Counter()
+
+    def transport(url):
+        "Stand-in for redirection_test()."
+        calls[url] += 1
+        if "missing" in url:
+            raise ValueError(url)
+        return url + "/"
+
+    cache = PersistentRedirectCache(filename, ttl=100, negative_ttl=10, clock=clock)
+    urls = [f"https://site{i % 3}.org/{i}" for i in range(30)] + [
+        "https://site0.org/missing"
+    ]
+    results = RedirectResolver(workers=4, transport=transport, cache=cache).resolve(
+        urls
+    )
+    assert results["https://site0.org/missing"] is None
+    assert calls.total() == 31 and len(cache) == 31
+    cache.close()
+
+    # next run: only expired entries lead to new requests
+    now[0] += 20
+    cache = PersistentRedirectCache(filename, ttl=100, negative_ttl=10, clock=clock)
+    assert len(cache) == 30
+    assert cache["https://site1.org/1"] == "https://site1.org/1/"
+    with pytest.raises(KeyError):
+        cache["https://site0.org/missing"]
+    resolver = RedirectResolver(transport=transport, cache=cache)
+    assert resolver.resolve(urls) == results
+    assert calls.total() == 32
+    now[0] += 100
+    with pytest.raises(KeyError):
+        cache["https://site1.org/1"]
+    cache.prune()
+    assert len(cache) == 0
+    cache["https://example.org/"] = None
+    cache.clear()
+    assert len(cache) == 0
+    cache.close()
+
+    # size limit, the oldest entries are removed
+    cache = PersistentRedirectCache(filename, maxsize=5, clock=clock)
+    for i in range(10):
+        now[0] += 1
+        cache[f"https://example.org/{i}"] = "https://example.org/"
+    cache.prune()
+    assert len(cache) == 5
+    assert cache["https://example.org/9"] == "https://example.org/"
+    with pytest.raises(KeyError):
+        cache["https://example.org/0"]
+    cache.close()
+
+    # command-line interface
+    cachefile = str(tmp_path / "cli.db")
+    with patch("courlan.network.HTTP_POOL.request") as mock_request:
+        mock_request.return_value = MagicMock(status=200)
+        mock_request.return_value.geturl.return_value = None
+        for _ in range(2):
+            clear_caches()
+            assert cli._cli_check_urls(
+                ["https://example.org/page"],
+                with_redirects=True,
+                redirect_cache=cachefile,
+            ) == [(True, "https://example.org/page")]
+        assert mock_request.call_count == 1
+    clear_caches()
+    args = cli.parse_args(["-i", "in", "-o", "out", "-r", "--redirect-cache", "r.db"])
+    assert args.redirect_cache == "r.db" and args.skip_unreachable is False
+    args = cli.parse_args(["-i", "in", "-o", "out", "-r", "--skip-unreachable"])
+    assert args.skip_unreachable is True
+
+    # breaker and caches are opt-in
+    resolver = get_checker(with_redirects=True).resolver
+    assert resolver.breaker is None and resolver.cache is None
+    resolver = get_checker(with_redirects=True, skip_unreachable=True).resolver
+    assert isinstance(resolver.breaker, HostBreaker) and resolver.cache is None
+    clear_caches()
+
+
 def test_urlutils():
     """Test URL manipulation tools"""
     # domain extraction
@@ -980,6 +1765,15 @@ def test_extraction():
     # link known under another form
     pagecontent = '<html><a href="https://test.org/example"/><a href="https://test.org/example/&"/></html>'
     assert len(extract_links(pagecontent, "https://test.org", False)) == 1
+    # base element
+    pagecontent = '<html><head><base href="https://test.com/docs/"></head><a href="intro.html"/><a href="/about"/></html>'
+    assert extract_links(pagecontent, "https://test.com/index.html") == {
+        "https://test.com/docs/intro.html",
+        "https://test.com/about",
+    }
+    assert extract_links(
+        pagecontent.encode("utf-8"), "https://test.com/index.html"
+    ) == {"https://test.com/docs/intro.html", "https://test.com/about"}
     # nofollow
     pagecontent = '<html><a href="https://test.com/example" rel="nofollow ugc"/></html>'
     assert not extract_links(pagecontent, "https://test.com/", False)
@@ -1164,6 +1958,172 @@ def test_extraction_navigation():
     ]
 
 
+def test_extraction_scanner():
+    "The single-pass scanner finds the same links as the former per-tag regexes."
+    find_links = re.compile(r"<a\s+[^<>]+?>", re.I)
+    find_href = re.compile(r'href=["\']?([^ ]+?)(["\' >])', re.I)
+    find_lang = re.compile(r'hreflang=["\']?([a-z-]+)', re.I)
+
+    def legacy(htmlstring, language):
+        candidates = set()
+        for link in (m[0] for m in find_links.finditer(htmlstring)):
+            if "rel=" in link and "nofollow" in link:
+                continue
+            if language is not None and "hreflang" in link:
+                langmatch = find_lang.search(link)
+                if not langmatch or not (
+                    langmatch[1].lower().startswith(language)
+                    or langmatch[1].lower() == "x-default"
+                ):
+                    continue
+            linkmatch = find_href.search(link)
+            if linkmatch:
+                candidates.add(linkmatch[1])
+        return candidates
+
+    fragments = [
+        '<a href="/1">',
+        "<a href='/2' class=x>",
+        "<A HREF=/3>",
+        '<a  href="/4"/>',
+        '<a data-href="/5" href="/6">',
+        '<a class="b" href=/7 rel="nofollow">',
+        '<a rel="me" href="/8">',
+        '<a hreflang="de" href="/9">',
+        '<a href="/10" hreflang="en-GB">',
+        '<a hreflang="x-default" href="/11">',
+        "<a href=>",
+        '<a href="">',
+        '<a href="" >',
+        "<a name=top>",
+        "<a >",
+        "<a  >",
+        "<a\nhref=\n'/12'>",
+        '<a href="/13<b>">',
+        "<abbr href=/14>",
+        '<a title="x" href="/15',
+        "text > <a href=/16",
+        "<a href=/17 <a href=/18>",
+    ]
+    rng = random.Random(1)
+    for _ in range(300):
+        htmlstring = "".join(rng.choices(fragments + ["</a>", " ", "\n"], k=12))
+        for language in (None, "en", "de"):
+            assert _extract_candidates(htmlstring, language) == legacy(
+                htmlstring, language
+            ), htmlstring
+    htmlstring = "".join(fragments)
+    assert _extract_candidates(htmlstring, None) == legacy(htmlstring, None)
+    assert "/8" in _extract_candidates(htmlstring, None)
+    assert "/7" not in _extract_candidates(htmlstring, None)
+
+    # unclosed tags are scanned in linear time
+    for htmlstring in (
+        "<a " + "x" * 200000 + "<p>",
+        "<a class=x " * 50000 + '<a href="/1">',
+        "\n".join("<a class=x " + "y" * 190 for _ in range(5000)),
+    ):
+        start = perf_counter()
+        _extract_candidates(htmlstring, None)
+        _extract_candidates(htmlstring.encode(), None)
+        assert perf_counter() - start < 0.5
+
+
+def test_extraction_bytes():
+    "Raw documents are scanned without being decoded as a whole."
+    htmlstring = (
+        '<html><head><meta charset="iso-8859-1"></head><body>'
+        '<a href="/caf\xe9">Café</a><a href="/de" hreflang="de">'
+        '<a href="https://example.org/page" rel="nofollow">'
+        '<a href="/en" hreflang="en"></body></html>'
+    )
+    raw = htmlstring.encode("latin-1")
+    expected = extract_links(htmlstring, "https://example.org", language="en")
+    assert "https://example.org/caf%C3%A9" in expected
+    assert extract_links(raw, "https://example.org", language="en") == expected
+    assert (
+        extract_links(memoryview(raw), "https://example.org", language="en") == expected
+    )
+    assert _extract_candidates(raw, None) == {"/caf\xe9", "/de", "/en"}
+    assert _extract_candidates(raw, None, encoding="utf-8") == {"/caf", "/de", "/en"}
+    # encoding sniffing
+    assert _extract_candidates(htmlstring.encode("utf-16"), "en") == {"/caf\xe9", "/en"}
+    assert _extract_candidates(codecs.BOM_UTF8 + b'<a href="/\xc3\xa9">', None) == {
+        "/\xe9"
+    }
+    assert _extract_candidates(b'<meta charset=unknown><a href="/\xc3\xa9">', None) == {
+        "/\xe9"
+    }
+    # links come from a set, their order depends on the hash seed
+    for links, expected_links in zip(
+        filter_links(raw, "https://example.org"),
+        filter_links(htmlstring, "https://example.org"),
+        strict=True,
+    ):
+        assert sorted(links) == sorted(expected_links)
+    assert extract_links(b"", "https://example.org") == set()
+
+
+def test_extraction_many():
+    "Batches of pages are processed in parallel and returned in order."
+    pages = [
+        (
+            f'<a href="/{i}"/><a href="https://example.net/{i}"/><a href="/tag/{i}"/>',
+            url,
+        )
+        for i in range(20)
+        for url in ("https://example.org", "https://www.example.com")
+    ]
+    pages.append((memoryview(b'<a href="/raw"/>'), "https://example.org"))
+    expected = [extract_links(page, url, strict=False) for page, url in pages]
+    assert extract_links_many(pages, workers=1, strict=False) == expected
+    assert extract_links_many(pages, workers=4, threads=True, strict=False) == expected
+    assert (
+        extract_links_many(iter(pages), workers=2, chunksize=3, strict=False)
+        == expected
+    )
+    assert extract_links_many([], workers=2) == []
+
+    expected = [filter_links(page, url, lang="en") for page, url in pages]
+    assert filter_links_many(pages, workers=2, threads=True, lang="en") == expected
+    assert filter_links_many(pages, workers=2, chunksize=16, lang="en") == expected
+
+
+def test_check_cache():
+    "Link checks can be memoized across pages."
+    cache = UrlCheckCache(maxsize=3)
+    assert cache.hit_rate == 0.0
+    for _ in range(2):
+        assert cache.check("https://example.org/page") == check_url(
+            "https://example.org/page"
+        )
+    assert cache.check("https://example.org/page", strict=True) is not None
+    assert cache.check("https://example.org/login", strict=True) is None
+    assert cache.hits == 1 and cache.misses == 3 and len(cache) == 3
+    # oldest entries are evicted
+    cache.check("https://example.org/other")
+    assert len(cache) == 3
+    cache.check("https://example.org/page")
+    assert cache.hits == 1
+    assert pickle.loads(pickle.dumps(cache)).check("https://example.org/other")
+    cache.clear()
+    assert len(cache) == 0 and cache.hits == cache.misses == 0
+
+    cache = UrlCheckCache()
+    pages = [
+        f'<a href="/article{i}"/><a href="/about"/><a href="/login"/><a href="https://example.net/"/>'
+        for i in range(10)
+    ]
+    for page in pages:
+        assert extract_links(page, "https://example.org", cache=cache) == extract_links(
+            page, "https://example.org"
+        )
+        assert filter_links(page, "https://example.org", cache=cache) == filter_links(
+            page, "https://example.org"
+        )
+    assert cache.hit_rate > 0.5
+
+
 def test_filter_links():
     "Test the filter_links helper."
     base_url = "https://example.org"
@@ -1184,8 +2144,6 @@ def test_filter_links():
 
 def test_filter_links_with_rules():
     "filter_links drops robots.txt-disallowed links and honors the external flag."
-    from urllib.robotparser import RobotFileParser
-
     rules = RobotFileParser()
     rules.parse(["User-agent: *", "Disallow: /private/"])
     htmlstring = (
@@ -1196,6 +2154,9 @@ def test_filter_links_with_rules():
     )
     links, _ = filter_links(htmlstring, url="https://example.org", rules=rules)
     assert links == ["https://example.org/public/page"]
+    compiled = RobotsRules.from_parser(rules)
+    links, _ = filter_links(htmlstring, url="https://example.org", rules=compiled)
+    assert links == ["https://example.org/public/page"]
 
     # external flag: keep only links leading to another host (or only internal ones)
     htmlstring = (
@@ -1208,6 +2169,92 @@ def test_filter_links_with_rules():
     assert internal == ["https://example.org/y"]
 
 
+def test_robots_rules():
+    "Compiled robots.txt rules agree with RobotFileParser and support RFC 9309."
+    lines = [
+        "User-agent: otherbot",
+        "Disallow: /",
+        "",
+        "User-agent: *",
+        "Disallow: /private/",
+        "Disallow: /tmp",
+        "Allow: /public",
+        "Disallow: /search?q=",
+        "Disallow: /caf%C3%A9/",
+        "Disallow: /a b",
+        "Crawl-delay: 3",
+        "Sitemap: https://example.org/sitemap.xml",
+    ]
+    parser = RobotFileParser()
+    parser.parse(lines)
+    rules = RobotsRules.from_parser(parser)
+    for path in (
+        "",
+        "/",
+        "/private",
+        "/private/",
+        "/private/page.html",
+        "/tmp",
+        "/tmp2/x",
+        "/public/page",
+        "/search",
+        "/search?q=test",
+        "/search?lang=en&q=test",
+        "/café/menu",
+        "/caf%C3%A9/menu",
+        "/a%20b",
+        "/a b/c",
+        "/index.html#frag",
+    ):
+        url = "https://example.org" + path
+        assert rules.can_fetch("*", url) == parser.can_fetch("*", url), url
+    assert rules.crawl_delay("*") == parser.crawl_delay("*") == 3
+    assert rules.site_maps() == parser.site_maps()
+    assert rules.mtime() == parser.mtime() > 0
+    assert not RobotsRules.from_parser(parser, "otherbot").allowed(
+        "https://example.org/public"
+    )
+    # unread or forbidden files
+    assert not RobotsRules.from_parser(RobotFileParser()).allowed("https://example.org")
+    assert RobotsRules.from_text("").allowed("https://example.org/private")
+    assert RobotsRules.from_text("").crawl_delay() is None
+
+    # longest match and wildcards
+    rules = RobotsRules.from_text(
+        "User-agent: *\nDisallow: /shop\nAllow: /shop/public\n"
+        "Disallow: /*.pdf$\nDisallow: /*?sessionid=\nAllow: /page\nDisallow: /page"
+    )
+    assert not rules.allowed("https://example.org/shop/cart")
+    assert rules.allowed("https://example.org/shop/public/item")
+    assert not rules.allowed("https://example.org/docs/file.pdf")
+    assert rules.allowed("https://example.org/docs/file.pdf?download=1")
+    assert not rules.allowed("https://example.org/list?sessionid=123")
+    assert rules.allowed("https://example.org/page")
+    assert rules.allowed("https://example.org/")
+
+    # serialization
+    restored = RobotsRules.loads(rules.dumps())
+    assert restored.rules == rules.rules and restored.delay is None
+    parsed = RobotsRules.from_parser(parser)
+    restored = RobotsRules.loads(parsed.dumps())
+    assert restored.crawl_delay() == 3 and restored.site_maps() == parser.site_maps()
+    assert restored.mtime() == parser.mtime()
+    with pytest.raises(ValueError):
+        RobotsRules.loads(b"User-agent: *")
+
+    # pickling and reuse
+    copied = pickle.loads(pickle.dumps(rules))
+    assert copied.rules == rules.rules
+    assert not copied.allowed("https://example.org/docs/file.pdf")
+    assert compile_rules(parser) is compile_rules(parser)
+    assert compile_rules(rules) is rules
+    # updated parser
+    parser.default_entry = None
+    parser.parse(["User-agent: *", "Disallow: /"])
+    parser.last_checked += 1
+    assert not compile_rules(parser).allowed("https://example.org/public")
+
+
 def test_cli(tmp_path):
     """test the command-line interface"""
     testargs = [
@@ -1232,6 +2279,11 @@ def test_cli(tmp_path):
         (False, "123"),
         (True, "https://example.org"),
     ]
+    with patch("courlan.network.HTTP_POOL.request") as mock_request:
+        mock_request.return_value = MagicMock(status=404)
+        assert cli._cli_check_urls(
+            ["123", "https://example.org/page"], with_redirects=True, with_reasons=True
+        ) == [(False, "123\tbasic"), (False, "https://example.org/page\tredirect")]
 
     # testfile
     inputfile = os.path.join(RESOURCES_DIR, "input.txt")
@@ -1304,6 +2356,12 @@ def test_cli_discardedfile(tmp_path):
     discarded = discardfile.read_text().splitlines()
     assert "http://ab" in discarded and "not-a-url" in discarded
 
+    # rejection reasons
+    testargs.append("--reasons")
+    cli._cli_process(cli.parse_args(testargs))
+    discarded = discardfile.read_text().splitlines()
+    assert sorted(discarded) == ["http://ab\tbasic", "not-a-url\tbasic"]
+
 
 def test_cli_no_discardfile(tmp_path):
     """invalid URLs are dropped silently when no discard file is given"""
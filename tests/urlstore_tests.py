@@ -11,12 +11,23 @@ import threading
 import uuid
 from datetime import datetime
 from time import sleep
+from unittest.mock import patch
 from urllib.robotparser import RobotFileParser
 
 import pytest
 
-from courlan import UrlStore, load_store
-from courlan.urlstore import HAS_BZ2, HAS_ZLIB, Compressor, State
+from courlan import UrlStore, clean, load_store, urlstore
+from courlan.robots import RULES_MAGIC, RobotsRules
+from courlan.storage import HEADER, STORE_MAGIC, StoredBlob, StoreFile
+from courlan.urlstore import (
+    HAS_BZ2,
+    HAS_ZLIB,
+    Compressor,
+    State,
+    convert_store,
+    get_site,
+    merge_store_files,
+)
 
 
 def test_compressor():
@@ -72,9 +83,9 @@ def test_urlstore_basics():
     firstelem = my_urls.urldict["https://example.org"].tuples[0]
     assert firstelem.urlpath == b"/" and firstelem.visited is False
     # reset
-    num, _, _ = gc.get_count()
+    num = len(gc.get_objects())
     my_urls.reset()
-    num2, _, _ = gc.get_count()
+    num2 = len(gc.get_objects())
     assert not my_urls.urldict
     assert num2 < num
 
@@ -96,24 +107,45 @@ def test_urlstore_rules(robots_rules):
 
     my_urls.store_rules("https://example.org", robots_rules)
     assert my_urls.get_rules("http://test.org") is None
-    assert my_urls.urldict["https://example.org"].rules is not None
-    assert (
-        my_urls.get_rules("https://example.org")
-        == my_urls.urldict["https://example.org"].rules
-        == robots_rules
-    )
+    # compact serialized form, decoded rules are kept
+    raw = my_urls.urldict["https://example.org"].rules
+    assert isinstance(raw, bytes) and raw.startswith(RULES_MAGIC)
+    rules = my_urls.get_rules("https://example.org")
+    assert isinstance(rules, RobotsRules) and rules.mtime() == robots_rules.mtime()
+    assert my_urls.get_rules("https://example.org") is rules
     assert my_urls.get_crawl_delay("http://test.org", default=2) == 2
     assert my_urls.get_crawl_delay("https://example.org") == 5
 
-    assert my_urls.compressed is False
-    my_urls.urldict["https://example.org"].rules = None
+    # new rules replace the decoded ones
+    new_rules = RobotFileParser()
+    new_rules.parse(["User-agent: *", "Disallow: /private", "Crawl-delay: 2"])
+    my_urls.store_rules("https://example.org", new_rules)
+    assert not my_urls.get_rules("https://example.org").allowed(
+        "https://example.org/private"
+    )
+    assert my_urls.get_crawl_delay("https://example.org") == 2
+    my_urls.discard(["https://example.org"])
+    assert my_urls.get_rules("https://example.org") is None
 
-    my_urls.compressed = True
-    my_urls.store_rules("https://example.org", robots_rules)
-    assert my_urls.urldict["https://example.org"].rules is not None
-    # no identity check since different location after compression
-    assert my_urls.get_rules("https://example.org").mtime() == robots_rules.mtime()
-    my_urls.compressed = False
+    # legacy formats: parser object and compressed pickle
+    my_urls = UrlStore(compressed=True)
+    my_urls.add_urls(["https://example.org/"])
+    for legacy in (new_rules, Compressor().compress(new_rules)):
+        my_urls.urldict["https://example.org"].rules = legacy
+        rules = my_urls.get_rules("https://example.org")
+        assert rules.mtime() == new_rules.mtime() and rules.crawl_delay() == 2
+
+    # large rule sets are compressed
+    lines = ["User-agent: *"] + [f"Disallow: /section{i}/" for i in range(100)]
+    large_rules = RobotFileParser()
+    large_rules.parse(lines)
+    my_urls.store_rules("https://example.org", large_rules)
+    raw = my_urls.urldict["https://example.org"].rules
+    assert len(raw) < len(RobotsRules.from_parser(large_rules).dumps())
+    my_urls._rules_cache.clear()
+    assert not my_urls.get_rules("https://example.org").allowed(
+        "https://example.org/section99/page"
+    )
 
 
 def test_urlstore_filters():
@@ -137,6 +169,23 @@ def test_urlstore_filters():
     assert my_urls.done
 
 
+def test_urlstore_normalized_urls():
+    "Normalized URLs skip the whole normalization when added to the store."
+    my_urls = UrlStore()
+    normalized = ["https://example.org/a", "https://example.org/b?id=1"]
+    with patch(
+        "courlan.clean._normalize_url", side_effect=clean._normalize_url
+    ) as normalize:
+        my_urls.add_urls(normalized)
+        assert normalize.call_count == 0
+        my_urls.add_urls(["HTTPS://Example.org/c", "https://example.org:443/d"])
+        assert normalize.call_count == 2
+    assert my_urls.find_known_urls("https://example.org") == normalized + [
+        "https://example.org/c",
+        "https://example.org/d",
+    ]
+
+
 def test_urlstore_compression():
     "Test that compression reduces the in-memory footprint."
     example_domain, example_urls, test_urls = _example_dataset()
@@ -473,6 +522,14 @@ def test_from_html(robots_rules):
     url_store.add_from_html(htmlstring, base_url)
     assert not url_store.find_known_urls(base_url)
 
+    # raw documents
+    url_store = UrlStore()
+    htmlstring = '<html><body><a href="/d\xe9j\xe0-vu"/></body></html>'
+    url_store.add_from_html(htmlstring.encode("cp1252"), base_url, encoding="cp1252")
+    assert url_store.find_known_urls(base_url) == [
+        "https://example.org/d%C3%A9j%C3%A0-vu"
+    ]
+
 
 def test_persistance(tmp_path):
     "Test writing and loading to/from disk."
@@ -594,3 +651,420 @@ def test_urlstore_store_non_http_domain():
     store = UrlStore()
     store._store_urls("ftp://example.org")
     assert "ftp://example.org" in store.urldict
+
+
+def test_urlstore_site_index(tmp_path):
+    "The registered-domain index groups hosts by site and follows store changes."
+    store = UrlStore()
+    store.add_urls(
+        [
+            "https://blog.example.com/1",
+            "https://www.example.com/2",
+            "http://shop.example.com/3",
+            "https://shop.example.com/4",
+            "https://example.com/5",
+            "https://other.org/1",
+        ]
+    )
+    assert sorted(store.get_known_sites()) == ["example.com", "other.org"]
+    # ports are stripped for names and IP addresses alike
+    assert get_site("https://example.com:8080") == "example.com"
+    assert get_site("https://1.2.3.4:8080") == get_site("https://1.2.3.4") == "1.2.3.4"
+    assert get_site("http://[::1]:8080") == get_site("http://[::1]") == "[::1]"
+    assert get_site("https://localhost:8080") == "localhost"
+    # the http/https switch keeps a single entry per host
+    assert sorted(store.get_site_hosts("example.com")) == [
+        "https://blog.example.com",
+        "https://example.com",
+        "https://shop.example.com",
+        "https://www.example.com",
+    ]
+    assert store.get_site_hosts("https://www.example.com/page") == store.get_site_hosts(
+        "example.com"
+    )
+    assert not store.get_site_hosts("unknown.net")
+    assert store.site_url_number("example.com") == 5
+    assert store.site_url_number("unknown.net") == 0
+
+    # counts and scheduling
+    assert store.get_url("https://blog.example.com") == "https://blog.example.com/1"
+    assert store.site_download_count("example.com") == 1
+    assert store.is_exhausted_site("example.com") is False
+    for host in store.get_site_hosts("example.com"):
+        while store.get_url(host) is not None:
+            pass
+    assert store.is_exhausted_site("example.com") is True
+    assert store.site_download_count("example.com") == 5
+
+    # persistence: the index survives pickling and is rebuilt for older stores
+    path = str(tmp_path / "store.pickle")
+    store.write(path)
+    assert load_store(path).site_index == store.site_index
+    state = store.__getstate__()
+    del state["site_index"]
+    legacy = UrlStore.__new__(UrlStore)
+    legacy.__setstate__(state)
+    assert legacy.site_index == store.site_index
+
+    # discards
+    store.discard_site("example.com")
+    assert store.site_url_number("example.com") == 0
+    assert store.total_url_number() == 1
+    store.store_rules("https://new.other.org", None)
+    assert "https://new.other.org" in store.get_site_hosts("other.org")
+    store.reset()
+    assert not store.get_known_sites()
+
+
+def test_urlstore_journal(tmp_path, robots_rules):
+    "Operations are journaled and replayed on top of the snapshot by load_store."
+    path = str(tmp_path / "store.bin")
+    store = UrlStore(compressed=True)
+    store.add_urls(["https://example.org/0"])
+    store.start_journal(path, compact_every=1000)
+
+    store.add_urls(
+        ["https://example.org/1", "https://test.org/1"],
+        appendleft=["https://example.org/first"],
+    )
+    store.add_urls(["https://visited.org/1"], visited=True)
+    assert store.get_url("https://example.org") == "https://example.org/first"
+    store.establish_download_schedule(max_urls=2, time_limit=1)
+    assert store.get_url("https://unknown.org") is None
+    store.store_rules("https://example.org", robots_rules)
+    store.discard(["https://test.org"])
+
+    # simulated crash: no close, no compaction
+    recovered = load_store(path)
+    assert recovered.dump_urls() == store.dump_urls()
+    assert recovered.done == store.done
+    assert recovered.urldict.keys() == store.urldict.keys()
+    for host in store.urldict:
+        for attr in ("count", "state", "timestamp", "total"):
+            assert getattr(recovered.urldict[host], attr) == getattr(
+                store.urldict[host], attr
+            )
+    assert recovered.find_unvisited_urls(
+        "https://example.org"
+    ) == store.find_unvisited_urls("https://example.org")
+    assert recovered.get_rules("https://example.org").mtime() == robots_rules.mtime()
+
+    # compaction replaces the journal with a checkpoint of the store
+    store.compact_journal()
+    assert not os.path.exists(path + ".journal.compacting")
+    assert urlstore._open_store(path).dump_urls() == store.dump_urls()
+    store.add_urls(["https://example.org/after"])
+    store.reset()
+    store.add_urls(["https://new.org/1"])
+    store.close_journal()
+    assert load_store(path).dump_urls() == ["https://new.org/1"]
+
+    # a truncated tail is ignored
+    with open(path + ".journal", "ab") as journal:
+        journal.write(pickle.dumps(("add", "https://new.org", [], False))[:-3])
+    assert load_store(path).dump_urls() == ["https://new.org/1"]
+
+
+def test_urlstore_journal_schedule(tmp_path):
+    "Schedule updates which only move a timestamp are journaled too."
+    path = str(tmp_path / "store.bin")
+    store = UrlStore()
+    store.add_urls(["https://example.org/1", "https://test.org/1"])
+    store.start_journal(path)
+    assert len(store.establish_download_schedule(max_urls=1, time_limit=1)) == 1
+    recovered = load_store(path)
+    for host in store.urldict:
+        assert recovered.urldict[host].timestamp == store.urldict[host].timestamp
+    store.close_journal()
+
+
+def test_urlstore_journal_auto_compaction(tmp_path):
+    "Compaction is triggered by the number of records and runs in the background."
+    path = str(tmp_path / "store.bin")
+    store = UrlStore()
+    store.start_journal(path, compact_every=3)
+    for i in range(10):
+        store.add_urls([f"https://example.org/{i}"])
+    store.close_journal()
+    # at least the first segment has been replaced by a checkpoint
+    assert urlstore._open_store(path).total_url_number() >= 3
+    assert load_store(path).total_url_number() == 10
+
+
+def test_urlstore_journal_failed_compaction(tmp_path, monkeypatch, caplog):
+    "The segment of a failed compaction is kept and extended, not overwritten."
+    path = str(tmp_path / "store.bin")
+    store = UrlStore()
+    store.start_journal(path, compact_every=1000)
+    store.add_urls(["https://example.org/1"])
+
+    def failing_write(*args):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(urlstore, "_write_hosts", failing_write)
+    store.compact_journal()
+    assert "disk full" in caplog.text
+    assert os.path.exists(path + ".journal.compacting")
+    store.add_urls(["https://example.org/2"])
+    store.compact_journal()
+    assert load_store(path).total_url_number() == 2
+
+    monkeypatch.undo()
+    store.add_urls(["https://example.org/3"])
+    store.compact_journal()
+    assert not os.path.exists(path + ".journal.compacting")
+    assert urlstore._open_store(path).total_url_number() == 3
+    store.close_journal()
+    assert load_store(path).total_url_number() == 3
+
+
+@pytest.mark.parametrize("compressed", [False, True])
+def test_binary_store(tmp_path, robots_rules, compressed):
+    "Stores written in binary format are loaded lazily, host by host."
+    store = UrlStore(compressed=compressed, language="en", strict=True)
+    store.add_urls([f"https://example.org/{i}" for i in range(100)])
+    store.add_urls(["https://test.org/1", "https://www.test.org/2"])
+    store.get_url("https://example.org")
+    store.store_rules("https://example.org", robots_rules)
+    store.discard(["https://test.org"])
+
+    path = str(tmp_path / "store.bin")
+    store.write(path, binary=True)
+    new_store = load_store(path)
+    assert new_store.compressed is compressed and new_store.language == "en"
+    assert new_store.site_index == store.site_index
+    # summary information is available without reading the payloads
+    entry = new_store.urldict["https://example.org"]
+    assert isinstance(entry.tuples, StoredBlob) and isinstance(entry.rules, StoredBlob)
+    assert new_store.total_url_number() == store.total_url_number() == 101
+    assert new_store.get_unvisited_domains() == store.get_unvisited_domains()
+    assert (
+        entry.count == 1 and new_store.urldict["https://test.org"].state is State.BUSTED
+    )
+    # first access
+    assert new_store.find_unvisited_urls("https://example.org")[0].endswith("/1")
+    assert not isinstance(entry.tuples, StoredBlob)
+    assert new_store.get_rules("https://example.org").mtime() == robots_rules.mtime()
+    assert new_store.dump_urls() == store.dump_urls()
+    # the store keeps working and can be written again, also to the same file
+    assert new_store.get_url("https://www.test.org") == "https://www.test.org/2"
+    new_store.write(path, binary=True)
+    assert load_store(path).dump_urls() == new_store.dump_urls()
+    # pickling resolves the payloads which have not been read yet
+    lazy_store = load_store(path)
+    assert pickle.loads(pickle.dumps(lazy_store)).dump_urls() == store.dump_urls()
+
+
+def test_binary_store_conversion(tmp_path):
+    "Pickled stores can be converted and unknown formats are rejected."
+    store = UrlStore(compressed=True)
+    store.add_urls(["https://example.org/1", "https://example.org/2"])
+    pickled, binary = str(tmp_path / "store.pickle"), str(tmp_path / "store.bin")
+    store.write(pickled)
+    assert convert_store(pickled, binary) == os.path.getsize(binary)
+    assert load_store(binary).dump_urls() == store.dump_urls()
+
+    with open(binary, "r+b") as output:
+        output.write(HEADER.pack(STORE_MAGIC, 99, 0))
+    with pytest.raises(ValueError):
+        StoreFile(binary)
+    with pytest.raises(ValueError):
+        StoreFile(pickled)
+
+
+@pytest.mark.parametrize("compressed", [False, True])
+def test_urlstore_checkpoint(tmp_path, compressed):
+    "Checkpoints are written in the background and only copy changed hosts."
+    store = UrlStore(compressed=compressed)
+    store.add_urls([f"https://example.org/{i}" for i in range(1000)])
+    store.add_urls(["https://test.org/1", "https://test.org/2"])
+    path = str(tmp_path / "checkpoint.bin")
+
+    checkpoint = store.checkpoint(path)
+    # the store stays usable while the checkpoint is being written
+    assert store.get_url("https://test.org") == "https://test.org/1"
+    checkpoint.wait()
+    assert checkpoint.done and checkpoint.error is None
+    assert checkpoint.hosts == 2 and checkpoint.size == os.path.getsize(path)
+    assert checkpoint.duration >= checkpoint.pause >= 0
+    # consistent copy: the visit happened after the snapshot
+    first = load_store(path)
+    assert first.urldict["https://test.org"].count == 0
+    assert len(first.find_unvisited_urls("https://test.org")) == 2
+
+    # hosts left unchanged keep their compressed form only until used again
+    assert store._dirty == {"https://test.org"}
+    assert isinstance(store.urldict["https://example.org"].tuples, bytes)
+    assert isinstance(store.urldict["https://test.org"].tuples, bytes) is compressed
+    assert len(store.find_known_urls("https://example.org")) == 1000
+    assert isinstance(store.urldict["https://example.org"].tuples, bytes) is compressed
+    assert store.checkpoint(path, wait=True).hosts == 2
+    assert isinstance(store.urldict["https://test.org"].tuples, bytes)
+    assert store.get_url("https://example.org") == "https://example.org/0"
+    store.add_urls(["https://other.org/1"])
+    store.discard(["https://example.org"])
+    store.add_urls(["https://example.org/new"])
+    second = store.checkpoint(path, wait=True)
+    assert second.hosts == 3
+    new_store = load_store(path)
+    assert new_store.dump_urls() == store.dump_urls()
+    assert new_store.urldict["https://test.org"].count == 1
+    assert new_store.urldict["https://example.org"].state is State.BUSTED
+    assert store.checkpoint(path, wait=True).hosts == 3
+
+
+def _shards(robots_rules):
+    "Build two overlapping stores as produced by crawler shards."
+    first = UrlStore()
+    first.add_urls(["https://example.org/1", "https://example.org/2"])
+    first.add_urls(["https://busted.org/1", "http://switch.org/1"])
+    first.get_url("https://example.org")
+    second = UrlStore(compressed=True)
+    second.add_urls(["https://example.org/2", "https://example.org/3"])
+    second.add_urls(["https://switch.org/2", "https://other.org/1"])
+    second.get_url("https://example.org")
+    second.get_url("https://example.org")
+    second.store_rules("https://example.org", robots_rules)
+    second.discard(["https://busted.org"])
+    return first, second
+
+
+def _check_merged(store):
+    "Check the result of merging the two shards."
+    assert sorted(store.dump_urls()) == [
+        "https://example.org/1",
+        "https://example.org/2",
+        "https://example.org/3",
+        "https://other.org/1",
+        "https://switch.org/1",
+        "https://switch.org/2",
+    ]
+    entry = store.urldict["https://example.org"]
+    assert entry.count == 3 and entry.total == 3
+    # visited in one shard or the other
+    assert store.find_unvisited_urls("https://example.org") == []
+    assert entry.state is State.ALL_VISITED and entry.timestamp is not None
+    assert store.get_rules("https://example.org") is not None
+    assert store.urldict["https://busted.org"].state is State.BUSTED
+    assert "http://switch.org" not in store.urldict
+    assert store.get_site_hosts("switch.org") == ["https://switch.org"]
+
+
+def test_urlstore_merge(tmp_path, robots_rules):
+    "Stores are merged at host level, with or without loading them in memory."
+    first, second = _shards(robots_rules)
+    timestamp = second.urldict["https://example.org"].timestamp
+    first.merge(second)
+    _check_merged(first)
+    assert first.urldict["https://example.org"].timestamp == timestamp
+    # idempotent as far as URLs are concerned
+    first.merge(second)
+    assert first.total_url_number() == 6
+
+    first, second = _shards(robots_rules)
+    paths = [str(tmp_path / "first.bin"), str(tmp_path / "second.pickle")]
+    first.write(paths[0], binary=True)
+    second.write(paths[1])
+    merged = UrlStore()
+    merged.merge_files(paths)
+    _check_merged(merged)
+
+    # streaming variant on binary files
+    convert_store(paths[1], paths[1])
+    destination = str(tmp_path / "merged.bin")
+    assert merge_store_files(paths, destination) == os.path.getsize(destination)
+    merged = load_store(destination)
+    _check_merged(merged)
+    assert merged.done is False
+    assert merged.get_unvisited_domains() == ["https://switch.org", "https://other.org"]
+
+
+def test_urlstore_merge_journal(tmp_path):
+    "Merges are journaled with absolute values."
+    path = str(tmp_path / "store.pickle")
+    store = UrlStore()
+    store.add_urls(["https://example.org/1"])
+    store.start_journal(path)
+    other = UrlStore()
+    other.add_urls(["https://example.org/1", "https://example.org/2"])
+    other.get_url("https://example.org")
+    store.merge(other)
+    store.close_journal()
+    recovered = load_store(path)
+    assert recovered.dump_urls() == store.dump_urls()
+    assert recovered.urldict["https://example.org"].count == 1
+    assert recovered.find_unvisited_urls("https://example.org") == [
+        "https://example.org/2"
+    ]
+
+    # busted hosts are discarded at once
+    other = UrlStore()
+    hosts = [f"https://busted{i}.org" for i in range(5)]
+    other.discard(hosts)
+    store = UrlStore()
+    store.add_urls(["https://busted0.org/1", "https://kept.org/1"])
+    store.start_journal(path)
+    with patch.object(
+        UrlStore, "discard", autospec=True, side_effect=UrlStore.discard
+    ) as discard:
+        store.merge(other)
+    discard.assert_called_once_with(store, hosts)
+    assert all(store.urldict[host].state is State.BUSTED for host in hosts)
+    assert store.total_url_number() == 1
+    store.close_journal()
+    assert load_store(path).total_url_number() == 1
+
+
+@pytest.mark.parametrize("compression", [None, "gz", "bz2", "xz"])
+def test_urlstore_import_file(tmp_path, compression):
+    "URL lists are streamed into the store, compressed or not."
+    import bz2
+    import gzip
+    import io
+    import lzma
+
+    lines = [f"https://example.org/{i}" for i in range(50)]
+    lines += ["", "invalid", "https://www.example.net/a", "https://example.org/1"]
+    data = "\n".join(lines).encode("utf-8")
+    openers = {"gz": gzip.open, "bz2": bz2.open, "xz": lzma.open}
+    path = str(tmp_path / "urls.txt")
+    if compression:
+        with openers[compression](path, "wb") as outputfh:
+            outputfh.write(data)
+    else:
+        with open(path, "wb") as outputfh:
+            outputfh.write(data)
+
+    store = UrlStore()
+    stats = store.import_file(path, batch_size=7)
+    assert stats["lines"] == len(lines) and stats["urls"] == 51
+    assert stats["seconds"] > 0 and stats["urls_per_second"] > 0
+    assert store.total_url_number() == 51
+    # only new URLs are counted
+    stats = store.import_file(path, batch_size=7)
+    assert stats["lines"] == len(lines) and stats["urls"] == 0
+    assert stats["urls_per_second"] == 0
+    assert store.get_known_domains() == [
+        "https://example.org",
+        "https://www.example.net",
+    ]
+
+    # sorted input: one write per host, file objects are left open
+    store = UrlStore(compressed=True)
+    with open(path, "rb") as inputfh:
+        stats = store.import_file(inputfh, presorted=True, visited=True, batch_size=7)
+        assert not inputfh.closed
+    assert stats["hosts"] == 2 and store.total_url_number() == 51
+    assert store.find_unvisited_urls("https://example.org") == []
+    assert UrlStore().import_file(io.StringIO("https://example.org\n"))["urls"] == 1
+
+    # streams without peek() are left open as well
+    with open(path, "rb") as inputfh:
+        content = inputfh.read()
+    with open(path, "rb", buffering=0) as unbuffered:
+        for stream in (io.BytesIO(content), unbuffered):
+            assert UrlStore().import_file(stream)["urls"] == 51
+            gc.collect()
+            assert not stream.closed
+            stream.seek(0)
+            assert stream.read() == content